@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Parse a large ascii table in chunks in a pool of processes.
+
+The lines of the diag, data and field tables are independent once the lines that set the state of the
+table (i.e the title and the base_date) have been read, so a large table can be split in chunks of
+consecutive lines that are parsed in parallel. The results come back in the order of the lines. Each chunk
+stops at its first error and returns it instead of raising it, so the error is raised after everything that
+comes before it has been handled, as in the serial parse:
+
+    def parse_chunk(chunk, start, *args):
+        results = []
+        try:
+            for line in chunk:
+                results.append(parse(line))
+        except Exception as err:
+            return results, err
+        return results, None
+
+    for result in map_chunks(parse_chunk, lines, get_jobs(jobs, len(lines))):
+        ...
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+
+#: Tables with fewer lines than this per process are parsed serially, starting the pool would cost more
+MIN_CHUNK_LINES = 5000
+#: Number of chunks per process, so the first results are ready early and the processes stay busy
+CHUNKS_PER_JOB = 4
+
+
+def get_jobs(jobs, nlines):
+    """ Return the number of processes used to parse a table
+
+    Args:
+        jobs (int): The number of processes requested, None for the number of cpus
+        nlines (int): The number of lines to parse
+    """
+    if jobs is None:
+        jobs = cpu_count() or 1
+    return max(1, min(jobs, nlines // MIN_CHUNK_LINES))
+
+
+def split_chunks(lines, nchunks):
+    """ Split the lines in up to nchunks lists of consecutive lines and yield each one with the index of
+        its first line """
+    size = max(1, -(-len(lines) // nchunks))
+    for start in range(0, len(lines), size):
+        yield lines[start:start + size], start
+
+
+def map_chunks(parse_chunk, lines, jobs, *args):
+    """ Parse the lines in chunks in a pool of processes
+
+    Args:
+        parse_chunk: A module level function called as parse_chunk(chunk, start, *args), where chunk is a
+                     list of consecutive lines and start is the index of its first line. It returns the list
+                     of results of the chunk and the error that stopped it, or None
+        lines (list): The lines to parse
+        jobs (int): The number of processes
+        args: Other arguments of parse_chunk
+
+    Yields:
+        The results of the chunks in the order of the lines. The error of a chunk is raised after its results
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(parse_chunk, chunk, start, *args)
+                   for chunk, start in split_chunks(lines, jobs * CHUNKS_PER_JOB)]
+        try:
+            for future in futures:
+                results, err = future.result()
+                yield from results
+                if err is not None:
+                    raise err
+        finally:
+            #: Do not wait for the chunks after an error
+            for future in futures:
+                future.cancel()
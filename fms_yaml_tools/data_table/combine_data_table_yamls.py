@@ -24,6 +24,10 @@ import errno
 import click
 import yaml
 from .. import __version__
+from ..fingerprint import Fingerprints
+from ..incremental import Manifest
+from ..load_yamls import iter_yaml_loaders
+from ..logger import get_verboseprint, LazyYaml
 
 
 @click.command()
@@ -34,27 +38,60 @@ from .. import __version__
               help="Path to the output data table yaml")
 @click.option('--force-write/--no-force-write', type=click.BOOL, show_default=True, default=False,
               help="Overwrite the output yaml file if it already exists")
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to parse the input yamls, they are still combined in order")
+@click.option('--incremental/--no-incremental', type=click.BOOL, show_default=True, default=False,
+              help="Keep a manifest of the inputs next to the output yaml (<output-yaml>.manifest), so the next \
+                    combine reuses the output if no input changed and only parses the inputs that changed")
 @click.version_option(__version__, "--version")
-def combine_data_table_yaml(in_files, debug, output_yaml, force_write):
+def combine_data_table_yaml(in_files, debug, output_yaml, force_write, jobs, incremental):
     """ Combines a series of data_table.yaml files into one file \n
         in-files - Space seperated list with the names of the data_table.yaml files to combine \n
     """
 
-    verboseprint = print if debug else lambda *a, **k: None
+    verboseprint = get_verboseprint(debug)
     try:
-        data_table = combine_yaml(in_files, verboseprint)
+        manifest = None
+        if incremental:
+            manifest = Manifest(output_yaml, "data_table", in_files)
+            if manifest.is_up_to_date():
+                verboseprint("The input yamls did not change, reusing the output yaml: " + output_yaml)
+                return
+        data_table = combine_yaml(in_files, verboseprint, jobs, manifest)
         out_file_op = "x"  # Exclusive write
-        if force_write:
+        if force_write or (manifest is not None and manifest.owns_output()):
             out_file_op = "w"
         verboseprint("Writing the output yaml: " + output_yaml)
         with open(output_yaml, out_file_op) as myfile:
             yaml.dump(data_table, myfile, default_flow_style=False, sort_keys=False)
+        if manifest is not None:
+            manifest.write()
 
     except Exception as err:
         raise SystemExit(err)
 
 
-def is_duplicate(data_table, new_entry):
+class DataTableIndex:
+    """ The first entry of each fieldname_in_model in the combined data_table, and the fingerprints used to
+    compare the entries with them
+    """
+
+    def __init__(self, data_table=()):
+        """
+        Args:
+            data_table: List of the data_table entries that have been combined
+        """
+        self.fingerprints = Fingerprints()
+        self.entries = {}
+        for entry in data_table:
+            self.add(entry)
+
+    def add(self, entry):
+        """ Add an entry that was appended to the data_table """
+        self.entries.setdefault(entry['fieldname_in_model'], entry)
+
+
+def is_duplicate(data_table, new_entry, index=None):
     """
     Check if a data_table entry was already defined in a different file
 
@@ -62,31 +99,39 @@ def is_duplicate(data_table, new_entry):
         data_table: List of dictionaries containing all of the data_table
                     entries that have been combined
         new_entry: Dictionary of the data_table entry to check
+        index: DataTableIndex of data_table. If None, it is built for this
+               check only, callers that check many entries should keep one
     """
+    if index is None:
+        index = DataTableIndex(data_table)
 
-    for entry in data_table:
-        if entry == new_entry:
-            is_duplicate = True
-            return is_duplicate
-        else:
-            if entry['fieldname_in_model'] == new_entry['fieldname_in_model']:
-                raise Exception("A data_table entry is defined twice for the "
-                                "fieldname_in_model:" + entry['fieldname_in_model'] +
-                                " with different keys/values!")
-    is_duplicate = False
-    return is_duplicate
+    # Only an entry with the same fieldname_in_model can be the same entry
+    entry = index.entries.get(new_entry['fieldname_in_model'])
+    if entry is None:
+        return False
+    if index.fingerprints.same(entry, new_entry):
+        return True
+    raise Exception("A data_table entry is defined twice for the "
+                    "fieldname_in_model:" + entry['fieldname_in_model'] +
+                    " with different keys/values!")
 
 
-def combine_yaml(files, verboseprint):
+def combine_yaml(files, verboseprint, jobs=1, manifest=None):
     """
     Combines a list of yaml files into one
 
     Args:
         files: List of yaml file names to combine
+        jobs: Number of processes used to parse the yaml files, None for
+              the number of cpus
+        manifest: The manifest of an incremental combine, the yaml files that
+                  did not change since the last combine are not parsed again
     """
     data_table = {}
     data_table['data_table'] = []
-    for f in files:
+    index = DataTableIndex()
+    loaders = iter_yaml_loaders(files, jobs) if manifest is None else manifest.iter_yaml_loaders(jobs)
+    for f, load in loaders:
         # Check if the file exists
         verboseprint("Opening on the data_table yaml:" + f)
         if not path.exists(f):
@@ -94,20 +139,21 @@ def combine_yaml(files, verboseprint):
                                     strerror(errno.ENOENT),
                                     f)
 
-        with open(f) as fl:
-            verboseprint("Parsing the data_table yaml:" + f)
-            try:
-                my_table = yaml.safe_load(fl)
-            except yaml.YAMLError as err:
-                print("---> Error when parsing the file " + f)
-                raise err
-            entries = my_table['data_table']
-            for entry in entries:
-                verboseprint("---> Working on the entry: \n" + yaml.dump(entry))
-                verboseprint("Checking if it is a duplicate:")
-                if not is_duplicate(data_table['data_table'], entry):
-                    verboseprint("It is not a duplicate so adding it")
-                    data_table['data_table'].append(entry)
+        verboseprint("Parsing the data_table yaml:" + f)
+        try:
+            my_table = load()
+        except yaml.YAMLError as err:
+            print("---> Error when parsing the file " + f)
+            raise err
+        entries = my_table['data_table']
+        for entry in entries:
+            verboseprint("---> Working on the entry: ")
+            verboseprint(LazyYaml(entry))
+            verboseprint("Checking if it is a duplicate:")
+            if not is_duplicate(data_table['data_table'], entry, index):
+                verboseprint("It is not a duplicate so adding it")
+                data_table['data_table'].append(entry)
+                index.add(entry)
     return data_table
 
 
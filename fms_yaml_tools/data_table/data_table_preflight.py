@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Check that the files of a data_table exist and have the variables that data_override reads from them.
+
+For each override_file, the file_name (and the prev_file_name and next_file_name of a multi_file) must be
+a NetCDF file that has the fieldname_in_file as a variable. Only the headers of the files are read, each
+file once, in a pool of threads, so checking hundreds of files takes seconds instead of a queue wait and a
+crash of the model during its initialization.
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import click
+from .. import __version__
+from .data_table_report import MULTI_FILE_KEYS, load_data_table
+from .netcdf_header import NetCDFHeaderError, get_header
+
+#: The default number of threads used to read the headers
+DEFAULT_JOBS = 16
+
+
+@click.command()
+@click.version_option(__version__, "--version")
+@click.option('--base-dir', type=click.Path(file_okay=False), default=".", show_default=True,
+              help="Directory the file_names of the data_table are relative to, the directory the model runs in")
+@click.option('--jobs', type=click.IntRange(min=1), default=DEFAULT_JOBS, show_default=True,
+              help="Number of threads used to read the headers of the files")
+@click.option('--success/--no-show-success', type=click.BOOL, show_default=True, default=False,
+              help="Print success message")
+@click.argument("data-table")
+def data_table_preflight(data_table, base_dir, jobs, success):
+    """ Checks that the files of a data_table exist and have the variables that data_override reads. \n
+        data-table - Path to the data_table.yaml, or to a legacy ascii data_table \n
+    """
+    try:
+        problems, notes = check_override_files(load_data_table(data_table), base_dir, jobs)
+    except Exception as err:
+        raise SystemExit(err)
+    for note in notes:
+        print("NOTE: " + note)
+    if problems:
+        print("The following errors have occurred:\n")
+        for iproblem, problem in enumerate(problems, start=1):
+            print("(" + str(iproblem) + ") " + problem)
+        sys.exit("ERROR " + data_table + " uses files or variables that do not exist")
+    if success:
+        print("All the files and variables used by " + data_table + " exist")
+
+
+def iter_override_files(data_table):
+    """ Yield the (fieldname_in_model, file_name, fieldname_in_file) of every file opened by data_override
+
+    Args:
+        data_table (dict): The data_table as in the data_table.yaml
+    """
+    for entry in data_table.get('data_table') or []:
+        for override_file in entry.get('override_file') or []:
+            file_names = [override_file['file_name']]
+            for multi_file in override_file.get('multi_file') or []:
+                file_names.extend(multi_file[key] for key in MULTI_FILE_KEYS)
+            for file_name in file_names:
+                yield entry['fieldname_in_model'], file_name, override_file['fieldname_in_file']
+
+
+def read_headers(paths, jobs=DEFAULT_JOBS):
+    """ Read the headers of the files in a pool of threads
+
+    Args:
+        paths (list): The paths of the files
+        jobs (int): Number of threads
+
+    Returns:
+        dict: The NetCDFHeader of each path, or the error (OSError or NetCDFHeaderError) it raised
+    """
+    def read(path):
+        try:
+            return get_header(path)
+        except (OSError, NetCDFHeaderError) as err:
+            return err
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(paths, executor.map(read, paths)))
+
+
+def check_override_files(data_table, base_dir=".", jobs=DEFAULT_JOBS):
+    """ Check the files and variables used by the entries of a data_table
+
+    Args:
+        data_table (dict): The data_table as in the data_table.yaml
+        base_dir (str): Directory the file_names are relative to
+        jobs (int): Number of threads used to read the headers
+
+    Returns:
+        tuple: The list of problems and the list of notes about the files that could not be checked
+    """
+    checks = list(iter_override_files(data_table))
+    paths = list(dict.fromkeys(os.path.join(base_dir, file_name) for _, file_name, _ in checks))
+    headers = read_headers(paths, jobs)
+
+    problems = []
+    notes = []
+    reported = set()
+    for fieldname_in_model, file_name, fieldname_in_file in checks:
+        header = headers[os.path.join(base_dir, file_name)]
+        if isinstance(header, FileNotFoundError):
+            problem = file_name + " does not exist"
+        elif isinstance(header, (OSError, NetCDFHeaderError)):
+            problem = file_name + " can not be read: " + str(header)
+        elif header.variables is None:
+            if file_name not in reported:
+                notes.append(file_name + " is a " + header.format + " file, its variables were not checked")
+                reported.add(file_name)
+            continue
+        elif fieldname_in_file not in header.variables:
+            problem = fieldname_in_file + " is not a variable in " + file_name
+        else:
+            continue
+        problems.append(fieldname_in_model + ": " + problem)
+    return problems, notes
+
+
+if __name__ == '__main__':
+    data_table_preflight(prog_name="data_table_preflight")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Report the files that data_override opens for a data_table and what is read from each one.
+
+The files are aggregated by file name, in the order they are first used. The prev_file_name and
+next_file_name of the multi_file entries are opened as well, so they are counted as files of their own.
+For each file, the report lists the fields read from it on each grid, the interp_methods and the number
+of fields that use a subregion. Entries without an override_file only use their factor and open nothing.
+"""
+
+import click
+import yaml
+from .. import __version__
+from .data_table_to_yaml import data_table_to_dict
+
+#: The keys of a multi_file entry, with the other files that are opened for the field
+MULTI_FILE_KEYS = ('prev_file_name', 'next_file_name')
+
+
+@click.command()
+@click.version_option(__version__, "--version")
+@click.argument("data-table")
+def data_table_report(data_table):
+    """ Reports the files that data_override opens for a data_table and what is read from each one. \n
+        data-table - Path to the data_table.yaml, or to a legacy ascii data_table \n
+    """
+    try:
+        for line in format_report(get_file_stats(load_data_table(data_table))):
+            print(line)
+    except Exception as err:
+        raise SystemExit(err)
+
+
+def load_data_table(data_table):
+    """ Read a data_table.yaml, or convert a legacy ascii data_table if the file does not end in .yaml/.yml
+
+    Returns:
+        dict: The data_table as in the data_table.yaml
+    """
+    if data_table.endswith((".yaml", ".yml")):
+        with open(data_table) as fh:
+            return yaml.safe_load(fh)
+    return data_table_to_dict(data_table)
+
+
+def get_file_stats(data_table):
+    """ Aggregate the entries of a data_table by the files they open
+
+    Args:
+        data_table (dict): The data_table as in the data_table.yaml
+
+    Returns:
+        tuple: The number of entries, the number of entries without a file, and a dictionary with the
+               stats of each file (in the order they are first used) with:
+               - "grids": the fieldname_in_model read on each grid_name
+               - "interp_methods": the number of fields that use each interp_method
+               - "subregions": the number of fields that use each type of subregion
+               - "multi_file": the number of fields that open the file as their prev_file_name or
+                 next_file_name
+    """
+    entries = data_table.get('data_table') or []
+    nconstant = 0
+    files = {}
+
+    def get_file(file_name):
+        return files.setdefault(file_name, {'grids': {}, 'interp_methods': {}, 'subregions': {},
+                                            'multi_file': {key: 0 for key in MULTI_FILE_KEYS}})
+
+    for entry in entries:
+        override_files = entry.get('override_file') or []
+        if not override_files:
+            nconstant += 1
+            continue
+        for override_file in override_files:
+            file_stats = get_file(override_file['file_name'])
+            file_stats['grids'].setdefault(entry['grid_name'], []).append(entry['fieldname_in_model'])
+            add_count(file_stats['interp_methods'], override_file.get('interp_method', 'none'))
+            for subregion in entry.get('subregion') or []:
+                add_count(file_stats['subregions'], subregion.get('type', 'none'))
+            for multi_file in override_file.get('multi_file') or []:
+                for key in MULTI_FILE_KEYS:
+                    get_file(multi_file[key])['multi_file'][key] += 1
+    return len(entries), nconstant, files
+
+
+def format_report(file_stats):
+    """ Yield the lines of the report
+
+    Args:
+        file_stats (tuple): The output of get_file_stats
+    """
+    nentries, nconstant, files = file_stats
+    yield ("data_table entries: " + str(nentries) + " (" + str(nconstant) + " without a file)")
+    yield "files opened: " + str(len(files))
+
+    interp_methods, subregions = {}, {}
+    for stats in files.values():
+        for interp_method, count in stats['interp_methods'].items():
+            add_count(interp_methods, interp_method, count)
+        for subregion_type, count in stats['subregions'].items():
+            add_count(subregions, subregion_type, count)
+    if interp_methods:
+        yield "interp_methods: " + format_counts(interp_methods)
+    if subregions:
+        yield "subregions: " + format_counts(subregions)
+
+    for file_name, stats in files.items():
+        nfields = sum(len(fields) for fields in stats['grids'].values())
+        yield ""
+        yield file_name + ": " + str(nfields) + " fields"
+        for grid_name, fields in stats['grids'].items():
+            yield "  " + grid_name + ": " + ", ".join(fields)
+        if stats['interp_methods']:
+            yield "  interp_methods: " + format_counts(stats['interp_methods'])
+        if stats['subregions']:
+            yield "  subregions: " + format_counts(stats['subregions'])
+        for key, count in stats['multi_file'].items():
+            if count:
+                yield "  " + key + " of " + str(count) + " fields"
+
+
+def add_count(counts, key, count=1):
+    """ Add count to counts[key] """
+    counts[key] = counts.get(key, 0) + count
+
+
+def format_counts(counts):
+    """ Return a dictionary of counts as "key: count, key: count" """
+    return ", ".join(key + ": " + str(count) for key, count in counts.items())
+
+
+if __name__ == '__main__':
+    data_table_report(prog_name="data_table_report")
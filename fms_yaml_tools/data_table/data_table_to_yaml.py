@@ -19,11 +19,17 @@
 # * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
 # ***********************************************************************
 
-from os import path, strerror
+import csv
+from operator import methodcaller
+from os import path, remove, strerror
+import sys
 import errno
 import yaml
 import click
 from .. import __version__, TableParseError
+from ..chunks import get_jobs, map_chunks
+from ..logger import get_verboseprint, LazyYaml
+from .subregion_index import SubregionIndex, check_subregions, warn_subregions
 
 
 @click.command()
@@ -34,17 +40,30 @@ from .. import __version__, TableParseError
               help="Path to the output data yable yaml")
 @click.option('--force-write/--no-force-write', type=click.BOOL, show_default=True, default=False,
               help="Overwrite the output yaml file if it already exists")
+@click.option('--stream/--no-stream', type=click.BOOL, show_default=True, default=False,
+              help="Write each entry as soon as its line is parsed instead of keeping the whole table in \
+                    memory. With --stream, --output-yaml - writes the yaml to stdout")
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to parse the lines of a large data_table in chunks \
+                    (not with --stream)")
+@click.option('--check-subregions/--no-check-subregions', type=click.BOOL, show_default=True, default=True,
+              help="Warn about the subregions of the same fieldname_in_model and grid_name that overlap or \
+                    leave gaps, see subregion_index.py")
 @click.version_option(__version__, "--version")
 @click.argument("data-table-name")  # This is the path to the data_table to convert
-def data_to_yaml(data_table_name, debug, output_yaml, force_write):
+def data_to_yaml(data_table_name, debug, output_yaml, force_write, stream, jobs, check_subregions):
     """ Converts a legacy ascii data_table to a yaml. \n
         data-table-name - data to the field table to convert \n
     """
     try:
         test_class = DataType(data_table_file=data_table_name,
                               yaml_table_file=output_yaml,
-                              force_write=force_write, debug=debug)
-        test_class.convert_data_table()
+                              force_write=force_write, debug=debug, jobs=jobs,
+                              check_subregions=check_subregions)
+        if stream:
+            test_class.stream_data_table()
+        else:
+            test_class.convert_data_table()
     except Exception as err:
         raise SystemExit(err)
 
@@ -52,39 +71,20 @@ def data_to_yaml(data_table_name, debug, output_yaml, force_write):
 class DataType:
     def __init__(self, data_table_file='data_table',
                  yaml_table_file='data_table.yaml',
-                 force_write=False, debug=False):
+                 force_write=False, debug=False, jobs=1, check_subregions=False):
         """Initialize the DataType"""
         self.data_table_file = data_table_file
         self.yaml_table_file = yaml_table_file
-        self.verboseprint = print if debug else lambda *a, **k: None
+        self.debug = debug
+        self.jobs = jobs  #: Number of processes used to parse the table, None for the number of cpus
+        #: Warn about the overlaps and gaps of the subregions when the table is converted
+        self.check_subregions = check_subregions
+        self.verboseprint = get_verboseprint(debug)
         self.out_file_op = "x"  # Exclusive write
         if force_write:
             self.out_file_op = "w"
 
         self.data_type = {}
-        self.data_type_keys = ['grid_name',
-                               'fieldname_in_model',
-                               'fieldname_in_file',
-                               'file_name',
-                               'interp_method',
-                               'factor',
-                               'lon_start',
-                               'lon_end',
-                               'lat_start',
-                               'lat_end',
-                               'type']
-        self.data_type_values = {'grid_name': str,
-                                 'fieldname_in_model': str,
-                                 'fieldname_in_file': str,
-                                 'file_name': str,
-                                 'interp_method': str,
-                                 'factor': float,
-                                 'lon_start': float,
-                                 'lon_end': float,
-                                 'lat_start': float,
-                                 'lat_end': float,
-                                 'type': str}
-
         self.data_table_content = []
 
         #: check if data_table file exists
@@ -108,39 +108,56 @@ class DataType:
     def parse_data_table(self):
         """Loop through each line in the ascii data_Table file and fill in
            data_type class"""
-        iline_count = 0
         self.data_type['data_table'] = []
-        for iline in self.data_table_content:
-            iline_count += 1
-            if iline.strip() != '' and '#' not in iline.strip()[0]:
-                self.verboseprint("---> Working on line:" + iline.replace("\n", ""))
-                # get rid of comment at the end of line
-                iline_list = iline.split('#')[0].split(',')
-                try:
-                    tmp_list = {}
-                    for i in range(len(iline_list)):
-                        mykey = self.data_type_keys[i]
-                        myfunct = self.data_type_values[mykey]
-                        myval = myfunct(
-                            iline_list[i].strip('"\' \n'))
-                        if i == 4:
-                            # If LIMA format convert to the regular format
-                            # #FUTURE
-                            if ("true" in myval):
-                                myval = 'bilinear'
-                            if ("false" in myval):
-                                myval = 'none'
-                            if ("default" in myval):
-                                myval = 'bilinear'
-                        tmp_list[mykey] = myval
-                except Exception:
-                    raise TableParseError(self.data_table_file,
-                                          iline_count,
-                                          iline)
-                data_table_entry = reformat_yaml(tmp_list)
+        jobs = 1
+        if self.jobs != 1:
+            jobs = get_jobs(self.jobs, len(self.data_table_content))
+
+        if jobs == 1:
+            data_table_entries = self.iter_data_table(self.data_table_content)
+        else:
+            self.verboseprint("Parsing the data_table with " + str(jobs) + " processes")
+            data_table_entries = map_chunks(parse_data_table_chunk, self.data_table_content, jobs,
+                                            self.data_table_file, self.debug)
+        for data_table_entry in data_table_entries:
+            self.data_type['data_table'].append(data_table_entry)
+
+    def iter_data_table(self, data_table_content, first_line=1):
+        """Parse the lines of the ascii data_table and yield the output yaml of each entry
+
+        Args:
+            data_table_content (iterable): The lines of the data_table
+            first_line (int): The line number of the first line, for the error messages
+        """
+        #: The number and the content of the last line given to the csv reader
+        current_line = [0, ""]
+
+        def data_lines():
+            """Yield the lines that are not empty or comments, without the comments at the end"""
+            for iline_count, iline in enumerate(data_table_content, start=first_line):
+                stripped = iline.strip()
+                if stripped == '' or stripped[0] == '#':
+                    continue
+                current_line[0], current_line[1] = iline_count, iline
+                iline = strip_comment(iline)
+                # A quote that is not closed would make the csv reader continue to the next line
+                if iline.count('"') % 2 != 0:
+                    raise TableParseError(self.data_table_file, iline_count, current_line[1])
+                yield iline
+
+        for row in csv.reader(data_lines(), skipinitialspace=True):
+            try:
+                tmp_list = parse_data_table_row(row)
+            except Exception:
+                raise TableParseError(self.data_table_file,
+                                      current_line[0],
+                                      current_line[1])
+            data_table_entry = reformat_yaml(tmp_list)
+            if self.debug:
+                self.verboseprint("---> Working on line:" + current_line[1].replace("\n", ""))
                 self.verboseprint("Yaml for this line:")
-                self.verboseprint(yaml.dump(data_table_entry, sort_keys=False))
-                self.data_type['data_table'].append(data_table_entry)
+                self.verboseprint(LazyYaml(data_table_entry, sort_keys=False))
+            yield data_table_entry
 
     def read_and_parse_data_table(self):
         """Open, read, and parse the legacy ascii data_table file"""
@@ -157,10 +174,158 @@ class DataType:
         """Convert the legacy ascii data_table file to yaml"""
         self.read_and_parse_data_table()
 
+        if self.check_subregions:
+            warn_subregions(check_subregions(self.data_type['data_table']))
+
         self.verboseprint("Writing the output yaml: " + self.yaml_table_file)
         with open(self.yaml_table_file, self.out_file_op) as myfile:
             yaml.dump(self.data_type, myfile, sort_keys=False)
 
+    def stream_data_table(self):
+        """Convert the legacy ascii data_table file to yaml one line at a time, writing each entry as soon
+           as it is parsed. The output is the same as convert_data_table. If the yaml_table_file is "-"
+           the yaml is written to stdout"""
+        self.verboseprint("Streaming the data_table:" + self.data_table_file + " to " + self.yaml_table_file)
+        index = SubregionIndex()
+        with open(self.data_table_file, 'r') as infile:
+            data_table_entries = self.iter_data_table(infile)
+            if self.check_subregions:
+                data_table_entries = index.add_entries(data_table_entries)
+
+            if self.yaml_table_file == "-":
+                write_data_table(data_table_entries, sys.stdout)
+            else:
+                with open(self.yaml_table_file, self.out_file_op) as myfile:
+                    try:
+                        write_data_table(data_table_entries, myfile)
+                    except BaseException:
+                        myfile.close()
+                        remove(self.yaml_table_file)
+                        raise
+        warn_subregions(index.iter_problems())
+
+
+def write_data_table(data_table_entries, myfile):
+    """Write the data_table yaml one entry at a time, in the same format as yaml.dump of the whole table
+
+    Args:
+        data_table_entries (iterable): The output yaml of each entry
+        myfile: The open file to write to
+    """
+    empty = True
+    for data_table_entry in data_table_entries:
+        if empty:
+            myfile.write("data_table:\n")
+            empty = False
+        yaml.dump([data_table_entry], myfile, sort_keys=False)
+    if empty:
+        yaml.dump({'data_table': []}, myfile, sort_keys=False)
+
+
+def parse_data_table_chunk(chunk, start, data_table_file, debug):
+    """Parse a chunk of the lines of a data_table in a worker process, see chunks.py
+
+    Args:
+        chunk (list): Consecutive lines of the data_table
+        start (int): Index of the first line of the chunk in the data_table
+        data_table_file (str): Path to the data_table, for the error messages
+        debug (bool): Print the steps of the conversion
+
+    Returns:
+        tuple: The output yaml of the entries and the error that stopped the chunk, or None
+    """
+    data_table = DataType(data_table_file=data_table_file, debug=debug)
+    data_table_entries = []
+    try:
+        for data_table_entry in data_table.iter_data_table(chunk, first_line=start + 1):
+            data_table_entries.append(data_table_entry)
+    except Exception as err:
+        return data_table_entries, err
+    return data_table_entries, None
+
+
+def data_table_to_dict(data_table_name, debug=False, jobs=1):
+    """ Read and parse a data_table and return the yaml as a dictionary, without writing it to a file
+
+    Args:
+        data_table_name (str): Path to the data table to convert
+        debug (bool): Print the steps of the conversion
+        jobs (int): Number of processes used to parse a large data_table, None for the number of cpus
+    """
+    test_class = DataType(data_table_file=data_table_name, debug=debug, jobs=jobs)
+    test_class.read_and_parse_data_table()
+    return test_class.data_type
+
+
+def to_interp_method(myval):
+    """Return the interp_method, converting the LIMA format (.true., .false., default) to the regular format"""
+    # #FUTURE
+    if ("true" in myval):
+        myval = 'bilinear'
+    if ("false" in myval):
+        myval = 'none'
+    if ("default" in myval):
+        myval = 'bilinear'
+    return myval
+
+
+#: The key of each column of the data_table
+DATA_TABLE_KEYS = ('grid_name',
+                   'fieldname_in_model',
+                   'fieldname_in_file',
+                   'file_name',
+                   'interp_method',
+                   'factor',
+                   'lon_start',
+                   'lon_end',
+                   'lat_start',
+                   'lat_end',
+                   'type')
+#: The conversion function of the columns that are not strings, every column is stripped before
+DATA_TABLE_CONVERTERS = ((4, to_interp_method),
+                         (5, float),
+                         (6, float),
+                         (7, float),
+                         (8, float),
+                         (9, float))
+MIN_COLUMNS = 6  #: grid_name through factor
+REGION_COLUMN = 6  #: The column where the region starts
+strip_value = methodcaller('strip', '"\' \n')  #: Remove the quotes and the spaces around a value
+
+
+def strip_comment(iline):
+    """Remove the comment at the end of a line, ignoring the # that are inside quotes"""
+    if '#' not in iline:
+        return iline
+    in_quotes = False
+    for i, char in enumerate(iline):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == '#' and not in_quotes:
+            return iline[:i]
+    return iline
+
+
+def parse_data_table_row(row):
+    """Convert the columns of a data_table line, as split by the csv reader, to a dictionary
+
+    Args:
+        row (list): The columns of the line. The region can be in 4 columns or in 1 quoted
+                    column, i.e "10.0, 20.0, 80.0, 100.0"
+    """
+    if len(row) == REGION_COLUMN + 2:
+        row = row[:REGION_COLUMN] + row[REGION_COLUMN].split(',') + row[REGION_COLUMN + 1:]
+    ncolumns = len(row)
+    if ncolumns < MIN_COLUMNS or ncolumns > len(DATA_TABLE_KEYS):
+        raise ValueError("The line has " + str(ncolumns) + " columns")
+
+    row = list(map(strip_value, row))
+    for i, convert in DATA_TABLE_CONVERTERS:
+        if i >= ncolumns:
+            break
+        row[i] = convert(row[i])
+    return dict(zip(DATA_TABLE_KEYS, row))
+
 
 def reformat_yaml(tmp_list):
     """Convert the dictionary as it was read in to the output yaml"""
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Read the dimensions and variables of a NetCDF classic file (CDF-1, CDF-2 and CDF-5) from its header.
+
+Only the header is parsed, following the NetCDF classic format specification, so no netCDF library is
+needed. The file is mapped with mmap, so only the pages of the header are read from disk, however large
+the data is. NetCDF-4 files are HDF5 files, their variables can't be read without the HDF5 library, so
+they are recognized and reported as such.
+"""
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+#: The first bytes of a NetCDF-4 (HDF5) file
+HDF5_MAGIC = b"\x89HDF\r\n\x1a\n"
+
+#: The tags of the lists in the header
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+#: The size in bytes of a value of each nc_type (NC_BYTE to NC_UINT64)
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 4, 6: 8, 7: 1, 8: 2, 9: 4, 10: 8, 11: 8}
+
+#: The dimensions (name: length, None for the record dimension) and variables (name: tuple of dimension
+#: names) of a file. format is "CDF-1", "CDF-2", "CDF-5" or "NetCDF-4", the dimensions and variables of a
+#: NetCDF-4 file are None as they are not read
+NetCDFHeader = namedtuple("NetCDFHeader", ["format", "dimensions", "variables"])
+
+
+class NetCDFHeaderError(Exception):
+    """ The file is not a NetCDF file or its header is corrupted """
+
+
+class _HeaderReader:
+    """ Read the values of a classic header in order """
+
+    def __init__(self, buf, version):
+        self.buf = buf
+        self.pos = 4
+        # NON_NEG values (counts, lengths, dimids) are 64 bits in CDF-5, offsets are 64 bits after CDF-1
+        self.count_format = ">Q" if version == 5 else ">I"
+        self.offset_format = ">I" if version == 1 else ">Q"
+
+    def unpack(self, fmt):
+        """ Read a value with the struct format fmt """
+        try:
+            value, = struct.unpack_from(fmt, self.buf, self.pos)
+        except struct.error:
+            raise NetCDFHeaderError("The header is truncated")
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def count(self):
+        return self.unpack(self.count_format)
+
+    def skip(self, nbytes):
+        """ Skip nbytes, padded to 4 bytes """
+        self.pos += -(-nbytes // 4) * 4
+        if self.pos > len(self.buf):
+            raise NetCDFHeaderError("The header is truncated")
+
+    def name(self):
+        nchars = self.count()
+        name = self.buf[self.pos:self.pos + nchars]
+        self.skip(nchars)
+        return bytes(name).decode("utf-8", "replace")
+
+    def list_length(self, tag):
+        """ Read the tag and the number of elements of a list, that may be ABSENT """
+        list_tag = self.unpack(">I")
+        nelems = self.count()
+        if list_tag == 0 and nelems == 0:
+            return 0
+        if list_tag != tag:
+            raise NetCDFHeaderError("Expected the tag " + str(tag) + " at byte " + str(self.pos) +
+                                    ", found " + str(list_tag))
+        return nelems
+
+    def skip_attributes(self):
+        for _ in range(self.list_length(NC_ATTRIBUTE)):
+            self.name()
+            nc_type = self.unpack(">I")
+            if nc_type not in TYPE_SIZES:
+                raise NetCDFHeaderError("Unknown nc_type " + str(nc_type))
+            self.skip(self.count() * TYPE_SIZES[nc_type])
+
+
+def parse_header(buf):
+    """ Parse the header at the start of buf
+
+    Args:
+        buf: The contents of the file (bytes, or anything with the buffer protocol, like a mmap)
+
+    Returns:
+        NetCDFHeader: The dimensions and variables of the file
+    """
+    if buf[:len(HDF5_MAGIC)] == HDF5_MAGIC:
+        return NetCDFHeader("NetCDF-4", None, None)
+    if buf[:3] != b"CDF" or len(buf) < 4 or buf[3] not in (1, 2, 5):
+        raise NetCDFHeaderError("Not a NetCDF file")
+
+    version = buf[3]
+    reader = _HeaderReader(buf, version)
+    reader.count()  # numrecs
+
+    dimensions = {}
+    dimension_names = []
+    for _ in range(reader.list_length(NC_DIMENSION)):
+        name = reader.name()
+        length = reader.count()
+        dimensions[name] = length or None
+        dimension_names.append(name)
+    reader.skip_attributes()
+
+    variables = {}
+    for _ in range(reader.list_length(NC_VARIABLE)):
+        name = reader.name()
+        dimids = [reader.count() for _ in range(reader.count())]
+        if any(dimid >= len(dimension_names) for dimid in dimids):
+            raise NetCDFHeaderError("The variable " + name + " uses a dimension that is not defined")
+        variables[name] = tuple(dimension_names[dimid] for dimid in dimids)
+        reader.skip_attributes()
+        reader.unpack(">I")  # nc_type
+        reader.count()  # vsize
+        reader.unpack(reader.offset_format)  # begin
+    return NetCDFHeader("CDF-" + str(version), dimensions, variables)
+
+
+def read_header(path):
+    """ Read the header of a NetCDF file
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        NetCDFHeader: The dimensions and variables of the file
+
+    Raises:
+        OSError: If the file can't be opened
+        NetCDFHeaderError: If the file is not a NetCDF file or its header is corrupted
+    """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            raise NetCDFHeaderError("The file is empty")
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return parse_header(buf)
+
+
+@lru_cache(maxsize=None)
+def _read_header_cached(path, mtime_ns, size):
+    return read_header(path)
+
+
+def get_header(path):
+    """ Same as read_header, but the header is cached until the modification time or the size of the
+    file change
+    """
+    stat = os.stat(path)
+    return _read_header_cached(os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Check the subregions of the data_table entries that override the same field for overlaps and gaps.
+
+The entries are grouped by (fieldname_in_model, grid_name). In each group:
+    - An entry without a subregion overrides the whole grid, so it overlaps every other entry
+    - The complements of two outside_region boxes always overlap
+    - An inside_region box that is not inside the box of the outside_region overlaps it
+    - The inside_region boxes must not overlap each other
+    - The inside_region boxes must cover the box of the outside_region, or their bounding box if there is no
+      outside_region, without gaps
+
+The inside_region boxes are checked with a sweep over the longitudes. A segment tree over the latitudes counts
+how many boxes cover each latitude band between two longitudes, so a box that starts over a band that is
+already covered overlaps a box before it, and a band that is not covered is a gap. Each group is checked in
+O(n log n) for its n boxes, plus the time to list the overlaps. Longitudes do not wrap.
+"""
+
+from collections import namedtuple
+import click
+
+INSIDE_REGION = "inside_region"
+OUTSIDE_REGION = "outside_region"
+
+
+class Box(namedtuple('Box', ['ientry', 'lon_start', 'lon_end', 'lat_start', 'lat_end'])):
+    """ The subregion of the entry number `ientry` (starting at 1) of the data_table """
+    __slots__ = ()
+
+    def __str__(self):
+        return ("entry " + str(self.ientry) + " (lon " + format_range(self.lon_start, self.lon_end) +
+                ", lat " + format_range(self.lat_start, self.lat_end) + ")")
+
+    def contains(self, other):
+        return (self.lon_start <= other.lon_start and other.lon_end <= self.lon_end and
+                self.lat_start <= other.lat_start and other.lat_end <= self.lat_end)
+
+    def has_area(self):
+        return self.lon_start < self.lon_end and self.lat_start < self.lat_end
+
+
+def format_range(start, end):
+    return "[" + format(start, "g") + ", " + format(end, "g") + "]"
+
+
+class CoverTree:
+    """ A segment tree with the number of boxes that cover each of the n latitude bands. It adds to a range
+        of bands and finds the band that is covered the least or the most in a range in O(log n) """
+
+    def __init__(self, n):
+        self.n = n
+        #: The min/max count of each node, including the additions to the node itself
+        self.low = [0] * (4 * n)
+        self.high = [0] * (4 * n)
+        #: The additions to the whole range of each node
+        self.added = [0] * (4 * n)
+
+    def add(self, lo, hi, val, node=1, nlo=0, nhi=None):
+        """ Add val to the count of the bands lo to hi-1 """
+        if nhi is None:
+            nhi = self.n
+        if hi <= nlo or nhi <= lo:
+            return
+        if lo <= nlo and nhi <= hi:
+            self.added[node] += val
+            self.low[node] += val
+            self.high[node] += val
+            return
+        mid = (nlo + nhi) // 2
+        self.add(lo, hi, val, 2 * node, nlo, mid)
+        self.add(lo, hi, val, 2 * node + 1, mid, nhi)
+        self.low[node] = self.added[node] + min(self.low[2 * node], self.low[2 * node + 1])
+        self.high[node] = self.added[node] + max(self.high[2 * node], self.high[2 * node + 1])
+
+    def find(self, lo, hi, lowest=True, node=1, nlo=0, nhi=None):
+        """ Return the lowest (or highest) count of the bands lo to hi-1 and the first band with it """
+        if nhi is None:
+            nhi = self.n
+        counts = self.low if lowest else self.high
+        if hi <= nlo or nhi <= lo:
+            return None
+        if lo <= nlo and nhi <= hi:
+            #: Go down to the band with the count of this node
+            count = counts[node]
+            while nhi - nlo > 1:
+                mid = (nlo + nhi) // 2
+                target = counts[node] - self.added[node]
+                node = 2 * node if counts[2 * node] == target else 2 * node + 1
+                nlo, nhi = (nlo, mid) if node % 2 == 0 else (mid, nhi)
+            return count, nlo
+        mid = (nlo + nhi) // 2
+        found = [res for res in (self.find(lo, hi, lowest, 2 * node, nlo, mid),
+                                 self.find(lo, hi, lowest, 2 * node + 1, mid, nhi)) if res is not None]
+        count, band = min(found, key=lambda res: (res[0] if lowest else -res[0], res[1]))
+        return count + self.added[node], band
+
+
+def check_inside_boxes(boxes, domain):
+    """ Yield the overlaps between the boxes and the gaps that they leave in the domain
+
+    Args:
+        boxes (list): The Box of each inside_region entry
+        domain (Box): The area that the boxes should cover
+    """
+    lats = sorted(set([domain.lat_start, domain.lat_end] +
+                      [lat for box in boxes for lat in (box.lat_start, box.lat_end)]))
+    band = {lat: i for i, lat in enumerate(lats)}
+    tree = CoverTree(max(len(lats) - 1, 1))
+
+    events = {}  #: The boxes that start and end at each longitude
+    for box in boxes:
+        events.setdefault(box.lon_start, ([], []))[0].append(box)
+        events.setdefault(box.lon_end, ([], []))[1].append(box)
+    lons = sorted(set(events) | {domain.lon_start, domain.lon_end})
+
+    active = set()
+    gap = None  #: The gap that is being extended over consecutive longitudes
+    dlo, dhi = band[domain.lat_start], band[domain.lat_end]
+    for lon, next_lon in zip(lons, lons[1:]):
+        starts, ends = events.get(lon, ([], []))
+        for box in ends:
+            active.discard(box)
+            tree.add(band[box.lat_start], band[box.lat_end], -1)
+        for box in starts:
+            count, _ = tree.find(band[box.lat_start], band[box.lat_end], lowest=False)
+            if count > 0:
+                #: Only look for the boxes it overlaps when there is one
+                for other in sorted(active, key=lambda other: other.ientry):
+                    if other.lat_start < box.lat_end and box.lat_start < other.lat_end:
+                        yield str(other) + " overlaps " + str(box)
+            active.add(box)
+            tree.add(band[box.lat_start], band[box.lat_end], 1)
+
+        band_gap = None
+        if domain.lon_start <= lon < domain.lon_end and dlo < dhi:
+            count, iband = tree.find(dlo, dhi)
+            if count == 0:
+                band_gap = (lats[iband], lats[iband + 1])
+        if gap is not None and band_gap != gap[2:]:
+            yield "gap at lon " + format_range(gap[0], gap[1]) + ", lat " + format_range(gap[2], gap[3])
+            gap = None
+        if band_gap is not None:
+            gap = (gap[0] if gap else lon, next_lon) + band_gap
+    if gap is not None:
+        yield "gap at lon " + format_range(gap[0], gap[1]) + ", lat " + format_range(gap[2], gap[3])
+
+
+def check_group(entries):
+    """ Yield the overlaps and gaps of the entries of one (fieldname_in_model, grid_name)
+
+    Args:
+        entries (list): The (ientry, subregion) of each entry, subregion is None if the entry does not have one
+    """
+    whole = [ientry for ientry, subregion in entries if subregion is None]
+    inside, outside = [], []
+    for ientry, subregion in entries:
+        if subregion is None:
+            continue
+        lons = sorted((float(subregion['lon_start']), float(subregion['lon_end'])))
+        lats = sorted((float(subregion['lat_start']), float(subregion['lat_end'])))
+        box = Box(ientry, lons[0], lons[1], lats[0], lats[1])
+        (outside if subregion.get('type') == OUTSIDE_REGION else inside).append(box)
+
+    for ientry in whole:
+        other = next(i for i, _ in entries if i != ientry)
+        yield ("entry " + str(ientry) + " does not have a subregion, so it overlaps entry " + str(other))
+    if len(outside) > 1:
+        yield (str(outside[0]) + " and " + str(outside[1]) + " are both outside_region, so they overlap "
+               "outside of their boxes")
+
+    inside = [box for box in inside if box.has_area()]
+    if outside:
+        domain = outside[0]
+        for box in inside:
+            if not domain.contains(box):
+                yield str(box) + " is not inside " + str(domain) + ", so they overlap"
+    elif inside:
+        domain = Box(0, min(box.lon_start for box in inside), max(box.lon_end for box in inside),
+                     min(box.lat_start for box in inside), max(box.lat_end for box in inside))
+    if len(inside) > 1 or (inside and outside):
+        yield from check_inside_boxes(inside, domain)
+
+
+class SubregionIndex:
+    """ The subregions of the data_table entries, grouped by (fieldname_in_model, grid_name). The entries can
+        be added as they are parsed, only their number and subregions are kept """
+
+    def __init__(self):
+        #: The (ientry, subregion) of the entries of each (fieldname_in_model, grid_name)
+        self.fields = {}
+        self.nentries = 0
+
+    def add(self, entry):
+        """ Add the next entry of the data_table """
+        self.nentries += 1
+        subregions = entry.get('subregion') or [None]
+        self.fields.setdefault((entry['fieldname_in_model'], entry['grid_name']), []).extend(
+            (self.nentries, subregion) for subregion in subregions)
+
+    def add_entries(self, entries):
+        """ Add the entries and yield them, so they can be checked while they are written """
+        for entry in entries:
+            self.add(entry)
+            yield entry
+
+    def iter_problems(self):
+        """ Yield a message for each overlap and gap """
+        for (fieldname, grid_name), entries in self.fields.items():
+            if len(entries) < 2:
+                continue
+            for problem in check_group(entries):
+                yield fieldname + " (" + grid_name + "): " + problem
+
+
+def check_subregions(entries):
+    """ Return a message for each overlap and gap of the subregions of the data_table entries
+
+    Args:
+        entries (list): The entries of the data_table, as in the data_table.yaml
+    """
+    index = SubregionIndex()
+    for entry in entries:
+        index.add(entry)
+    return list(index.iter_problems())
+
+
+def warn_subregions(problems):
+    """ Print the overlaps and gaps of the subregions to stderr, so they do not mix with a yaml in stdout """
+    for problem in problems:
+        click.echo("WARNING: " + problem, err=True)
@@ -24,6 +24,14 @@ import errno
 import click
 import yaml
 from .. import __version__
+from ..incremental import Manifest
+from ..load_yamls import iter_yaml_loaders, read_yaml
+from ..logger import get_verboseprint
+
+
+#: The kinds of output_name returned by get_output_name_kind
+OUTPUT_NAME_IS_VAR_NAME = "var_name"
+OUTPUT_NAME_IS_NEW = "new"
 
 
 class InconsistentKeys(ValueError):
@@ -61,22 +69,35 @@ class DuplicateOptionalKeyError(ValueError):
               help="Path to the output diag table yaml")
 @click.option('--force-write/--no-force-write', type=click.BOOL, show_default=True, default=False,
               help="Overwrite the output yaml file if it already exists")
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to parse the input yamls, they are still combined in order")
+@click.option('--incremental/--no-incremental', type=click.BOOL, show_default=True, default=False,
+              help="Keep a manifest of the inputs next to the output yaml (<output-yaml>.manifest), so the next \
+                    combine reuses the output if no input changed and only parses the inputs that changed")
 @click.version_option(__version__, "--version")
-def combine_diag_table_yaml(in_files, debug, output_yaml, force_write):
+def combine_diag_table_yaml(in_files, debug, output_yaml, force_write, jobs, incremental):
     """ Combines a series of diag_table.yaml files into one file \n
         in-files - Space seperated list with the names of the diag_table.yaml files to combine \n
     """
 
-    verboseprint = print if debug else lambda *a, **k: None
+    verboseprint = get_verboseprint(debug)
 
     try:
-        diag_table = combine_yaml(in_files, verboseprint)
+        manifest = None
+        if incremental:
+            manifest = Manifest(output_yaml, "diag_table", in_files)
+            if manifest.is_up_to_date():
+                verboseprint("The input yamls did not change, reusing the output yaml: " + output_yaml)
+                return
+        diag_table = combine_yaml(in_files, verboseprint, jobs, manifest)
         out_file_op = "x"  # Exclusive write
-        if force_write:
+        if force_write or (manifest is not None and manifest.owns_output()):
             out_file_op = "w"
         verboseprint(f"Writing the output yaml: {output_yaml}")
         with open(output_yaml, out_file_op) as myfile:
             yaml.dump(diag_table, myfile, default_flow_style=False, sort_keys=False)
+        if manifest is not None:
+            manifest.write()
     except Exception as err:
         raise SystemExit(err)
 
@@ -130,38 +151,193 @@ def compare_key_value_pairs(entry1, entry2, key, is_optional=False):
             raise DuplicateOptionalKeyError(file_name, key)
 
 
-def is_field_duplicate(diag_table, new_entry, file_name, verboseprint):
-    var_name = new_entry['var_name']
-    module = new_entry.get('module')
+def get_output_name_kind(entry):
+    """ Classify the output_name of a variable the way is_outputname_different compares them
 
-    verboseprint(f"---> Checking if {var_name} is duplicated")
+    Returns:
+        None if the variable has no output_name, OUTPUT_NAME_IS_VAR_NAME if its output_name is its var_name and
+        OUTPUT_NAME_IS_NEW otherwise
+    """
+    if "output_name" not in entry:
+        return None
+    if entry['output_name'] == entry['var_name']:
+        return OUTPUT_NAME_IS_VAR_NAME
+    return OUTPUT_NAME_IS_NEW
 
-    for entry in diag_table:
-        if entry == new_entry:
-            verboseprint(f"---> {var_name} is a duplicate variable. Moving on!")
-            return True
 
-        # Entry is not the same as new_entry
-        if entry['var_name'] != var_name:
-            # If the variable name is not the same, then it is a brand new variable
-            continue
+class _ListIndex:
+    """ An index of the items of a list that is only appended to. Items appended to the list after the index
+    was created are indexed the next time the index is used (see CombineIndex.get)
+    """
 
-        if entry.get('module') != module:
-            # If the variable name is the same but it a different module, then it is a brand new variable
-            continue
+    def __init__(self, items):
+        self.items = items
+        self.nindexed = 0
 
-        # Entry and new_entry have the var_name and module, but they are not the same,
-        # check if the outputname is different
-        if is_outputname_different(entry, new_entry, verboseprint):
-            continue
+    def sync(self):
+        """ Index the items that were appended to the list since the last call """
+        for position in range(self.nindexed, len(self.items)):
+            self.add(position, self.items[position])
+        self.nindexed = len(self.items)
+
+    def add(self, position, item):
+        raise NotImplementedError
+
+
+class FileIndex(_ListIndex):
+    """ The first diag file of each file_name in a list of diag files """
+
+    def __init__(self, diag_files):
+        super().__init__(diag_files)
+        self.files = {}
+
+    def add(self, position, entry):
+        self.files.setdefault(entry['file_name'], entry)
+
+
+class ModuleIndex(_ListIndex):
+    """ The first module block of each module in a list of module blocks """
+
+    def __init__(self, diag_modules):
+        super().__init__(diag_modules)
+        self.modules = {}
+
+    def add(self, position, module):
+        self.modules.setdefault(module['module'], module)
 
-        raise DuplicateFieldError(
-            f"The variable {var_name} from module {module} in file {file_name} "
-            "is defined twice with different keys"
-        )
 
-    verboseprint(f"----> {var_name} is a new variable. Adding it")
-    return False
+class _FieldGroup:
+    """ The variables of a varlist with the same var_name and module """
+    __slots__ = ("by_output_name", "first_without_output_name", "first_conflict_without_output_name")
+
+    def __init__(self):
+        #: The (position, entry) of the variables with an output_name, by output_name
+        self.by_output_name = {}
+        #: The (position, entry) of the first variable without an output_name
+        self.first_without_output_name = None
+        #: The (position, entry) of the first variable without an output_name or with output_name == var_name
+        self.first_conflict_without_output_name = None
+
+
+class VarlistIndex(_ListIndex):
+    """ The variables of a varlist by (var_name, module) and by output_name.
+
+    Two variables can only be the same or conflict if they have the same var_name and module. Within those,
+    is_outputname_different only depends on whether each variable has an output_name and whether it is its
+    var_name, so the variable that decides if a new variable is a duplicate is found without comparing it to
+    every variable of the varlist (see find).
+    """
+
+    def __init__(self, varlist):
+        super().__init__(varlist)
+        self.groups = {}
+
+    def add(self, position, entry):
+        group = self.groups.get((entry['var_name'], entry.get('module')))
+        if group is None:
+            group = self.groups[(entry['var_name'], entry.get('module'))] = _FieldGroup()
+
+        kind = get_output_name_kind(entry)
+        if kind is not None:
+            group.by_output_name.setdefault(entry['output_name'], []).append((position, entry))
+        elif group.first_without_output_name is None:
+            group.first_without_output_name = (position, entry)
+        if kind != OUTPUT_NAME_IS_NEW and group.first_conflict_without_output_name is None:
+            group.first_conflict_without_output_name = (position, entry)
+
+    def find(self, new_entry):
+        """ Find the first variable of the varlist that is the same as new_entry or conflicts with it, which is
+        the variable that decides the result of is_field_duplicate
+
+        Returns:
+            tuple: (entry, True) if the variable is the same as new_entry, (entry, False) if it has the same
+                   var_name and module but is_outputname_different is False, or None if new_entry is a new
+                   variable
+        """
+        group = self.groups.get((new_entry['var_name'], new_entry.get('module')))
+        if group is None:
+            return None
+
+        kind = get_output_name_kind(new_entry)
+        if kind is None:
+            # Conflicts with the variables without an output_name or with output_name == var_name, and the same
+            # variable would be one of them, so the first one decides
+            first = group.first_conflict_without_output_name
+            return None if first is None else (first[1], first[1] == new_entry)
+
+        same = next((item for item in group.by_output_name.get(new_entry['output_name'], ())
+                     if item[1] == new_entry), None)
+        # A variable with output_name == var_name also conflicts with the variables without an output_name
+        conflict = group.first_without_output_name if kind == OUTPUT_NAME_IS_VAR_NAME else None
+        if same is not None and (conflict is None or same[0] < conflict[0]):
+            return same[1], True
+        if conflict is not None:
+            return conflict[1], False
+        return None
+
+
+class CombineIndex:
+    """ The indexes of the lists of diag files, module blocks and variables that are being combined.
+
+    There is one index per list object, as yaml anchors can make several diag files use the same list.
+    The combiner only appends to the lists, so the indexes catch up with them when they are used.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def get(self, items, index_class):
+        """ Return the index_class index of the list items, up to date with its items """
+        # The index keeps a reference to the list, so its id is not reused while the index exists
+        index = self.indexes.get(id(items))
+        if index is None:
+            index = self.indexes[id(items)] = index_class(items)
+        index.sync()
+        return index
+
+
+def is_field_duplicate(diag_table, new_entry, file_name, verboseprint, index=None):
+    """ Check if a variable was already defined in a varlist
+
+    Args:
+        diag_table (list): The varlist
+        new_entry (dict): The variable to check
+        file_name (str): The name of the diag file, for the error message
+        verboseprint (function): Function used to print the debug messages
+        index (CombineIndex): The indexes of the lists that are being combined. If None, the varlist is
+                              indexed for this check only
+
+    Returns:
+        bool: True if the same variable is already in the varlist, False if it is a new variable
+
+    Raises:
+        DuplicateFieldError: If the varlist has a variable with the same var_name and module that is not the
+                             same, and is_outputname_different is False for them
+    """
+    var_name = new_entry['var_name']
+    module = new_entry.get('module')
+
+    verboseprint(f"---> Checking if {var_name} is duplicated")
+
+    if index is None:
+        index = CombineIndex()
+    found = index.get(diag_table, VarlistIndex).find(new_entry)
+    if found is None:
+        verboseprint(f"----> {var_name} is a new variable. Adding it")
+        return False
+
+    entry, is_same = found
+    if is_same:
+        verboseprint(f"---> {var_name} is a duplicate variable. Moving on!")
+        return True
+
+    # Entry and new_entry have the var_name and module, but they are not the same and the output_name does not
+    # make them different
+    verboseprint(f"---> {var_name} conflicts with {entry}")
+    raise DuplicateFieldError(
+        f"The variable {var_name} from module {module} in file {file_name} "
+        "is defined twice with different keys"
+    )
 
 
 def flatten_varlist(varlist):
@@ -175,73 +351,101 @@ def flatten_varlist(varlist):
     return flattened
 
 
-def is_module_duplicate(diag_modules, module, file_name, verboseprint):
+def is_module_duplicate(diag_modules, module, file_name, verboseprint, index=None):
+    """ Check if a module block was already defined, adding its new variables to the existing block if it was
+
+    Args:
+        diag_modules (list): The module blocks of the diag file
+        module (dict): The module block to check
+        file_name (str): The name of the diag file, for the error messages
+        verboseprint (function): Function used to print the debug messages
+        index (CombineIndex): The indexes of the lists that are being combined. If None, the lists are indexed
+                              for this check only
+
+    Returns:
+        bool: True if the module was already defined, False if it is a new module
+    """
+    if index is None:
+        index = CombineIndex()
     module_name = module['module']
     verboseprint(f"---> Checking if {module_name} is duplicated")
-    for old_module in diag_modules:
-        if (old_module['module'] == module_name):
-            verboseprint(f"---> Found {module_name}. Checking if it has the same keys")
-
-            if old_module == module:
-                verboseprint(f"---> {module_name} is exactly the same as the previous one. Ignoring!")
-                return True
-            else:
-                verboseprint(f"---> {module_name} is not the same as the previous one. Checking for new variables!")
-                for field_entry in module['varlist']:
-                    if not is_field_duplicate(old_module['varlist'], field_entry, file_name, verboseprint):
-                        old_module['varlist'].append(field_entry)
-                        return True
-    return False
-
-
-def is_file_duplicate(diag_table, new_entry, verboseprint):
-    # Check if a diag_table entry was already defined
-    for entry in diag_table:
-        if entry == new_entry:
-            verboseprint(f"---> {new_entry['file_name']} is a duplicate file. Moving on!")
-            return True
-        else:
-            # If the file_name is not the same, then move on to the next file
-            if entry['file_name'] != new_entry['file_name']:
-                continue
-
-            verboseprint(f"---> {entry['file_name']} has already been added. Checking that all the keys are the same")
-
-            # Since there are duplicate files, check fhat all the keys are the same:
-            compare_key_value_pairs(entry, new_entry, 'freq')
-            compare_key_value_pairs(entry, new_entry, 'time_units')
-            compare_key_value_pairs(entry, new_entry, 'unlimdim')
-
-            compare_key_value_pairs(entry, new_entry, 'write_file', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'new_file_freq', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'start_time', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'file_duration', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'global_meta', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'sub_region', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'is_ocean', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'reduction', is_optional=True)
-            compare_key_value_pairs(entry, new_entry, 'kind', is_optional=True)
-
-            # If entry has entry['modules'], then new_entry must also have it and it cannot have new_entry['varlist']
-            # There will need be an extra layer to add the variables to entry['modules']['varlist']
-            compare_key_value_pairs(entry, new_entry, 'module', is_optional=True)
-
-            # Since the file is the same, check if there are any new variables to add to the file:
-            verboseprint(f"---> Looking for new variables for the file {new_entry['file_name']}")
-            if "varlist" in new_entry:
-                verboseprint("This file is using a varlist do define variables")
-                for field_entry in new_entry['varlist']:
-                    if not is_field_duplicate(entry['varlist'], field_entry, entry['file_name'], verboseprint):
-                        entry['varlist'].append(field_entry)
-            elif "modules" in new_entry:
-                verboseprint("This file is using modules to define variables")
-                for module_entry in new_entry['modules']:
-                    if not is_module_duplicate(entry['modules'], module_entry, entry['file_name'], verboseprint):
-                        entry['modules'].append(module_entry)
+    old_module = index.get(diag_modules, ModuleIndex).modules.get(module_name)
+    if old_module is None:
+        return False
+
+    verboseprint(f"---> Found {module_name}. Checking if it has the same keys")
+    if old_module == module:
+        verboseprint(f"---> {module_name} is exactly the same as the previous one. Ignoring!")
+        return True
+
+    verboseprint(f"---> {module_name} is not the same as the previous one. Checking for new variables!")
+    for field_entry in module['varlist']:
+        if not is_field_duplicate(old_module['varlist'], field_entry, file_name, verboseprint, index):
+            old_module['varlist'].append(field_entry)
+    return True
 
-            return True
-    verboseprint(f"---> {new_entry['file_name']} is a new file. Adding it!")
-    return False
+
+def is_file_duplicate(diag_table, new_entry, verboseprint, index=None):
+    """ Check if a diag file was already defined, adding its new variables to the existing entry if it was
+
+    Args:
+        diag_table (list): The diag files that were already combined
+        new_entry (dict): The diag file to check
+        verboseprint (function): Function used to print the debug messages
+        index (CombineIndex): The indexes of the lists that are being combined. If None, the lists are indexed
+                              for this check only, callers that check many files should keep one instead
+
+    Returns:
+        bool: True if the file was already defined, False if it is a new file
+    """
+    if index is None:
+        index = CombineIndex()
+
+    # Only the entry with the same file_name can be the same file
+    entry = index.get(diag_table, FileIndex).files.get(new_entry['file_name'])
+    if entry is None:
+        verboseprint(f"---> {new_entry['file_name']} is a new file. Adding it!")
+        return False
+
+    if entry == new_entry:
+        verboseprint(f"---> {new_entry['file_name']} is a duplicate file. Moving on!")
+        return True
+
+    verboseprint(f"---> {entry['file_name']} has already been added. Checking that all the keys are the same")
+
+    # Since there are duplicate files, check fhat all the keys are the same:
+    compare_key_value_pairs(entry, new_entry, 'freq')
+    compare_key_value_pairs(entry, new_entry, 'time_units')
+    compare_key_value_pairs(entry, new_entry, 'unlimdim')
+
+    compare_key_value_pairs(entry, new_entry, 'write_file', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'new_file_freq', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'start_time', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'file_duration', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'global_meta', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'sub_region', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'is_ocean', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'reduction', is_optional=True)
+    compare_key_value_pairs(entry, new_entry, 'kind', is_optional=True)
+
+    # If entry has entry['modules'], then new_entry must also have it and it cannot have new_entry['varlist']
+    # There will need be an extra layer to add the variables to entry['modules']['varlist']
+    compare_key_value_pairs(entry, new_entry, 'module', is_optional=True)
+
+    # Since the file is the same, check if there are any new variables to add to the file:
+    verboseprint(f"---> Looking for new variables for the file {new_entry['file_name']}")
+    if "varlist" in new_entry:
+        verboseprint("This file is using a varlist do define variables")
+        for field_entry in new_entry['varlist']:
+            if not is_field_duplicate(entry['varlist'], field_entry, entry['file_name'], verboseprint, index):
+                entry['varlist'].append(field_entry)
+    elif "modules" in new_entry:
+        verboseprint("This file is using modules to define variables")
+        for module_entry in new_entry['modules']:
+            if not is_module_duplicate(entry['modules'], module_entry, entry['file_name'], verboseprint, index):
+                entry['modules'].append(module_entry)
+
+    return True
 
 
 def get_base_date(my_table, diag_table):
@@ -256,48 +460,83 @@ def check_inconsistent_keys(entry):
         raise InconsistentKeys(entry['file_name'])
 
 
-def combine_yaml(files, verboseprint):
+def load_diag_yaml(f, verboseprint, load=None):
+    """ Read a diag_table yaml and return its content
+
+    Args:
+        f (str): Path to the diag_table yaml
+        verboseprint (function): Function used to print the debug messages
+        load (function): Function that returns the parsed yaml, as yielded by iter_yaml_loaders. If None the
+                         yaml is parsed here
+    """
+    # Check if the file exists
+    if not path.exists(f):
+        raise FileNotFoundError(errno.ENOENT,
+                                strerror(errno.ENOENT),
+                                f)
+    # Verify that yaml is read correctly
+    try:
+        verboseprint(f"Opening on the diag_table yaml: {f}")
+        verboseprint(f"Parsing the diag_table yaml: {f}")
+        my_table = load() if load is not None else read_yaml(f)
+    except yaml.scanner.ScannerError as scanerr:
+        print("ERROR:", scanerr)
+        raise Exception("ERROR: Please verify that the previous entry in the yaml file is entered as "
+                        "\"key: value\" and not as \"key:value\" ")
+
+    if isinstance(my_table, str):
+        raise Exception("ERROR: diagYaml contains incorrectly formatted key value pairs."
+                        " Make sure that entries are formatted as \"key: value\" and not \"key:value\" ")
+    return my_table
+
+
+def combine_tables(tables, verboseprint, is_segment=False):
+    """ Combine diag_tables that are already in memory into one, using the same rules as combine_yaml
+
+    Args:
+        tables (iterable): The diag_tables (dictionaries as read from a diag_table yaml) to combine
+        verboseprint (function): Function used to print the debug messages
+        is_segment (bool): If True, the tables are segments and the combined table is a segment too,
+                           so the title and the base_date are not expected
+    """
     diag_table = {}
-    diag_table['title'] = ""
-    diag_table['base_date'] = ""
+    if not is_segment:
+        diag_table['title'] = ""
+        diag_table['base_date'] = ""
     diag_table['diag_files'] = []
-    for f in files:
-        # Check if the file exists
-        if not path.exists(f):
-            raise FileNotFoundError(errno.ENOENT,
-                                    strerror(errno.ENOENT),
-                                    f)
-        # Verify that yaml is read correctly
-        try:
-            verboseprint(f"Opening on the diag_table yaml: {f}")
-            with open(f) as fl:
-                verboseprint(f"Parsing the diag_table yaml: {f}")
-                my_table = yaml.safe_load(fl)
-        except yaml.scanner.ScannerError as scanerr:
-            print("ERROR:", scanerr)
-            raise Exception("ERROR: Please verify that the previous entry in the yaml file is entered as "
-                            "\"key: value\" and not as \"key:value\" ")
-
-        if isinstance(my_table, str):
-            raise Exception("ERROR: diagYaml contains incorrectly formatted key value pairs."
-                            " Make sure that entries are formatted as \"key: value\" and not \"key:value\" ")
-
-        verboseprint("Attempting to get the base_date")
-        get_base_date(my_table, diag_table)
+    index = CombineIndex()
+    for my_table in tables:
+        if not is_segment:
+            verboseprint("Attempting to get the base_date")
+            get_base_date(my_table, diag_table)
 
         diag_files = my_table.get('diag_files', [])
         for entry in diag_files:
             check_inconsistent_keys(entry)
             if 'varlist' in entry:
                 entry['varlist'] = flatten_varlist(entry['varlist'])
-            if not is_file_duplicate(diag_table['diag_files'], entry, verboseprint):
+            if not is_file_duplicate(diag_table['diag_files'], entry, verboseprint, index):
                 diag_table['diag_files'].append(entry)
 
-    if diag_table['base_date'] == "" or diag_table['title'] == "":
+    if not is_segment and (diag_table['base_date'] == "" or diag_table['title'] == ""):
         raise ValueError("The ouput combined yaml file does not have the base_date or title defined. "
                          "Ensure that one yaml file has the base_date and title defined!")
     return diag_table
 
 
+def combine_yaml(files, verboseprint, jobs=1, manifest=None):
+    """ Combine diag_table yamls into one
+
+    Args:
+        files (list): Paths to the diag_table yamls
+        verboseprint (function): Function used to print the debug messages
+        jobs (int): Number of processes used to parse the yamls, None for the number of cpus
+        manifest (Manifest): The manifest of an incremental combine, the yamls that did not change since the
+                             last combine are not parsed again
+    """
+    loaders = iter_yaml_loaders(files, jobs) if manifest is None else manifest.iter_yaml_loaders(jobs)
+    return combine_tables((load_diag_yaml(f, verboseprint, load) for f, load in loaders), verboseprint)
+
+
 if __name__ == "__main__":
     combine_diag_table_yaml(prog_name="combine_diag_table_yaml")
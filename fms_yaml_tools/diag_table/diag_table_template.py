@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+""" Render the diag_table yaml of many ensemble members or experiments from one parsed diag_table.
+
+The members are defined in a CSV file (one row per member, the header has the names of the variables)
+or in a YAML file (a list with a dictionary of variables per member). The variables of a member are used
+in three ways:
+    - `title` and `base_date` replace the title and the base_date of the table
+    - `<file_name>:<key>` replaces a key of a file, i.e `atmos_daily:freq: 6 hours`. The file_name is the one
+      in the diag_table, before any substitution
+    - Any other variable replaces `$variable` or `${variable}` in the values of the table, i.e
+      `${prefix}atmos_daily` or the `$baseDate` placeholder. Placeholders that the member does not define are
+      left as they are
+
+The name of each output yaml is the --output-yaml with the variables of the member substituted in the same way
+(`$member` is the number of the member, starting at 1), so it needs to use at least one variable.
+"""
+
+import csv
+from string import Template
+import yaml
+
+GLOBAL_KEYS = ('title', 'base_date')
+MEMBER_KEY = 'member'
+
+
+def read_members(members_file):
+    """ Read the variables of each member from a CSV or a YAML file
+
+    Args:
+        members_file (str): Path to the file. Files ending in .csv are read as CSV, anything else as YAML
+
+    Returns:
+        list: A dictionary with the variables of each member
+    """
+    with open(members_file, newline='') as fh:
+        if members_file.endswith('.csv'):
+            members = list(csv.DictReader(fh, skipinitialspace=True))
+        else:
+            members = yaml.safe_load(fh)
+
+    if not isinstance(members, list) or not all(isinstance(member, dict) for member in members):
+        raise ValueError("The members file " + members_file + " should define a list of dictionaries "
+                         "with the variables of each member")
+    return [{str(k).strip(): str(v).strip() for k, v in member.items()} for member in members]
+
+
+class DiagTableTemplate:
+    """ A diag_table yaml that is used to render the yaml of many members.
+
+    The table is scanned once for the values that have placeholders, so rendering a member only substitutes
+    those values and dumps the table. The table is modified in place while a member is dumped and restored
+    afterwards, so it is never copied.
+    """
+
+    def __init__(self, yaml_doc):
+        """
+        Args:
+            yaml_doc (dict): The diag_table, as returned by DiagTable.get_yaml_doc
+        """
+        self.yaml_doc = yaml_doc
+        #: (container, key, Template) of every string value with a placeholder
+        self.slots = []
+        self.find_slots(yaml_doc)
+        #: The files of the table, keyed by file_name
+        self.files = {ifile['file_name']: ifile for ifile in yaml_doc.get('diag_files', [])}
+
+    def find_slots(self, obj):
+        """ Find the string values with a placeholder in the dictionaries and lists of obj """
+        items = obj.items() if isinstance(obj, dict) else enumerate(obj)
+        for key, val in items:
+            if isinstance(val, str):
+                if '$' in val:
+                    self.slots.append((obj, key, Template(val)))
+            elif isinstance(val, (dict, list)):
+                self.find_slots(val)
+
+    def get_changes(self, member, imember):
+        """ Return the (container, key, new value) of everything that is different for this member """
+        variables = dict(member)
+        variables.setdefault(MEMBER_KEY, str(imember))
+
+        changes = [(container, key, template.safe_substitute(variables)) for container, key, template in self.slots]
+        for name, val in member.items():
+            if name in GLOBAL_KEYS:
+                if name not in self.yaml_doc:
+                    raise ValueError("Member " + str(imember) + " sets the " + name + ", but the diag_table is "
+                                     "a segment and does not have one")
+                changes.append((self.yaml_doc, name, val))
+            elif ':' in name:
+                file_name, key = name.split(':', 1)
+                if file_name not in self.files:
+                    raise ValueError("Member " + str(imember) + " sets " + name + ", but " + file_name +
+                                     " is not a file in the diag_table")
+                changes.append((self.files[file_name], key, val))
+        return changes
+
+    def dump(self, member, imember, stream=None):
+        """ Dump the yaml of a member
+
+        Args:
+            member (dict): The variables of the member
+            imember (int): The number of the member, starting at 1
+            stream: Where to write the yaml, if None the yaml is returned as a string
+        """
+        changes = self.get_changes(member, imember)
+        missing = object()
+        originals = [(container, key, container.get(key, missing) if isinstance(container, dict) else container[key])
+                     for container, key, _ in changes]
+        try:
+            for container, key, val in changes:
+                container[key] = val
+            return yaml.dump(self.yaml_doc, stream, sort_keys=False)
+        finally:
+            for container, key, val in reversed(originals):
+                if val is missing:
+                    del container[key]
+                else:
+                    container[key] = val
+
+
+def get_output_names(output_yaml, members):
+    """ Return the name of the output yaml of each member
+
+    Args:
+        output_yaml (str): The output yaml with placeholders, i.e diag_table_$member.yaml
+        members (list): The variables of each member
+    """
+    template = Template(output_yaml)
+    output_names = [template.safe_substitute({MEMBER_KEY: str(imember), **member})
+                    for imember, member in enumerate(members, start=1)]
+    if len(set(output_names)) != len(output_names):
+        raise ValueError("The members would write to the same output yaml. Use a variable of the members "
+                         "in --output-yaml, i.e diag_table_$member.yaml")
+    return output_names
+
+
+def write_members(yaml_doc, members_file, output_yaml, force_write=False):
+    """ Write the diag_table yaml of each member in members_file
+
+    Args:
+        yaml_doc (dict): The parsed diag_table, as returned by DiagTable.get_yaml_doc
+        members_file (str): Path to the CSV or YAML file with the variables of each member
+        output_yaml (str): Name of the output yaml, with the variables of the members substituted
+        force_write (bool): Overwrite the output yamls if they already exist
+    """
+    out_file_op = "x"  # Exclusive write
+    if force_write:
+        out_file_op = "w"
+
+    members = read_members(members_file)
+    output_names = get_output_names(output_yaml, members)
+    template = DiagTableTemplate(yaml_doc)
+    for imember, (member, output_name) in enumerate(zip(members, output_names), start=1):
+        with open(output_name, out_file_op) as myfile:
+            template.dump(member, imember, myfile)
+    return output_names
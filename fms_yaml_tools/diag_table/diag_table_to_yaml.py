@@ -23,11 +23,34 @@
     Author: Uriel Ramirez 05/27/2022
 """
 
-import copy as cp
 import click
-from os import path
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from os import cpu_count, path, remove
 import yaml
 from .. import __version__
+from ..chunks import get_jobs, map_chunks
+from ..logger import get_verboseprint, LazyYaml
+from .combine_diag_table_yamls import combine_tables
+from .diag_table_template import write_members
+from . import libdiagtable
+
+FILE_LINE = "file"
+FIELD_LINE = "field"
+MIN_FILE_COLUMNS = 3  #: file_name through output_freq_units
+MAX_FILE_COLUMNS = 12  #: file_name through filename_time_bounds
+FIELD_COLUMNS = 8  #: module_name through packing
+INT_COLUMN = re.compile(r"""^\s*(["']?)\s*[-+]?\d+\s*\1\s*$""")
+FILE_FORMAT = (" 'file_name', 'output_freq', 'output_freq_units', 'file_format',"
+               " 'time_axis_units', 'time_axis_name'"
+               " 'new_file_freq', 'new_file_freq_units', 'start_time', 'file_duration',"
+               " 'file_duration_units'")
+FIELD_FORMAT = (" 'module_name', 'field_name', 'output_name', 'file_name',"
+                " 'time_sampling', 'reduction_method',"
+                " 'regional_section', 'packing'")
 
 
 @click.command()
@@ -41,18 +64,139 @@ from .. import __version__
 @click.option('--is-segment/--full-table', type=click.BOOL, show_default=True, default=False,
               help="The diag_table is a segment and a not a full table, \
                     so the tile and the base_date are not expected")
+@click.option('--stream/--no-stream', type=click.BOOL, show_default=True, default=False,
+              help="Write each file as soon as its variables are read instead of keeping the whole \
+                    table in memory. The variables of each file must follow the file lines and be \
+                    grouped together in the same order as the files")
 @click.version_option(__version__, "--version")
-@click.argument("diag-table-name")  # This is the path to the diag_table to convert
-def diag_to_yaml(diag_table_name, debug, output_yaml, force_write, is_segment):
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to convert the diag_tables when more than one is given, or to \
+                    parse the lines of a large diag_table in chunks when only one is given (not with --stream)")
+@click.option('--members', type=click.Path(exists=True, dir_okay=False), default=None,
+              help="CSV or YAML file with the variables of each ensemble member or experiment. The diag_table \
+                    is parsed once and a yaml is written for each member, see diag_table_template.py")
+@click.argument("diag-table-name", nargs=-1, required=True)  # This is the path to the diag_tables to convert
+def diag_to_yaml(diag_table_name, debug, output_yaml, force_write, is_segment, stream, jobs, members):
     """ Converts a legacy ascii diag_table to a yaml. \n
-        data-table-name - data to the field table to convert \n
+        diag-table-name - Path to the diag table to convert. If more than one is given, they are converted
+                          in parallel and combined into one yaml with the rules of combine-diag-table-yamls.
+                          The first one is the full table and the others are segments (all of them are
+                          segments with --is-segment) \n
     """
 
-    #: start
-    test_class = DiagTable(diag_table_file=diag_table_name, is_segment=is_segment, debug=debug)
-    test_class.read_and_parse_diag_table()
-    test_class.construct_yaml(yaml_table_file=output_yaml,
-                              force_write=force_write)
+    if stream and (len(diag_table_name) > 1 or members is not None):
+        raise click.UsageError("--stream can only be used with one diag_table and without --members")
+
+    if len(diag_table_name) == 1 and members is None:
+        test_class = DiagTable(diag_table_file=diag_table_name[0], is_segment=is_segment, debug=debug, jobs=jobs)
+        if stream:
+            test_class.stream_yaml(yaml_table_file=output_yaml, force_write=force_write)
+            return
+        test_class.read_and_parse_diag_table()
+        test_class.construct_yaml(yaml_table_file=output_yaml,
+                                  force_write=force_write)
+        return
+
+    if len(diag_table_name) > 1:
+        diag_table = combine_diag_tables(diag_table_name, is_segment=is_segment, debug=debug, jobs=jobs)
+    else:
+        diag_table = diag_table_to_dict(diag_table_name[0], is_segment=is_segment, debug=debug, jobs=jobs)
+
+    if members is not None:
+        write_members(diag_table, members, output_yaml, force_write=force_write)
+        return
+
+    out_file_op = "x"  # Exclusive write
+    if force_write:
+        out_file_op = "w"
+    with open(output_yaml, out_file_op) as myfile:
+        yaml.dump(diag_table, myfile, sort_keys=False)
+
+
+def diag_table_to_dict(diag_table_file, is_segment=False, debug=False, jobs=1):
+    """ Read and parse a diag_table and return the yaml as a dictionary
+
+    Args:
+        diag_table_file (str): Path to the diag_table
+        is_segment (bool): If True, the diag_table is a segment, so the title and base_date are not expected
+        debug (bool): Print the steps of the conversion
+        jobs (int): Number of processes used to parse a large diag_table, None for the number of cpus
+    """
+    diag_table = DiagTable(diag_table_file=diag_table_file, is_segment=is_segment, debug=debug, jobs=jobs)
+    diag_table.read_and_parse_diag_table()
+    return diag_table.get_yaml_doc()
+
+
+def diag_table_to_libdiagtable(diag_table_file, is_segment=False, debug=False):
+    """ Read and parse a diag_table and return it as a libdiagtable.DiagTable
+
+    Args:
+        diag_table_file (str): Path to the diag_table
+        is_segment (bool): If True, the diag_table is a segment, so the title and base_date are not expected
+        debug (bool): Print the steps of the conversion
+    """
+    return libdiagtable.DiagTable(diag_table_to_dict(diag_table_file, is_segment=is_segment, debug=debug))
+
+
+def combine_diag_tables(diag_table_files, is_segment=False, debug=False, jobs=1):
+    """ Convert several diag_tables in parallel and combine them in memory with the rules of
+        combine-diag-table-yamls
+
+    Args:
+        diag_table_files (list): Paths to the diag_tables. The first one is the full table and the rest are
+                                 segments, unless is_segment is True and they are all segments
+        is_segment (bool): If True, all of the diag_tables are segments and so is the combined table
+        debug (bool): Print the steps of the conversion
+        jobs (int): Number of processes to use, None for the number of cpus
+    """
+    segments = [is_segment or i > 0 for i in range(len(diag_table_files))]
+    if jobs is None:
+        jobs = cpu_count() or 1
+    jobs = min(jobs, len(diag_table_files))
+
+    if jobs == 1:
+        tables = map(diag_table_to_dict, diag_table_files, segments, repeat(debug))
+        return combine_tables(with_file_names(diag_table_files, tables), get_verboseprint(debug), is_segment)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        #: The tables are combined in the order of the files as they are converted
+        tables = executor.map(diag_table_to_dict, diag_table_files, segments, repeat(debug))
+        return combine_tables(with_file_names(diag_table_files, tables), get_verboseprint(debug), is_segment)
+
+
+def parse_diag_table_chunk(chunk, start, first_line, diag_table_file, debug):
+    """ Parse a chunk of the file and field lines of a diag_table in a worker process, see chunks.py
+
+    Args:
+        chunk (list): Consecutive lines of the diag_table after the base_date
+        start (int): Index of the first line of the chunk in the lines after the base_date
+        first_line (int): Line number of the first line after the base_date
+        diag_table_file (str): Path to the diag_table, for the error messages
+        debug (bool): Print the steps of the conversion
+
+    Returns:
+        tuple: The records of the lines and the error that stopped the chunk, or None
+    """
+    diag_table = DiagTable(diag_table_file=diag_table_file, is_segment=True, debug=debug)
+    records = []
+    try:
+        for iline_count, iline_in in enumerate(chunk, start=first_line + start):
+            record = diag_table.parse_line(iline_in, iline_count)
+            if record is not None:
+                records.append(record)
+    except Exception as err:
+        return records, err
+    return records, None
+
+
+def with_file_names(diag_table_files, tables):
+    """ Yield the converted tables, adding the name of the diag_table to the errors hit while converting it """
+    tables = iter(tables)
+    for diag_table_file in diag_table_files:
+        try:
+            yield next(tables)
+        except Exception as err:
+            raise Exception("ERROR converting the diag_table " + diag_table_file + ": " + str(err)) from err
 
 
 def is_duplicate(current_files, diag_file):
@@ -61,22 +205,20 @@ def is_duplicate(current_files, diag_file):
     Determine if a diag file has already been defined.
 
     Args:
-        current_files (list): List of dictionary containing all the diag files that have been defined
-        diag_file (dictionary): Dictionary defining a diag file
+        current_files (dict): All the diag files that have been defined, keyed by file_name
+        diag_file (DiagFileRecord): The diag file as parsed from the diag_table
 
     Returns:
         logical: If the diag_file has been defined and has the same keys, returns True
                  If it has been defined but it does not have the same keys, return an error
                  If it has not been defined, return False
     """
-    for curr_diag_file in current_files['diag_files']:
-        if curr_diag_file['file_name'] != diag_file['file_name']:
-            continue
-        if curr_diag_file == diag_file:
-            return True
-        else:
-            raise Exception("The diag_table defines " + diag_file['file_name'] + " more than once with different keys")
-    return False
+    curr_diag_file = current_files.get(diag_file.file_name)
+    if curr_diag_file is None:
+        return False
+    if curr_diag_file == diag_file:
+        return True
+    raise Exception("The diag_table defines " + diag_file.file_name + " more than once with different keys")
 
 
 def update_output_name(output_name, tmp_dict):
@@ -96,65 +238,53 @@ def update_output_name(output_name, tmp_dict):
         del tmp_dict['output_name']
 
 
-def combine_units_and_freq(ifile_dict):
-    # Combine freq_int and freq_units into 1 key
-    ifile_dict['freq'] = str(ifile_dict['freq_int']) + ' ' + ifile_dict['freq_units']
-    del ifile_dict['freq_int']
-    del ifile_dict['freq_units']
-
-    # Combine new_file_freq_int and new_file_freq_units into 1 key
-    if "new_file_freq_int" in ifile_dict:
-        ifile_dict['new_file_freq'] = str(ifile_dict['new_file_freq_int']) + ' ' + ifile_dict['new_file_freq_units']
-        del ifile_dict['new_file_freq_int']
-        del ifile_dict['new_file_freq_units']
-
-    # Combine file_duration_int and file_duration_units into 1 key
-    if "file_duration_int" in ifile_dict:
-        ifile_dict['file_duration'] = str(ifile_dict['file_duration_int']) + ' ' + ifile_dict['file_duration_units']
-        del ifile_dict['file_duration_int']
-        del ifile_dict['file_duration_units']
-
-
-def find_file_subregion(subregions, ifile_dict):
-    found = False
-    for iregion_dict in subregions:
-        if iregion_dict['file_name'] != ifile_dict['file_name']:
-            continue
-        tmp_dict = cp.deepcopy(iregion_dict)
-        del tmp_dict['file_name']
-        del tmp_dict['line']
-        if (tmp_dict['grid_type'] != "none"):
-            ifile_dict['sub_region'].append(tmp_dict)
-            found = True
-            if tmp_dict['is_only_zbounds']:
-                found = False
-            del tmp_dict['is_only_zbounds']
-            del tmp_dict['zbounds']
-    if not found:
-        del ifile_dict['sub_region']
-
-
-def check_for_file_for_all_var(files, fields):
+def group_fields_by_file(fields):
+    """
+    Group the diag fields by the file they are expected to be in.
+
+    Args:
+        fields (list): List of DiagFieldRecord containing all the diag fields that have been defined
+
+    Returns:
+        dict: Lists of fields keyed by file_name, in the order the files are first referenced
+    """
+    fields_by_file = {}
+    for field in fields:
+        fields_by_file.setdefault(field.file_name, []).append(field)
+    return fields_by_file
+
+
+def check_for_file_for_all_var(files, fields_by_file):
     """
     Determine if all fields have a file defined.
 
     Args:
-        files (list): List of dictionary containing all the diag files that have been defined
-        fields (list): List of dictionary containing all the diag fields that have been defined
+        files (dict): Dictionary of all the diag files that have been defined, keyed by file_name
+        fields_by_file (dict): Lists of the diag fields that have been defined, keyed by file_name
     """
 
-    for field in fields:
-        found = False
-        for file in files:
-            if file['file_name'] == field['file_name']:
-                found = True
-        if not found:
-            raise Exception("The variable " + field['var_name'] + " is expected to be in the file " +
-                            field['file_name'] + " but the file is not defined in the diag table! " +
-                            "Ensure that there is a file entry for " + field['file_name'] +
+    for file_name, fields in fields_by_file.items():
+        if file_name not in files:
+            raise Exception("The variable " + fields[0].var_name + " is expected to be in the file " +
+                            file_name + " but the file is not defined in the diag table! " +
+                            "Ensure that there is a file entry for " + file_name +
                             " or delete the the line for the field.")
 
 
+def check_static_field(ifile, ifield):
+    """ Raise an error if a variable in a static file is using a reduction method
+
+    Args:
+        ifile (DiagFileRecord): The static file
+        ifield (DiagFieldRecord): The field that is expected to be in the file
+    """
+    if ifield.reduction != "none":
+        raise Exception("file " + ifile.file_name +
+                        " is a static file, but the variable: " + ifield.output_name +
+                        " is using " + ifield.reduction + " as its reduction method." +
+                        " The reduction method (6th column) should be none for a variables in a static file!")
+
+
 def parse_region(stuff):
     parsed_region = {}
     k = -1
@@ -187,6 +317,64 @@ def parse_region(stuff):
     return parsed_region
 
 
+@lru_cache(maxsize=1024)
+def parse_sub_region(myval):
+    """
+    Parse the regional_section of a field line. The result does not depend on the rest of the table, so the
+    regional_sections that are repeated in many lines are only parsed once.
+
+    Args:
+        myval (string): Defines the subregion as read from the diag_table in the format
+                        [starting x, ending x, starting y, ending y, starting z, ending z]
+
+    Returns:
+        tuple: The DiagRegionRecord of the line and the zbounds of the field (None if it does not define them)
+    """
+    if "none" in myval:
+        return DiagRegionRecord(myval), None
+
+    parsed_region = parse_region(myval.split(' '))
+    zbounds = parsed_region['zbounds']
+    if parsed_region['corner1'] == "-999 -999" and \
+       parsed_region['corner2'] == "-999 -999" and \
+       parsed_region['corner3'] == "-999 -999" and \
+       parsed_region['corner4'] == "-999 -999":
+        return DiagRegionRecord(myval), zbounds
+    return DiagRegionRecord(myval,
+                            parsed_region['corner1'],
+                            parsed_region['corner2'],
+                            parsed_region['corner3'],
+                            parsed_region['corner4']), zbounds
+
+
+def is_int_column(buf):
+    """ Determine if a column of the diag_table holds an integer """
+    return INT_COLUMN.match(buf) is not None
+
+
+def classify_line(iline_list):
+    """
+    Determine if a tokenized line of the diag_table defines a file or a field, using the number of columns and
+    the type of the columns. Field lines have a string in the second column (field_name) and at least 8 columns.
+    File lines have an integer in the second column (output_freq) and between 3 and 12 columns.
+
+    Args:
+        iline_list (list): The columns of the line
+
+    Returns:
+        string: FILE_LINE, FIELD_LINE, or None if the line is neither
+    """
+    ncolumns = len(iline_list)
+    if ncolumns < 2:
+        return None
+    if is_int_column(iline_list[1]):
+        if MIN_FILE_COLUMNS <= ncolumns <= MAX_FILE_COLUMNS:
+            return FILE_LINE
+    elif ncolumns >= FIELD_COLUMNS:
+        return FIELD_LINE
+    return None
+
+
 def set_kind(buf, iline, iline_count):
     if ("2" in buf):
         out = "r4"
@@ -199,13 +387,95 @@ def set_kind(buf, iline, iline_count):
     return out
 
 
+class DiagFileRecord(namedtuple('DiagFileRecord',
+                                ['file_name', 'freq_int', 'freq_units', 'time_units', 'unlimdim',
+                                 'new_file_freq_int', 'new_file_freq_units', 'start_time',
+                                 'file_duration_int', 'file_duration_units', 'filename_time_bounds'],
+                                defaults=(None,) * 10)):
+    """ A file line of the diag_table. Columns that are not defined are None """
+    __slots__ = ()
+
+    def is_static(self):
+        return self.freq_int == -1
+
+    def to_dict(self, sub_region=None, varlist=None):
+        """ Return the output dictionary of the file
+
+        Args:
+            sub_region (DiagRegionRecord): The sub_region of the file, if it has one
+            varlist (list): The output dictionaries of the variables in the file, if it has any
+        """
+        ifile_dict = {'file_name': self.file_name}
+        for mykey in ('time_units', 'unlimdim', 'start_time', 'filename_time_bounds'):
+            myval = getattr(self, mykey)
+            if myval is not None:
+                ifile_dict[mykey] = myval
+        if 'ocean' in self.file_name:
+            ifile_dict['is_ocean'] = True
+        if sub_region is not None:
+            ifile_dict['sub_region'] = [sub_region.to_dict()]
+
+        # Combine the ints and the units into 1 key
+        ifile_dict['freq'] = str(self.freq_int) + ' ' + self.freq_units
+        if self.new_file_freq_int is not None:
+            ifile_dict['new_file_freq'] = str(self.new_file_freq_int) + ' ' + self.new_file_freq_units
+        if self.file_duration_int is not None:
+            ifile_dict['file_duration'] = str(self.file_duration_int) + ' ' + self.file_duration_units
+
+        if varlist:
+            ifile_dict['varlist'] = varlist
+        return ifile_dict
+
+
+class DiagFieldRecord(namedtuple('DiagFieldRecord',
+                                 ['module', 'var_name', 'output_name', 'file_name', 'reduction', 'kind', 'zbounds',
+                                  'region'],
+                                 defaults=(None,) * 2)):
+    """ A field line of the diag_table. zbounds is None if the field does not define them and region is the
+        DiagRegionRecord of the regional_section of the line """
+    __slots__ = ()
+
+    def to_dict(self):
+        """ Return the output dictionary of the variable """
+        tmp_dict = {'module': self.module,
+                    'var_name': self.var_name,
+                    'output_name': self.output_name,
+                    'reduction': self.reduction}
+        update_output_name(self.output_name.lower(), tmp_dict)
+        if self.zbounds is not None:
+            tmp_dict['zbounds'] = self.zbounds
+        tmp_dict['kind'] = self.kind
+        return tmp_dict
+
+
+class DiagRegionRecord(namedtuple('DiagRegionRecord',
+                                  ['line', 'corner1', 'corner2', 'corner3', 'corner4'],
+                                  defaults=(None,) * 4)):
+    """ The regional_section of a file as read from the diag_table. The corners are None if the line
+        does not define a sub_region (i.e "none" or only the zbounds) """
+    __slots__ = ()
+
+    def is_sub_region(self):
+        return self.corner1 is not None
+
+    def to_dict(self):
+        """ Return the output dictionary of the sub_region """
+        return {'grid_type': "latlon",
+                'corner1': self.corner1,
+                'corner2': self.corner2,
+                'corner3': self.corner3,
+                'corner4': self.corner4}
+
+
 class DiagTable:
-    def __init__(self, diag_table_file='Diag_Table', is_segment=False, debug=False):
+    def __init__(self, diag_table_file='Diag_Table', is_segment=False, debug=False, jobs=1):
         '''Initialize the diag_table type'''
 
         self.diag_table_file = diag_table_file
         self.is_segment = is_segment
-        self.verboseprint = print if debug else lambda *a, **k: None
+        self.debug = debug
+        self.jobs = jobs  #: Number of processes used to parse the table, None for the number of cpus
+        self.verboseprint = get_verboseprint(debug)
         self.global_section = {}
         self.global_section_keys = ['title', 'base_date']
         self.global_section_fvalues = {'title': str,
@@ -237,26 +507,7 @@ class DiagTable:
                                      'filename_time_bounds': str}
         self.max_file_section = len(self.file_section_keys)
 
-        self.region_section = []
-        self.region_section_keys = ['grid_type',
-                                    'corner1',
-                                    'corner2',
-                                    'corner3',
-                                    'corner4',
-                                    'zbounds',
-                                    'is_only_zbounds',
-                                    'file_name'
-                                    'line']
-        self.region_section_fvalues = {'grid_type': str,
-                                       'corner1': [float, float],
-                                       'corner2': [float, float],
-                                       'corner3': [float, float],
-                                       'corner4': [float, float],
-                                       'zbounds': [float, float],
-                                       'is_only_zbounds': bool,
-                                       'file_name': str,
-                                       'line': str}
-        self.max_file_section = len(self.file_section_keys)
+        self.region_section = {}  #: The DiagRegionRecord of each file, keyed by file_name
         self.field_section = []
         self.field_section_keys = ['module',
                                    'var_name',
@@ -264,16 +515,14 @@ class DiagTable:
                                    'file_name',
                                    'reduction',
                                    'spatial_ops',
-                                   'kind',
-                                   'zbounds']
+                                   'kind']
         self.field_section_fvalues = {'module': str,
                                       'var_name': str,
                                       'output_name': str,
                                       'file_name': str,
                                       'reduction': str,
                                       'spatial_ops': str,
-                                      'kind': str,
-                                      'zbounds': str}
+                                      'kind': str}
         self.max_field_section = len(self.field_section_keys)
 
         self.diag_table_content = []
@@ -348,33 +597,38 @@ class DiagTable:
             if (i == 10 and myval == ""):
                 continue
             tmp_dict[mykey] = myval
-        self.file_section.append(cp.deepcopy(tmp_dict))
+
+        # The units are needed to combine the new_file_freq and file_duration into 1 key
+        if "new_file_freq_int" in tmp_dict and "new_file_freq_units" not in tmp_dict:
+            raise ValueError("new_file_freq is missing its units")
+        if "file_duration_int" in tmp_dict and "file_duration_units" not in tmp_dict:
+            raise ValueError("file_duration is missing its units")
+
         self.verboseprint("---> Parsed the file line:" + iline)
-        self.verboseprint(yaml.dump(tmp_dict))
+        self.verboseprint(LazyYaml(tmp_dict))
+        return DiagFileRecord(**tmp_dict)
 
     def parse_files_and_fields(self, iline, iline_list, iline_count):
-        try:
-            self.set_file_section(iline, iline_list)
-        except Exception:
-            #: Fill in the field section
+        """ Parse a file or a field line and return its DiagFileRecord or DiagFieldRecord """
+        line_type = classify_line(iline_list)
+        if line_type == FILE_LINE:
             try:
-                self.set_field_section(iline, iline_list, iline_count)
+                return self.set_file_section(iline, iline_list)
             except Exception:
                 raise Exception(" ERROR with line # " + str(iline_count) + '\n'
                                 " CHECK:            " + str(iline) + '\n'
-                                " Ensure that the line defines a field in the format:"
-                                " 'module_name', 'field_name', 'output_name', 'file_name',"
-                                " 'time_sampling', 'reduction_method',"
-                                " 'regional_section', 'packing' \n "
-                                " Or that the line defined a file in the format: "
-                                " 'file_name', 'output_freq', 'output_freq_units', 'file_format',"
-                                " 'time_axis_units', 'time_axis_name'"
-                                " 'new_file_freq', 'new_file_freq_units', 'start_time', 'file_duration',"
-                                " 'file_duration_units'")
+                                " Ensure that the line defines a file in the format:" + FILE_FORMAT)
+        elif line_type == FIELD_LINE:
+            return self.set_field_section(iline, iline_list, iline_count)
+        else:
+            raise Exception(" ERROR with line # " + str(iline_count) + '\n'
+                            " CHECK:            " + str(iline) + '\n'
+                            " Ensure that the line defines a field in the format:" + FIELD_FORMAT + " \n "
+                            " Or that the line defined a file in the format: " + FILE_FORMAT)
 
     def set_field_section(self, iline, iline_list, iline_count):
         tmp_dict = {}
-        for i in range(len(self.field_section_keys)):
+        for i in range(FIELD_COLUMNS):
             j = i
             buf = iline_list[i]
             # Do nothing with the "time_sampling" section
@@ -401,173 +655,283 @@ class DiagTable:
             if (i != 6):
                 tmp_dict[mykey] = myval
             else:
-                self.set_sub_region(myval, tmp_dict)
-        self.field_section.append(cp.deepcopy(tmp_dict))
+                try:
+                    region, zbounds = parse_sub_region(myval)
+                except (ValueError, KeyError):
+                    raise Exception(" ERROR with line # " + str(iline_count) + '\n'
+                                    " CHECK:            " + str(iline) + '\n'
+                                    " Ensure that the regional_section (7th column) is \"none\" or defines"
+                                    " the region in the format 'xbegin xend ybegin yend zbegin zend'")
         self.verboseprint("---> Parsed the field line:" + iline)
-        self.verboseprint(yaml.dump(tmp_dict))
+        self.verboseprint(LazyYaml(tmp_dict))
+        return DiagFieldRecord(zbounds=zbounds, region=region, **tmp_dict)
 
-    def set_sub_region(self, myval, field_dict):
+    def set_sub_region(self, record):
         """
-        Loop through the defined sub_regions, determine if the file already has a sub_region defined
-        if it does crash. If the sub_region is not already defined add the region to the list
+        Determine if the file already has a sub_region defined and crash if it is not the same as the current one.
+        The sub_regions are registered by file name, so this only looks at the sub_region of the field's file.
+        Lines that only define "none" or the zbounds do not define a sub_region for the file.
+        This depends on the fields before it, so it is called in the order of the lines.
 
         Args:
-            myval (string): Defines the subregion as read from the diag_table in the format
-                            [starting x, ending x, starting y, ending y, starting z, ending z]
-            field_dict(dictionary): Defines the field
+            record (DiagFieldRecord): The field as parsed from its line
+
+        Returns:
+            DiagFieldRecord: The field. The zbounds are only kept if the regional_section of the line is not
+                             the same as the one already registered for the file
         """
-        file_name = field_dict['file_name']
-        found = False
-        is_same = True
-        for iregion_dict in self.region_section:
-            if iregion_dict['file_name'] == file_name:
-                found = True
-                if iregion_dict['line'] != myval:
-                    """
-                    Here the file has a already a sub_region defined and it is not the same as the current
-                    subregion.
-                    """
-                    is_same = False
-        if (found and is_same):
-            return
+        region, file_name = record.region, record.file_name
+        iregion = self.region_section.get(file_name)
+        if iregion is not None and iregion.line == region.line:
+            return record if record.zbounds is None else record._replace(zbounds=None)
+
+        self.verboseprint("Getting the subregion from " + region.line)
+        if not region.is_sub_region():
+            if iregion is None:
+                self.region_section[file_name] = region
+            return record
+
+        if iregion is not None and iregion.is_sub_region():
+            """
+            Here the file has a already a sub_region defined and it is not the same as the current
+            subregion.
+            """
+            raise Exception("The " + file_name + " has multiple sub_regions defined. Be sure that all the variables "
+                            "in the file are in the same sub_region! "
+                            "Region 1:" + region.line + "\n"
+                            "Region 2:" + iregion.line)
+        self.region_section[file_name] = region
+        return record
+
+    def parse_line(self, iline_in, iline_count):
+        """ Parse a line after the title and the base_date
+
+        Returns:
+            The DiagFileRecord or DiagFieldRecord of the line, or None if the line is a comment or empty.
+            The sub_region of the field is not registered, see set_sub_region
+        """
+        # get rid of the comma that some file lines have in the end #classic
+        iline = iline_in.strip().strip(',')
 
-        tmp_dict2 = {}
-        tmp_dict2["line"] = myval
-        tmp_dict2["file_name"] = file_name
-        self.verboseprint("Getting the subregion from " + myval)
-        if "none" in myval:
-            tmp_dict2[self.region_section_keys[0]] = myval
-        else:
-            tmp_dict2[self.region_section_keys[0]] = "latlon"
-            stuff = myval.split(' ')
-
-            parsed_region = parse_region(stuff)
-
-            tmp_dict2["corner1"] = parsed_region['corner1']
-            tmp_dict2["corner2"] = parsed_region['corner2']
-            tmp_dict2["corner3"] = parsed_region['corner3']
-            tmp_dict2["corner4"] = parsed_region['corner4']
-            tmp_dict2["zbounds"] = parsed_region['zbounds']
-            tmp_dict2["is_only_zbounds"] = False
-            field_dict['zbounds'] = parsed_region['zbounds']
-
-            if parsed_region['corner1'] == "-999 -999" and \
-               parsed_region['corner2'] == "-999 -999" and \
-               parsed_region['corner3'] == "-999 -999" and \
-               parsed_region['corner4'] == "-999 -999":
-                tmp_dict2["is_only_zbounds"] = True
-            elif not is_same:
-                raise Exception("The " + file_name + " has multiple sub_regions defined. Be sure that all the variables"
-                                "in the file are in the same sub_region! "
-                                "Region 1:" + myval + "\n"
-                                "Region 2:" + iregion_dict['line'])
-        self.verboseprint(yaml.dump)
-        self.region_section.append(cp.deepcopy(tmp_dict2))
+        # Ignore comments and empty lines
+        if iline == '' or iline[0] == '#':
+            return None
 
-    def parse_diag_table(self):
-        """ Loop through each line in the diag_table and parse it"""
+        iline_list = iline.split('#')[0].split(',')  # get rid of any comments in the end of a line
+        return self.parse_files_and_fields(iline, iline_list, iline_count)
 
-        self.verboseprint("Parsing the data_table:" + self.diag_table_file)
-        if self.diag_table_content == []:
-            raise Exception('ERROR:  The input diag_table is empty!')
+    def iter_diag_table(self, diag_table_content):
+        """ Loop through each line in the diag_table, set the title and base_date and yield the
+            DiagFileRecord and DiagFieldRecord defined by the rest of the lines
+
+        Args:
+            diag_table_content (iterable): The lines of the diag_table. This can be an open file, so the
+                                           table is read as it is parsed. If it is a list and self.jobs is
+                                           not 1, the lines after the base_date are parsed in chunks in a
+                                           pool of processes, see chunks.py
+        """
 
         iline_count, self.global_count = 0, 0
 
         if self.is_segment:
             self.global_count = 2
 
-        #: The first two lines should be the title and base_time
-        while self.global_count < 2:
-            iline = self.diag_table_content[iline_count]
-            iline_count += 1
-            # Ignore comments and empty lines
-            if iline.strip() != '' and '#' not in iline.strip()[0]:
-                #: The second uncommented line is the base date
-                if self.global_count == 1:
-                    self.get_base_date(iline, iline_count)
-
-                #: The first uncommented line is the title
+        lines = enumerate(diag_table_content, start=1)
+        if self.global_count < 2:
+            for iline_count, iline_in in lines:
+                iline = iline_in.strip()
+
+                # Ignore comments and empty lines
+                if iline == '' or iline[0] == '#':
+                    continue
+
                 if self.global_count == 0:
-                    self.set_title(iline, iline_count)
+                    #: The first uncommented line is the title
+                    self.set_title(iline_in, iline_count)
+                else:
+                    #: The second uncommented line is the base date
+                    self.get_base_date(iline_in, iline_count)
+                    break
 
         #: The rest of the lines are either going to be file or field section
-        for iline_in in self.diag_table_content[iline_count:]:
-            # get rid of any leading spaces and the comma that some file lines have in the end #classic
-            iline = iline_in.strip().strip(',')
-            iline_count += 1
-            if iline.strip() != '' and '#' not in iline.strip()[0]:  # if not blank line or comment
-                iline_list = iline.split('#')[0].split(',')  # get rid of any comments in the end of a line
-                self.parse_files_and_fields(iline, iline_list, iline_count)
-
-    def get_all_files(self, in_dict):
-        self.verboseprint("---> Working on file::" + in_dict['file_name'])
-        ifile_dict = in_dict
-        if 'ocean' in ifile_dict['file_name']:
-            ifile_dict['is_ocean'] = True
-        ifile_dict['sub_region'] = []
+        jobs = 1
+        if self.jobs != 1 and isinstance(diag_table_content, list):
+            jobs = get_jobs(self.jobs, len(diag_table_content) - iline_count)
+
+        if jobs == 1:
+            for iline_count, iline_in in lines:
+                record = self.parse_line(iline_in, iline_count)
+                if type(record) is DiagFieldRecord:
+                    yield self.set_sub_region(record)
+                elif record is not None:
+                    yield record
+        else:
+            self.verboseprint("Parsing the file and field lines with " + str(jobs) + " processes")
+            for record in map_chunks(parse_diag_table_chunk, diag_table_content[iline_count:], jobs,
+                                     iline_count + 1, self.diag_table_file, self.debug):
+                if type(record) is DiagFieldRecord:
+                    yield self.set_sub_region(record)
+                else:
+                    yield record
+            iline_count = len(diag_table_content)
+
+        if iline_count == 0:
+            raise Exception('ERROR:  The input diag_table is empty!')
 
-        is_static = ifile_dict['freq_int'] == -1
+        if self.global_count < 2:
+            raise Exception("ERROR: The diag_table does not define the title and the base_date. "
+                            "If this is a segment and not a full diag table use the --is-segment option.")
 
-        combine_units_and_freq(ifile_dict)
-        find_file_subregion(self.region_section, ifile_dict)
+    def parse_diag_table(self):
+        """ Loop through each line in the diag_table and parse it"""
 
-        ifile_dict['varlist'] = []
-        found = False
-        for ifield_dict in self.field_section:  #: field_section = [ {}, {}. {} ]
-            if ifield_dict['file_name'] != ifile_dict['file_name']:
-                continue
-            self.verboseprint("Adding " + ifield_dict['var_name'] + " to this file")
-            tmp_dict = cp.deepcopy(ifield_dict)
-            if is_static and tmp_dict['reduction'] != "none":
-                raise Exception("file " + ifile_dict['file_name'] +
-                                " is a static file, but the variable: " + tmp_dict['output_name'] +
-                                " is using " + tmp_dict['reduction'] + " as its reduction method." +
-                                " The reduction method (6th column) should be none for a variables in a static file!")
-            output_name = tmp_dict['output_name'].lower()
-            update_output_name(output_name, tmp_dict)
-
-            del tmp_dict['file_name']
-            ifile_dict['varlist'].append(tmp_dict)
-            found = True
-        if not found:
-            del ifile_dict['varlist']
-        return ifile_dict
+        self.verboseprint("Parsing the data_table:" + self.diag_table_file)
+        for record in self.iter_diag_table(self.diag_table_content):
+            if type(record) is DiagFileRecord:
+                self.file_section.append(record)
+            else:
+                self.field_section.append(record)
+
+    def get_all_files(self, ifile, fields):
+        """ Construct the output dictionary for a file
+
+        Args:
+            ifile (DiagFileRecord): The file as parsed from the diag_table
+            fields (list): The DiagFieldRecord of the fields that are expected to be in the file
+        """
+        self.verboseprint("---> Working on file::" + ifile.file_name)
+        is_static = ifile.is_static()
+
+        varlist = []
+        for ifield in fields:
+            self.verboseprint("Adding " + ifield.var_name + " to this file")
+            if is_static:
+                check_static_field(ifile, ifield)
+            varlist.append(ifield.to_dict())
+        return ifile.to_dict(self.get_sub_region(ifile.file_name), varlist)
+
+    def get_sub_region(self, file_name):
+        """ Return the DiagRegionRecord of the sub_region of a file or None if the file is not regional """
+        sub_region = self.region_section.get(file_name)
+        if sub_region is not None and not sub_region.is_sub_region():
+            sub_region = None
+        return sub_region
+
+    def get_global_section(self):
+        """ Return the title and the base_date as they go in the output yaml """
+        yaml_doc = {}
+        if not self.is_segment:
+            mykey = self.global_section_keys[0]
+            yaml_doc[mykey] = self.global_section[mykey]
+
+            mykey = self.global_section_keys[1]
+            yaml_doc[mykey] = self.global_section[mykey]
+        return yaml_doc
 
     def construct_yaml(self,
                        yaml_table_file='diag_table.yaml',
                        force_write=False):
-        """ Combine the global, file, field, sub_region sections into 1 """
+        """ Combine the global, file, field, sub_region sections into 1 and write it to `yaml_table_file` """
 
         out_file_op = "x"  # Exclusive write
         if force_write:
             out_file_op = "w"
 
-        yaml_doc = {}
-        #: title
+        yaml_doc = self.get_yaml_doc()
+        self.verboseprint("Writing the output yaml: " + yaml_table_file)
+        with open(yaml_table_file, out_file_op) as myfile:
+            yaml.dump(yaml_doc, myfile, sort_keys=False)
+
+    def get_yaml_doc(self):
+        """ Combine the global, file, field, sub_region sections into 1 and return it as a dictionary """
 
         self.verboseprint("Constructing the yaml")
-        if not self.is_segment:
-            mykey = self.global_section_keys[0]
-            yaml_doc[mykey] = self.global_section[mykey]
+        yaml_doc = self.get_global_section()
 
-            mykey = self.global_section_keys[1]
-            yaml_doc[mykey] = self.global_section[mykey]
+        #: Group the fields by file in one pass, so each file only looks at its own fields
+        fields_by_file = group_fields_by_file(self.field_section)
 
-        yaml_doc['diag_files'] = []
-        nfiles = 0
+        diag_files = {}
         #: go through each file
-        for ifile_dict in self.file_section:  #: file_section = [ {}, {}, {} ]
-            nfiles += 1
-            out_file_dict = self.get_all_files(ifile_dict)
-
-            if not is_duplicate(yaml_doc, out_file_dict):
-                yaml_doc['diag_files'].append(out_file_dict)
-        check_for_file_for_all_var(self.file_section, self.field_section)
-        if nfiles == 0:
-            del yaml_doc['diag_files']
-        self.verboseprint("Writing the output yaml: " + yaml_table_file)
-        myfile = open(yaml_table_file, out_file_op)
-        yaml.dump(yaml_doc, myfile, sort_keys=False)
+        for ifile in self.file_section:  #: file_section = [ DiagFileRecord, DiagFileRecord, ... ]
+            if not is_duplicate(diag_files, ifile):
+                diag_files[ifile.file_name] = ifile
+                yaml_doc.setdefault('diag_files', []).append(
+                    self.get_all_files(ifile, fields_by_file.get(ifile.file_name, [])))
+        check_for_file_for_all_var(diag_files, fields_by_file)
+        return yaml_doc
+
+    def stream_yaml(self,
+                    yaml_table_file='diag_table.yaml',
+                    force_write=False):
+        """ Read, parse and write the diag_table one file at a time, so only the file that is being filled
+            is kept in memory. Each diag_files entry is written as soon as the fields of the next file start.
+            This requires the file lines to come before their fields and the fields of each file to be
+            grouped together in the same order as the file lines, as in the tables written by scripts.
+            Files without any fields are written when the fields of a later file start. """
+
+        out_file_op = "x"  # Exclusive write
+        if force_write:
+            out_file_op = "w"
+
+        self.verboseprint("Streaming the data_table:" + self.diag_table_file + " to " + yaml_table_file)
+        with open(self.diag_table_file, 'r') as infile, open(yaml_table_file, out_file_op) as myfile:
+            try:
+                self._stream_yaml(infile, myfile)
+            except BaseException:
+                myfile.close()
+                remove(yaml_table_file)
+                raise
+
+    def _stream_yaml(self, infile, myfile):
+        """ Parse the open diag_table `infile` and write the yaml to the open file `myfile` """
+        diag_files = {}  #: The DiagFileRecord that have been defined, keyed by file_name
+        pending = []  #: The files that have been defined, but not written yet
+        varlist = []  #: The variables of the file that is being filled (pending[0])
+        written = set()  #: The name of the files that have been written
+        header = [False]  #: Whether the title, base_date and diag_files key have been written
+
+        def write_next_file():
+            """ Write the oldest pending file with the variables collected for it """
+            if not header[0]:
+                if not self.is_segment:
+                    yaml.dump(self.get_global_section(), myfile, sort_keys=False)
+                myfile.write("diag_files:\n")
+                header[0] = True
+            ifile = pending.pop(0)
+            self.verboseprint("---> Writing file::" + ifile.file_name)
+            written.add(ifile.file_name)
+            yaml.dump([ifile.to_dict(self.get_sub_region(ifile.file_name), varlist)], myfile, sort_keys=False)
+            varlist.clear()
+
+        for record in self.iter_diag_table(infile):
+            if type(record) is DiagFileRecord:
+                if not is_duplicate(diag_files, record):
+                    diag_files[record.file_name] = record
+                    pending.append(record)
+                continue
+
+            if record.file_name not in diag_files:
+                raise Exception("The variable " + record.var_name + " is expected to be in the file " +
+                                record.file_name + ", but the file is not defined before it in the diag table! " +
+                                "Define the file before its variables or convert the table without --stream.")
+            if record.file_name in written:
+                raise Exception("The variable " + record.var_name + " in the file " + record.file_name +
+                                " is not grouped with the other variables in the file or the variables are not " +
+                                "in the same order as the files. Convert the table without --stream.")
+
+            #: The variables of a new file started, so the files before it are complete
+            while pending[0].file_name != record.file_name:
+                write_next_file()
+
+            if pending[0].is_static():
+                check_static_field(pending[0], record)
+            varlist.append(record.to_dict())
+
+        while pending:
+            write_next_file()
+        if not header[0]:
+            yaml.dump(self.get_global_section(), myfile, sort_keys=False)
 
     def read_and_parse_diag_table(self):
         """ Read and parse the file """
@@ -40,6 +40,17 @@ def dict_assert_mergeable(a, b):
                     format(k, a[k], b[k]))
 
 
+def numbers_list(v):
+    """Return the numbers in a space separated string (like the start_time or the corners written by
+       diag-table-to-yaml) or in a list. An empty list is returned if any of them is not a number."""
+    if type(v) is str:
+        v = v.split()
+    try:
+        return [float(vi) for vi in v]
+    except (TypeError, ValueError):
+        return []
+
+
 def parse_negate_flag(s):
     """Check if the first character of a filter string is '~', which indicates that the filter shall be negated."""
     if s[0] == "~":
@@ -348,7 +359,7 @@ class DiagTableFile(DiagTableBase):
             "global_meta": lambda v: type(v) is dict,
             "sub_region": lambda v: type(v) is DiagTableSubRegion,
             "new_file_freq": lambda v: type(v) is str,
-            "start_time": lambda v: type(v) is list and len(v) == 6,
+            "start_time": lambda v: (type(v) is list or type(v) is str) and len(numbers_list(v)) == 6,
             "file_duration": lambda v: type(v) is str,
             "is_ocean": lambda v: type(v) is bool,
             "kind": lambda v: v in ["r4", "r8", "i4", "i8"],
@@ -615,6 +626,9 @@ class DiagTableVar(DiagTableBase):
 class DiagTableSubRegion(DiagTableBase):
     @staticmethod
     def validate_corner(v):
+        if type(v) is str:
+            # diag-table-to-yaml writes the corners as a string, i.e "0 20"
+            return len(numbers_list(v)) == 2
         return type(v) is list and len(v) == 2 and all(type(vi) is float for vi in v)
 
     fields = {
@@ -24,6 +24,10 @@ import errno
 import click
 import yaml
 from .. import __version__
+from ..fingerprint import Fingerprints
+from ..incremental import Manifest
+from ..load_yamls import iter_yaml_loaders
+from ..logger import get_verboseprint
 
 
 @click.command()
@@ -34,20 +38,33 @@ from .. import __version__
               help="Path to the output field yable yaml")
 @click.option('--force-write/--no-force-write', type=click.BOOL, show_default=True, default=False,
               help="Overwrite the output yaml file if it already exists")
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to parse the input yamls, they are still combined in order")
+@click.option('--incremental/--no-incremental', type=click.BOOL, show_default=True, default=False,
+              help="Keep a manifest of the inputs next to the output yaml (<output-yaml>.manifest), so the next \
+                    combine reuses the output if no input changed and only parses the inputs that changed")
 @click.version_option(__version__, "--version")
-def combine_field_table_yaml(in_files, debug, output_yaml, force_write):
+def combine_field_table_yaml(in_files, debug, output_yaml, force_write, jobs, incremental):
     """ Combines a series of field_table.yaml files into one file \n
         in-files - Space seperated list with the names of the field_table.yaml files to combine \n
     """
-    verboseprint = print if debug else lambda *a, **k: None
+    verboseprint = get_verboseprint(debug)
     try:
-        field_table = combine_yaml(in_files, verboseprint)
+        manifest = None
+        if incremental:
+            manifest = Manifest(output_yaml, "field_table", in_files)
+            if manifest.is_up_to_date():
+                verboseprint("The input yamls did not change, reusing the output yaml: " + output_yaml)
+                return
+        field_table = combine_yaml(in_files, verboseprint, jobs, manifest)
         out_file_op = "x"  # Exclusive write
-        if force_write:
+        if force_write or (manifest is not None and manifest.owns_output()):
             out_file_op = "w"
         verboseprint("Writing the output yaml: " + output_yaml)
         with open(output_yaml, out_file_op) as myfile:
             yaml.dump(field_table, myfile, default_flow_style=False, sort_keys=False)
+        if manifest is not None:
+            manifest.write()
 
     except Exception as err:
         raise SystemExit(err)
@@ -60,11 +77,22 @@ def field_type_exists(field_type, curr_entries):
     return False
 
 
-def add_new_field(new_entry, curr_entries, verboseprint):
+def add_new_field(new_entry, curr_entries, verboseprint, fingerprints=None):
+    """
+    Add the model_types and variables of a field_type entry that are not in the field_type already combined
+
+    Args:
+        new_entry: Dictionary of the field_type entry to add
+        curr_entries: List of the field_type entries that have been combined
+        fingerprints: Fingerprints used to compare the entries. If None, the
+                      fingerprints are only kept for this call
+    """
+    if fingerprints is None:
+        fingerprints = Fingerprints()
     new_field_type = new_entry['field_type']
     for entry in curr_entries:
         if new_field_type == entry['field_type']:
-            if entry == new_entry:
+            if fingerprints.same(entry, new_entry):
                 # If the field_type already exists but it is exactly the same, move on
                 verboseprint("---> The field_type:" + entry['field_type'] + " already exists. Moving on")
                 return
@@ -72,35 +100,51 @@ def add_new_field(new_entry, curr_entries, verboseprint):
             new_modlist = new_entry['modlist']
             for mod in new_modlist:
                 if model_type_exists(mod['model_type'], entry):
-                    add_new_mod(mod, entry, verboseprint)
+                    add_new_mod(mod, entry, verboseprint, fingerprints)
                 else:
                     # If the model type does not exist, just append it
                     verboseprint("----> Adding the model_type: " + mod['model_type'] + " to field_type:"
                                  + new_entry['field_type'])
                     entry['modlist'].append(mod)
+            fingerprints.forget(entry, entry['modlist'])
 
 
-def add_new_mod(new_mod, curr_entries, verboseprint):
+def add_new_mod(new_mod, curr_entries, verboseprint, fingerprints=None):
+    """
+    Add the variables of a model_type entry that are not in the model_type already combined
+
+    Args:
+        new_mod: Dictionary of the model_type entry to add
+        curr_entries: Dictionary of the field_type entry that has been combined
+        fingerprints: Fingerprints used to compare the entries and variables.
+                      If None, the fingerprints are only kept for this call
+    """
+    if fingerprints is None:
+        fingerprints = Fingerprints()
     model_type = new_mod['model_type']
     for entry in curr_entries['modlist']:
         if model_type == entry['model_type']:
-            if new_mod == entry:
+            if fingerprints.same(new_mod, entry):
                 # If the model_type already exists but it is exactly the same, move on
                 verboseprint("----> The model_type:" + entry['model_type'] + " already exists. Moving on")
                 return
             verboseprint("----> Checking for a new entry for the model_type:" + entry['model_type'])
             new_varlist = new_mod['varlist']
             curr_varlist = entry['varlist']
+            # The variables of the model_type by fingerprint, so each new variable is only compared with the
+            # variables that are the same
+            curr_vars = {}
+            for curr_var in curr_varlist:
+                curr_vars.setdefault(fingerprints.get(curr_var), []).append(curr_var)
             for new_var in new_varlist:
-                found = False
-                for curr_var in curr_varlist:
-                    if new_var == curr_var:
-                        found = True
-                        verboseprint("-----> variable:" + new_var['variable'] + " already exists. Moving on")
-                        break
-                if not found:
+                new_fingerprint = fingerprints.get(new_var)
+                if any(curr_var == new_var for curr_var in curr_vars.get(new_fingerprint, ())):
+                    verboseprint("-----> variable:" + new_var['variable'] + " already exists. Moving on")
+                else:
                     verboseprint("-----> new variable:" + new_var['variable'] + " found. Adding it.")
-                    curr_varlist.append(new_var)
+                    fingerprints.append(curr_varlist, new_var)
+                    curr_vars.setdefault(new_fingerprint, []).append(new_var)
+            fingerprints.forget(entry)
 
 
 def model_type_exists(model_type, curr_entries):
@@ -110,37 +154,42 @@ def model_type_exists(model_type, curr_entries):
     return False
 
 
-def combine_yaml(files, verboseprint):
+def combine_yaml(files, verboseprint, jobs=1, manifest=None):
     """
     Combines a list of yaml files into one
 
     Args:
         files: List of yaml file names to combine
+        jobs: Number of processes used to parse the yaml files, None for
+              the number of cpus
+        manifest: The manifest of an incremental combine, the yaml files that
+                  did not change since the last combine are not parsed again
     """
     field_table = {}
     field_table['field_table'] = []
-    for f in files:
+    fingerprints = Fingerprints()
+    loaders = iter_yaml_loaders(files, jobs) if manifest is None else manifest.iter_yaml_loaders(jobs)
+    for f, load in loaders:
         verboseprint("Opening on the field_table yaml:" + f)
         # Check if the file exists
         if not path.exists(f):
             raise FileNotFoundError(errno.ENOENT,
                                     strerror(errno.ENOENT),
                                     f)
-        with open(f) as fl:
-            verboseprint("Parsing the data_table yaml:" + f)
-            try:
-                my_table = yaml.safe_load(fl)
-            except yaml.YAMLError as err:
-                print("---> Error when parsing the file " + f)
-                raise err
-            entries = my_table['field_table']
-            for entry in entries:
-                if not field_type_exists(entry['field_type'], field_table['field_table']):
-                    verboseprint("---> Adding the field_type: " + entry['field_type'])
-                    #  If the field table does not exist, just add it to the current field table
-                    field_table['field_table'].append(entry)
-                else:
-                    add_new_field(entry, field_table['field_table'], verboseprint)
+        verboseprint("Parsing the data_table yaml:" + f)
+        try:
+            my_table = load()
+        except yaml.YAMLError as err:
+            print("---> Error when parsing the file " + f)
+            raise err
+        entries = my_table['field_table']
+        for entry in entries:
+            if not field_type_exists(entry['field_type'], field_table['field_table']):
+                verboseprint("---> Adding the field_type: " + entry['field_type'])
+                #  If the field table does not exist, just add it to the current field table
+                field_table['field_table'].append(entry)
+            else:
+                add_new_field(entry, field_table['field_table'], verboseprint, fingerprints)
     return field_table
 
 
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Count the tracers of a field_table per model_type and estimate the memory they need per rank.
+
+Each tracer is a 3D prognostic array with one or more time levels, so for each model_type the memory per
+rank is estimated as:
+
+    tracers * time levels * points per rank * bytes per value
+
+where the points per rank are the points of the compute domain of a rank in the --layout, plus its --halo.
+Tracers with a method that makes the model allocate work arrays (i.e diffusion or sedimentation schemes)
+are listed, and each of those methods is counted as one more 3D array with a single time level.
+"""
+
+import click
+import yaml
+from .. import __version__
+from .field_table_to_yaml import field_table_to_dict
+
+#: Keywords in the name or the value of a method that mean the model allocates a work array for the tracer
+WORK_ARRAY_KEYWORDS = ("diff", "sediment", "settl")
+#: Values of a method that turn the method off
+INACTIVE_VALUES = ("none", "off", "false", "0")
+#: Keys of a tracer that describe it and are not methods
+NOT_METHODS = ("variable", "longname", "units")
+
+
+@click.command()
+@click.option('--grid', nargs=3, type=click.IntRange(min=1), default=None,
+              help="Size of the global grid of the model (NX NY NZ). Without it, only the tracers are counted")
+@click.option('--layout', nargs=2, type=click.IntRange(min=1), show_default=True, default=(1, 1),
+              help="Number of ranks in x and y of the domain decomposition")
+@click.option('--halo', type=click.IntRange(min=0), show_default=True, default=0,
+              help="Width of the halo of each rank")
+@click.option('--bytes-per-value', type=click.IntRange(min=1), show_default=True, default=8,
+              help="Size of each value of the tracer arrays (8 for r8, 4 for r4)")
+@click.option('--time-levels', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of time levels of each tracer array")
+@click.option('--model-type', type=click.STRING, multiple=True,
+              help="Only report this model_type (i.e atmos_mod). Can be used more than once")
+@click.version_option(__version__, "--version")
+@click.argument("field-table")
+def field_table_stats(field_table, grid, layout, halo, bytes_per_value, time_levels, model_type):
+    """ Counts the tracers of a field_table per model_type and estimates the memory they need per rank. \n
+        field-table - Path to the field_table.yaml, or to a legacy ascii field_table \n
+    """
+    stats = get_tracer_stats(load_field_table(field_table))
+    if model_type:
+        missing = [mtype for mtype in model_type if mtype not in stats]
+        if missing:
+            raise click.BadParameter("The field_table does not have tracers for " + ", ".join(missing),
+                                     param_hint="--model-type")
+        stats = {mtype: stats[mtype] for mtype in model_type}
+
+    points = None
+    if grid:
+        points = get_points_per_rank(grid, layout, halo)
+    for line in format_stats(stats, points, bytes_per_value, time_levels):
+        print(line)
+
+
+def load_field_table(field_table):
+    """ Read a field_table.yaml, or convert a legacy ascii field_table if the file does not end in .yaml/.yml
+
+    Returns:
+        dict: The field_table as in the field_table.yaml
+    """
+    if field_table.endswith((".yaml", ".yml")):
+        with open(field_table) as fh:
+            return yaml.safe_load(fh)
+    return field_table_to_dict(field_table)
+
+
+def get_work_array_methods(tracer):
+    """ Return the methods of a tracer that mean the model allocates a work array for it
+
+    Args:
+        tracer (dict): The tracer as in the varlist of the field_table.yaml
+    """
+    methods = []
+    for method, val in tracer.items():
+        if method in NOT_METHODS:
+            continue
+        if isinstance(val, list) and val and isinstance(val[0], dict):
+            val = val[0].get('value', '')
+        if str(val).lower() in INACTIVE_VALUES:
+            continue
+        if any(keyword in method.lower() or keyword in str(val).lower() for keyword in WORK_ARRAY_KEYWORDS):
+            methods.append(method)
+    return methods
+
+
+def get_tracer_stats(field_table):
+    """ Collect the tracers of each model_type
+
+    Args:
+        field_table (dict): The field_table as in the field_table.yaml
+
+    Returns:
+        dict: For each model_type (in the order of the table), a dictionary with the names of its "tracers"
+              and the "work_arrays" methods of each tracer that has any
+    """
+    stats = {}
+    for field in field_table.get('field_table') or []:
+        if str(field.get('field_type', '')).lower() != 'tracer':
+            continue
+        for model in field.get('modlist') or []:
+            model_stats = stats.setdefault(model['model_type'], {'tracers': [], 'work_arrays': {}})
+            for tracer in model.get('varlist') or []:
+                model_stats['tracers'].append(tracer['variable'])
+                methods = get_work_array_methods(tracer)
+                if methods:
+                    model_stats['work_arrays'][tracer['variable']] = methods
+    return stats
+
+
+def get_points_per_rank(grid, layout, halo=0):
+    """ Return the number of points of the 3D arrays of a rank
+
+    Args:
+        grid (tuple): Size of the global grid (NX, NY, NZ)
+        layout (tuple): Number of ranks in x and y
+        halo (int): Width of the halo of each rank
+    """
+    nx, ny, nz = grid
+    # The largest domain of the decomposition, as it is the one that sets the memory needed
+    ni = -(-nx // layout[0]) + 2 * halo
+    nj = -(-ny // layout[1]) + 2 * halo
+    return ni * nj * nz
+
+
+def format_bytes(nbytes):
+    """ Return a number of bytes as a string in MiB or GiB """
+    if nbytes >= 1024 ** 3:
+        return "%.2f GiB" % (nbytes / 1024 ** 3)
+    return "%.2f MiB" % (nbytes / 1024 ** 2)
+
+
+def format_stats(stats, points=None, bytes_per_value=8, time_levels=1):
+    """ Yield the lines of the report
+
+    Args:
+        stats (dict): The output of get_tracer_stats
+        points (int): The points of the 3D arrays of a rank. If None the memory is not estimated
+        bytes_per_value (int): Size of each value of the arrays
+        time_levels (int): Number of time levels of each tracer array
+    """
+    for model_type, model_stats in stats.items():
+        ntracers = len(model_stats['tracers'])
+        nwork = sum(len(methods) for methods in model_stats['work_arrays'].values())
+        yield model_type + ": " + str(ntracers) + " tracers"
+        if points is not None:
+            tracer_bytes = ntracers * time_levels * points * bytes_per_value
+            work_bytes = nwork * points * bytes_per_value
+            yield ("  tracers:     " + str(ntracers) + " x " + str(time_levels) + " time levels x " + str(points) +
+                   " points x " + str(bytes_per_value) + " bytes = " + format_bytes(tracer_bytes) + " per rank")
+            yield ("  work arrays: " + str(nwork) + " x " + str(points) + " points x " + str(bytes_per_value) +
+                   " bytes = " + format_bytes(work_bytes) + " per rank")
+            yield "  total:       " + format_bytes(tracer_bytes + work_bytes) + " per rank"
+        if model_stats['work_arrays']:
+            yield "  tracers with work arrays:"
+            for name, methods in model_stats['work_arrays'].items():
+                yield "    " + name + ": " + ", ".join(methods)
+
+
+if __name__ == '__main__':
+    field_table_stats(prog_name="field_table_stats")
@@ -21,8 +21,10 @@
 
 import click
 import re
-from collections import OrderedDict
+from functools import lru_cache
 from .. import __version__
+from ..chunks import get_jobs, map_chunks
+from ..logger import get_verboseprint
 import yaml
 
 
@@ -34,34 +36,84 @@ import yaml
               help="Path to the output field yable yaml")
 @click.option('--force-write/--no-force-write', type=click.BOOL, show_default=True, default=False,
               help="Overwrite the output yaml file if it already exists")
+@click.option('--jobs', type=click.IntRange(min=1), show_default=True, default=1,
+              help="Number of processes used to parse the entries of a large field_table in chunks")
 @click.version_option(__version__, "--version")
 @click.argument("field-table-name")  # This is the path to the field_table to convert
-def field_to_yaml(field_table_name, debug, output_yaml, force_write):
+def field_to_yaml(field_table_name, debug, output_yaml, force_write, jobs):
     """ Converts a legacy ascii field_table to a yaml. \n
         field-table-name - Path to the field table to convert \n
     """
-    # Necessary to dump OrderedDict to yaml format
-    yaml.add_representer(OrderedDict, lambda dumper, data: dumper.represent_mapping('tag:yaml.org,2002:map',
-                                                                                    data.items()))
+    get_verboseprint(debug)(field_table_name)
 
-    if debug:
-        print(field_table_name)
-
-    field_yaml = FieldYaml(field_table_name)
+    field_yaml = FieldYaml(field_table_name, jobs=jobs)
     field_yaml.main(debug)
     field_yaml.writeyaml(output_yaml=output_yaml, force_write=force_write)
 
 
+def field_table_to_dict(field_table_name, debug=False, jobs=1):
+    """ Read and parse a field_table and return the yaml as a dictionary, without writing it to a file
+
+    Args:
+        field_table_name (str): Path to the field table to convert
+        debug (bool): Print the steps of the conversion
+        jobs (int): Number of processes used to parse a large field_table, None for the number of cpus
+    """
+    field_yaml = FieldYaml(field_table_name, jobs=jobs)
+    field_yaml.main(debug)
+    return field_yaml.lists_wh_yaml
+
+
+#: Values that yaml converts to booleans, but that should stay strings
+DONT_CONVERT = frozenset(["yes", "Yes", "no", "No", "on", "On", "off", "Off"])
+#: Strings that yaml reads as one plain scalar on one line, so their type only depends on the yaml resolver
+PLAIN_SCALAR = re.compile(r"^(?!---|\.\.\.)(?:-(?=[^ ])|[A-Za-z0-9_.+/=~])[A-Za-z0-9_.+\-/=~ ]*(?<! )$")
+SCALAR_RESOLVER = yaml.resolver.Resolver()
+SCALAR_CONSTRUCTOR = yaml.constructor.SafeConstructor()
+#: Marks the values that can not be cached because yaml returns a list, a dictionary or a date for them
+NOT_CACHED = object()
+#: The types that can be cached, yaml.dump never writes them as aliases so they can be shared between fields
+CACHED_TYPES = (str, int, float, bool, type(None))
+
+
+@lru_cache(maxsize=4096)
+def load_scalar(inval):
+    """ Return the value of a string as yaml.safe_load would (YAML 1.1), without running the yaml parser
+        for plain scalars like 1.0e-30, 10 or none. The results are cached, so values that yaml reads as
+        a list, a dictionary or a date return NOT_CACHED and have to be loaded each time (a shared date would
+        be dumped as an alias) """
+    val = NOT_CACHED
+    if PLAIN_SCALAR.match(inval):
+        tag = SCALAR_RESOLVER.resolve(yaml.ScalarNode, inval, (True, False))
+        construct = SCALAR_CONSTRUCTOR.yaml_constructors.get(tag)
+        if construct is not None:
+            val = construct(SCALAR_CONSTRUCTOR, yaml.ScalarNode(tag, inval))
+
+    if val is NOT_CACHED:
+        val = yaml.safe_load(inval)
+    if not isinstance(val, CACHED_TYPES):
+        return NOT_CACHED
+    return val
+
+
 def dont_convert_yaml_val(inval):
     # Yaml does some auto-conversions to boolean that we don't want, this will help fix it
-    dontconvertus = ["yes", "Yes", "no", "No", "on", "On", "off", "Off"]
-
     if not isinstance(inval, str):
         return yaml.safe_load(inval)
-    if inval in dontconvertus:
+    if inval in DONT_CONVERT:
         return inval
-    else:
+
+    val = load_scalar(inval)
+    if val is NOT_CACHED:
         return yaml.safe_load(inval)
+    return val
+
+
+def load_quoted_val(inval):
+    """ Return the value of a string in single quotes, as yaml.safe_load("'" + inval + "'") would """
+    if "'" in inval or '\n' in inval:
+        return yaml.safe_load("'" + inval + "'")
+    return inval
 
 
 class Field:
@@ -70,7 +122,8 @@ class Field:
         """ Initialize the Field Object with the provided entries, then process as a species or tracer """
         self.field_type = in_field_type
         self.name = entry_tuple[0]
-        self.dict = OrderedDict()
+        self.dict = {}
+        self.verboseprint = get_verboseprint(debug)
         for in_prop in entry_tuple[1]:
             if 'tracer' == self.field_type:
                 self.process_tracer(in_prop, debug)
@@ -80,27 +133,23 @@ class Field:
     def process_species(self, prop, debug):
         """ Process a species field """
         comma_split = prop.split(',')
-        if debug:
-            print(self.name)
-            print(self.field_type)
-            print(comma_split)
+        self.verboseprint(self.name)
+        self.verboseprint(self.field_type)
+        self.verboseprint(comma_split)
         if len(comma_split) > 1:
             eq_splits = [x.split('=') for x in comma_split]
-            if debug:
-                print('printing eq_splits')
-                print(eq_splits)
+            self.verboseprint('printing eq_splits')
+            self.verboseprint(eq_splits)
             for idx, sub_param in enumerate(eq_splits):
-                if debug:
-                    print('printing len(sub_param)')
-                    print(len(sub_param))
+                self.verboseprint('printing len(sub_param)')
+                self.verboseprint(len(sub_param))
                 if len(sub_param) < 2:
                     eq_splits[0][1] += f',{sub_param[0]}'
-                    if debug:
-                        print(eq_splits)
+                    self.verboseprint(eq_splits)
             eq_splits = [x for x in eq_splits if len(x) > 1]
             for sub_param in eq_splits:
                 if ',' in sub_param[1]:
-                    val = yaml.safe_load("'" + sub_param[1] + "'")
+                    val = load_quoted_val(sub_param[1])
                 else:
                     val = dont_convert_yaml_val(sub_param[1])
                 self.dict[sub_param[0].strip()] = val
@@ -111,14 +160,12 @@ class Field:
 
     def process_tracer(self, prop, debug):
         """ Process a tracer field """
-        if debug:
-            print(len(prop))
+        self.verboseprint(len(prop))
         if len(prop) > 2:
-            self.dict[prop[0]] = [OrderedDict([('value', prop[1])])]
-            if debug:
-                print(self.name)
-                print(self.field_type)
-                print(prop[2:])
+            self.dict[prop[0]] = [{'value': prop[1]}]
+            self.verboseprint(self.name)
+            self.verboseprint(self.field_type)
+            self.verboseprint(prop[2:])
             for sub_param in prop[2:]:
                 eq_split = sub_param.split('=')
                 if len(eq_split) < 2:
@@ -139,143 +186,225 @@ class Field:
             self.dict[prop[0]] = val
 
 
-def list_items(brief_text, brief_od):
-    """ Given text and an OrderedDict, make an OrderedDict and convert to list """
-    return list(OrderedDict([(brief_text, brief_od)]).items())
+#: Spaces around the commas that separate the values
+COMMA_SPACES = re.compile(" *, *")
 
 
-def listify_ordered_dict(in_list, in_list2, in_od):
-    """ Given two lists and an OrderedDict, return a list of OrderedDicts. Note this function is recursive. """
-    if len(in_list) > 1:
-        x = in_list.pop()
-        y = in_list2.pop()
-        return [OrderedDict(list_items(x, k) +
-                            list_items(y, listify_ordered_dict(in_list, in_list2, v))) for k, v in in_od.items()]
+def clean_field_line(iline):
+    """ Clean up a line of the ascii field table: remove the comment at the end (# inside quotes are kept), the
+        quotes, the tabs, the spaces around the line and around the commas, and the trailing comma """
+    iline = iline.rstrip('\r\n')
+    if '#' in iline:
+        # The quotes are only closed within a line, so the segments outside quotes are the even ones
+        segments = iline.split('"')
+        for i in range(0, len(segments), 2):
+            if '#' in segments[i]:
+                segments = segments[:i] + [segments[i].split('#', 1)[0]]
+                break
+        iline = ''.join(segments)
     else:
-        x = in_list[0]
-        y = in_list2[0]
-        return [OrderedDict(list_items(x, k) + list_items(y, v)) for k, v in in_od.items()]
-
-
-def zip_uneven(in_even, in_odd):
-    """ Re-splice two uneven lists that have been split apart by a stride of 2 """
-    result = [None]*(len(in_even)+len(in_odd))
-    result[::2] = in_even
-    result[1::2] = in_odd
-    return result
-
-
-def pound_signs_within_quotes(in_lines):
-    """ Change pound signs within quotes to the word poundsign so they aren't expunged when eliminating comments. """
-    odds = [x.split('"')[1::2] for x in in_lines]
-    evens = [x.split('"')[::2] for x in in_lines]
-    for idx, line in enumerate(odds):
-        odds[idx] = [re.sub('#', 'poundsign', x) for x in line]
-    newfilelines = [zip_uneven(e, o) for e, o in zip(evens, odds)]
-    return ''.join(['"'.join(x) for x in newfilelines])
+        iline = iline.replace('"', '')
+    iline = iline.replace('\t', '').strip(' ')
+    if ',' in iline:
+        iline = COMMA_SPACES.sub(',', iline)
+    if iline.endswith('/'):
+        iline = iline[:-1].rstrip(' ') + '/'
+    elif iline.endswith(','):
+        iline = iline[:-1]
+    return iline
+
+
+def end_field_entry(entry, last_line):
+    """ Yield the "head" and the "tails" of an entry, given its lines and its last line without the "/" """
+    if last_line:
+        entry.append(last_line)
+    if entry:
+        yield entry[0], entry[1:]
+
+
+def iter_field_entries(filelines):
+    """ Scan the lines of an ascii field table once and yield each entry as its "head" (field_type, model,
+        var_name) and its "tails" (the rest of the lines). Entries end with a "/" at the end of a line or on a
+        line by itself. """
+    entry = []
+    for iline in filelines:
+        iline = clean_field_line(iline)
+        if entry and entry[-1][-1] == '/':
+            if iline[:1] == '/':
+                # The entry ends with the "/" on this line, the one at the end of the previous line is part of
+                # its last value (i.e "name=INPUT/" followed by a line with "/")
+                iline = entry.pop() + iline
+            else:
+                yield from end_field_entry(entry, entry.pop()[:-1])
+                entry = []
+        elif iline[:1] == '/':
+            # A "/" at the start of a line ends the previous line
+            iline = entry.pop() + iline if entry else iline[1:]
+        if iline:
+            entry.append(iline)
+    if entry:
+        # All the "/" at the end of the file are removed
+        yield from end_field_entry(entry, entry.pop().rstrip('/'))
 
 
 def process_field_file(my_file):
     """ Parse ascii field table into nested lists for further processing """
+    heads, tails = [], []
     with open(my_file, 'r') as fh:
-        filelines = fh.readlines()
-    # Change literal pound signs to the word poundsign
-    whole_file = pound_signs_within_quotes(filelines)
-    # Eliminate tabs and quotes
-    whole_file = whole_file.replace('"', '').replace('\t', '')
-    # Eliminate anything after a comment marker (#)
-    whole_file = re.sub("\\#"+r'.*'+"\n", '\n', whole_file)
-    # Replace the word poundsign with a literal pound sign (#)
-    whole_file = re.sub("poundsign", "#", whole_file)
-    # Eliminate extraneous spaces, but not in value names
-    whole_file = re.sub(" *\n *", '\n', whole_file)
-    whole_file = re.sub(" *, *", ',', whole_file)
-    whole_file = re.sub(" */\n", '/\n', whole_file)
-    # Eliminate trailing commas (rude)
-    whole_file = whole_file.replace(',\n', '\n')
-    # Eliminate newline before end of entry
-    whole_file = re.sub("\n/", '/', whole_file)
-    # Eliminate spaces at very beginning and end
-    whole_file = whole_file.strip()
-    # Eliminate very last slash
-    whole_file = whole_file.strip('/')
-    # Split entries based upon the "/" ending character
-    into_lines = [x for x in re.split("/\n", whole_file) if x]
-    # Eliminate blank lines
-    into_lines = [re.sub(r'\n+', '\n', x) for x in into_lines]
-    into_lines = [x[1:] if '\n' in x[:1] else x for x in into_lines]
-    into_lines = [x[:-1] if '\n' in x[-1:] else x for x in into_lines]
-    # Split already split entries along newlines to form nested list
-    nested_lines = [x.split('\n') for x in into_lines]
-    # Split nested lines into "heads" (field_type, model, var_name) and "tails" (the rest)
-    heads = [x[0] for x in nested_lines]
-    tails = [x[1:] for x in nested_lines]
+        for head, tail in iter_field_entries(fh):
+            heads.append(head)
+            tails.append(tail)
     return heads, tails
 
 
+def make_field(head, tails, debug):
+    """ Make the Field of an entry of the field table
+
+    Args:
+        head (str): The field_type, model_type and var_name of the entry
+        tails (list): The rest of the lines of the entry
+        debug (bool): Print the steps of the conversion
+
+    Returns:
+        tuple: The field_type, the model_type and the output yaml of the variable
+    """
+    head_list = [y.lower() for y in head.split(',')]
+    field_type, model_type, name = head_list[0], head_list[1], head_list[2]
+    if 'tracer' == field_type:
+        tails = [x.split(',') for x in tails]
+    my_entry = Field(field_type, (name, tails), debug)
+    return field_type, model_type, {'variable': my_entry.name, **my_entry.dict}
+
+
+def make_fields_chunk(chunk, start, debug):
+    """ Make the Fields of a chunk of the entries of the field table in a worker process, see chunks.py
+
+    Args:
+        chunk (list): The (head, tails) of consecutive entries
+        start (int): Index of the first entry of the chunk
+        debug (bool): Print the steps of the conversion
+
+    Returns:
+        tuple: The output of make_field for each entry and the error that stopped the chunk, or None
+    """
+    fields = []
+    try:
+        for head, tails in chunk:
+            fields.append(make_field(head, tails, debug))
+    except Exception as err:
+        return fields, err
+    return fields, None
+
+
+class FieldTableDumper(yaml.Dumper):
+    """ A yaml Dumper that writes the field_table one model_type block at a time.
+
+    It emits the same events as yaml.dump of the whole table, so the output is the same, but only one block
+    is represented at a time and the yaml is never held in memory as a single string.
+    """
+
+    def write_data(self, data):
+        """ Represent and write one piece of the document """
+        node = self.represent_data(data)
+        self.anchor_node(node)
+        self.serialize_node(node, None, None)
+        self.represented_objects = {}
+        self.object_keeper = []
+        self.serialized_nodes = {}
+        self.anchors = {}
+
+    def write_field_table(self, field_table):
+        """ Write the document {"field_table": field_table} """
+        self.open()
+        self.emit(yaml.DocumentStartEvent())
+        self.emit(yaml.MappingStartEvent(None, None, True, flow_style=False))
+        self.write_data("field_table")
+        self.emit(yaml.SequenceStartEvent(None, None, True, flow_style=False))
+        for field in field_table:
+            self.emit(yaml.MappingStartEvent(None, None, True, flow_style=False))
+            for key, val in field.items():
+                self.write_data(key)
+                if key != "modlist":
+                    self.write_data(val)
+                    continue
+                self.emit(yaml.SequenceStartEvent(None, None, True, flow_style=False))
+                for model in val:
+                    self.write_data(model)
+                self.emit(yaml.SequenceEndEvent())
+            self.emit(yaml.MappingEndEvent())
+        self.emit(yaml.SequenceEndEvent())
+        self.emit(yaml.MappingEndEvent())
+        self.emit(yaml.DocumentEndEvent())
+        self.close()
+
+
+def write_field_table(field_table, myfile):
+    """Write the field_table yaml one model_type block at a time, in the same format as yaml.dump of the
+    whole table
+
+    Args:
+        field_table (list): The field_table, as in the output of field_table_to_dict
+        myfile: The open file to write to
+    """
+    dumper = FieldTableDumper(myfile, default_flow_style=False, sort_keys=False)
+    try:
+        dumper.write_field_table(field_table)
+    finally:
+        dumper.dispose()
+
+
 class FieldYaml:
-    def __init__(self, field_file):
+    def __init__(self, field_file, jobs=1):
         self.filename = field_file
-        self.out_yaml = OrderedDict()
+        self.jobs = jobs  #: Number of processes used to make the Fields, None for the number of cpus
         self.heads, self.tails = process_field_file(self.filename)
 
-    def init_ordered_keys(self):
-        """ Get unique combination of field_type and model... in order provided """
-        self.ordered_keys = OrderedDict.fromkeys([tuple([y.lower() for y in x.split(',')[:2]]) for x in self.heads])
-
-    def initialize_lists(self):
-        """ Initialize out_yaml and ordered_keys """
-        for k in self.ordered_keys.keys():
-            self.ordered_keys[k] = []
-            if k[0] not in self.out_yaml.keys():
-                self.out_yaml[k[0]] = OrderedDict()
-            if k[1] not in self.out_yaml[k[0]].keys():
-                self.out_yaml[k[0]][k[1]] = OrderedDict()
-
-    def populate_entries(self):
-        """ Populate entries as OrderedDicts """
-        for h, t in zip(self.heads, self.tails):
-            head_list = [y.lower() for y in h.split(',')]
-            tail_list = [x.split(',') for x in t]
-            if (head_list[0], head_list[1]) in self.ordered_keys.keys():
-                if 'tracer' == head_list[0]:
-                    self.ordered_keys[(head_list[0], head_list[1])].append((head_list[2], tail_list))
-                else:
-                    self.ordered_keys[(head_list[0], head_list[1])].append((head_list[2], t))
-
     def make_objects(self, debug):
-        """ Make Tracer and Species objects and assign to out_yaml """
-        for k in self.ordered_keys.keys():
-            for j in self.ordered_keys[k]:
-                my_entry = Field(k[0], j, debug)
-                self.out_yaml[k[0]][k[1]][my_entry.name] = my_entry.dict
-
-    def convert_yaml(self):
-        """ Convert to list-style yaml """
-        lists_yaml = listify_ordered_dict(['model_type', 'field_type'], ['varlist', 'modlist'], self.out_yaml)
-        for i in range(len(lists_yaml)):
-            for j in range(len(lists_yaml[i]['modlist'])):
-                lists_yaml[i]['modlist'][j]['varlist'] = [OrderedDict(list(OrderedDict([('variable', k)]).items()) +
-                                                          list(v.items()))
-                                                          for k, v in lists_yaml[i]['modlist'][j]['varlist'].items()]
-        self.lists_wh_yaml = {"field_table": lists_yaml}
+        """ Make the Field objects and add them to the field_table. The fields are grouped by field_type and
+            then by model_type, in the order they first appear. A variable that is defined twice for the same
+            field_type and model_type keeps its first position and gets the attributes of the last one. """
+        jobs = 1
+        if self.jobs != 1:
+            jobs = get_jobs(self.jobs, len(self.heads))
+
+        if jobs == 1:
+            fields = (make_field(h, t, debug) for h, t in zip(self.heads, self.tails))
+        else:
+            #: The entries are already split on their "/", so only making the Fields is done in chunks
+            fields = map_chunks(make_fields_chunk, list(zip(self.heads, self.tails)), jobs, debug)
+
+        field_table = []
+        modlists = {}  #: The modlist of each field_type, keyed by field_type
+        varlists = {}  #: The varlist of each (field_type, model_type) and the position of each variable in it
+        for field_type, model_type, var in fields:
+            if (field_type, model_type) not in varlists:
+                if field_type not in modlists:
+                    modlists[field_type] = []
+                    field_table.append({'field_type': field_type, 'modlist': modlists[field_type]})
+                varlists[(field_type, model_type)] = ([], {})
+                modlists[field_type].append({'model_type': model_type,
+                                             'varlist': varlists[(field_type, model_type)][0]})
+            varlist, positions = varlists[(field_type, model_type)]
+
+            name = var['variable']
+            if name in positions:
+                varlist[positions[name]] = var
+            else:
+                positions[name] = len(varlist)
+                varlist.append(var)
+        self.lists_wh_yaml = {"field_table": field_table}
 
     def writeyaml(self, output_yaml="field_table.yaml", force_write=False):
         """ Write yaml out to file """
-        raw_out = yaml.dump(self.lists_wh_yaml, None, default_flow_style=False, sort_keys=False)
         out_file_op = "x"  # Exclusive write
         if force_write:
             out_file_op = "w"
 
         with open(output_yaml, out_file_op) as yaml_file:
-            yaml_file.write(raw_out)
+            write_field_table(self.lists_wh_yaml["field_table"], yaml_file)
 
     def main(self, debug):
-        self.init_ordered_keys()
-        self.initialize_lists()
-        self.populate_entries()
         self.make_objects(debug)
-        self.convert_yaml()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Canonical hashes of yaml objects, used by the combiners to find exact duplicates.
+
+Objects that are equal (==) have the same fingerprint: the keys of a dictionary are hashed in any order and
+scalars are hashed with python's hash, which is the same for equal numbers (1, 1.0 and True), as are the
+dictionaries that only have scalars. Objects with
+the same fingerprint are almost certainly equal, so the combiners look them up by fingerprint and only
+compare the objects (which walks them entirely when they are equal) when the fingerprints match:
+
+    fingerprints = Fingerprints()
+    if fingerprints.same(entry, new_entry):
+        ...
+
+The fingerprints of the dictionaries and lists are cached by object, so the fingerprint of an entry is
+computed once however many times it is compared. The combiners modify the entries they merge new variables
+into: they append the variables with Fingerprints.append, which updates the fingerprint of the list without
+going through the whole list again, and forget the dictionaries that contain the list. The fingerprints use
+python's hash, so they are only valid in the process that computed them.
+"""
+
+#: The fingerprint of an empty list, and the multiplier and mask used to add an item to the fingerprint of
+#: a list (the items are combined in order, so that the fingerprint can be updated when one is appended)
+LIST_SEED = 0x345678
+LIST_MULTIPLIER = 1000003
+MASK = (1 << 64) - 1
+
+
+class Fingerprints:
+    """ The fingerprints of yaml objects, cached by object """
+
+    def __init__(self):
+        #: The (object, fingerprint) of each dictionary and list, by id. The object is kept so its id is not
+        #: reused while it is in the cache
+        self.cache = {}
+
+    def get(self, obj):
+        """ Return the fingerprint (an int) of obj, a yaml object (dictionaries, lists, sets and scalars) """
+        if not isinstance(obj, (dict, list, set)):
+            return hash(obj)
+        cached = self.cache.get(id(obj))
+        if cached is not None:
+            return cached[1]
+
+        if isinstance(obj, dict):
+            try:
+                # Most entries only have scalars, which python hashes without going through them one by one
+                fingerprint = hash(frozenset(obj.items()))
+            except TypeError:
+                fingerprint = hash(frozenset((key, self.get(val)) for key, val in obj.items()))
+        elif isinstance(obj, set):
+            fingerprint = hash(frozenset(obj))
+        else:
+            fingerprint = LIST_SEED
+            for val in obj:
+                fingerprint = self._add_item(fingerprint, val)
+        self.cache[id(obj)] = (obj, fingerprint)
+        return fingerprint
+
+    def _add_item(self, fingerprint, item):
+        """ Return the fingerprint of a list after item is appended to it """
+        return ((fingerprint * LIST_MULTIPLIER) ^ self.get(item)) & MASK
+
+    def append(self, items, item):
+        """ Append item to the list items, updating the fingerprint of the list if it was computed.
+        The dictionaries and lists that contain the list need to be forgotten
+        """
+        items.append(item)
+        cached = self.cache.get(id(items))
+        if cached is not None:
+            self.cache[id(items)] = (items, self._add_item(cached[1], item))
+
+    def forget(self, *objs):
+        """ Forget the fingerprints of objects that were modified """
+        for obj in objs:
+            self.cache.pop(id(obj), None)
+
+    def same(self, obj1, obj2):
+        """ Return True if obj1 == obj2, comparing them only if their fingerprints are the same """
+        return obj1 is obj2 or (self.get(obj1) == self.get(obj2) and obj1 == obj2)
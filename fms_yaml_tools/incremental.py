@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Combine yamls incrementally, only parsing the inputs that changed since the last combine.
+
+With --incremental, the combiners keep a manifest next to the output yaml (<output-yaml>.manifest) with:
+    - the path and the sha256 of each input, in order
+    - the tables each input contributed, as they were parsed from it
+    - the sha256 of the output yaml that was written
+
+If the inputs are the same, in the same order, and the output yaml was not modified, the output is reused
+without parsing anything. Otherwise only the inputs that changed are parsed, the others are taken from the
+manifest, and all of them are merged again in order: what an input contributes depends on the inputs before
+it, so this keeps the output identical to a combine from scratch, while skipping the parsing that takes most
+of the time.
+
+The manifest is JSON, and each table is stored as a JSON string that is only loaded if its input did not
+change. JSON is loaded much faster than yaml, but it does not have all the values of yaml.safe_load, so
+those are stored as objects with a TAG key (see dump_table). That includes the objects that are used more
+than once in a table (yaml anchors and aliases), as yaml.dump writes them as aliases in the output.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import os
+from functools import partial
+import yaml
+from . import __version__
+from .load_yamls import iter_yaml_loaders
+
+#: The suffix added to the output yaml for the name of the manifest
+MANIFEST_SUFFIX = ".manifest"
+#: Version of the format of the manifest, manifests with another version are ignored
+MANIFEST_VERSION = 2
+#: Key of the JSON objects that stand for the values that JSON does not have
+TAG = "!fms_yaml_tools"
+#: Values that are the same in JSON, and that yaml.dump never writes as aliases
+ATOMIC_TYPES = (str, int, float, bool, type(None))
+
+
+def hash_file(file_name):
+    """ Return the sha256 of a file, or None if it can't be read """
+    digest = hashlib.sha256()
+    try:
+        with open(file_name, "rb") as fh:
+            for block in iter(partial(fh.read, 1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def read_hashed_yaml(file_name):
+    """ Read and parse a yaml file, return the sha256 of the bytes that were parsed and the parsed yaml """
+    with open(file_name, "rb") as fh:
+        data = fh.read()
+    return hashlib.sha256(data).hexdigest(), yaml.safe_load(data)
+
+
+def find_shared(table):
+    """ Return the ids of the objects that are used more than once in a table, and whether the table only
+        has lists, dictionaries with string keys and ATOMIC_TYPES, so it can be dumped to JSON as it is """
+    seen = set()
+    shared = set()
+    is_plain = True
+    stack = [table]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, ATOMIC_TYPES):
+            continue
+        if id(obj) in seen:
+            shared.add(id(obj))
+            is_plain = False
+            continue
+        seen.add(id(obj))
+        if type(obj) is dict:
+            if TAG in obj or not all(type(key) is str for key in obj):
+                is_plain = False
+            stack.extend(obj)
+            stack.extend(obj.values())
+        elif type(obj) is list:
+            stack.extend(obj)
+        else:
+            is_plain = False
+            if isinstance(obj, (set, tuple)):
+                stack.extend(obj)
+    return shared, is_plain
+
+
+def encode(obj, shared, anchors):
+    """ Return obj with the values that JSON does not have replaced by objects with a TAG key
+
+    Args:
+        obj: The value to encode
+        shared (set): The ids of the objects used more than once, the first one gets an anchor and the next
+                      ones are aliases to it
+        anchors (dict): The anchor of each shared object that was already encoded
+    """
+    if isinstance(obj, ATOMIC_TYPES):
+        return obj
+    if id(obj) in anchors:
+        return {TAG: "alias", "anchor": anchors[id(obj)]}
+    is_shared = id(obj) in shared
+    if not is_shared:
+        if type(obj) is list:
+            return [encode(val, shared, anchors) for val in obj]
+        if type(obj) is dict and TAG not in obj and all(type(key) is str for key in obj):
+            return {key: encode(val, shared, anchors) for key, val in obj.items()}
+
+    node = {}
+    if is_shared:
+        # The anchor is set before the items, so they can refer to the object
+        anchors[id(obj)] = node["anchor"] = len(anchors)
+    if isinstance(obj, dict):
+        node[TAG] = "map"
+        node["items"] = [[encode(key, shared, anchors), encode(val, shared, anchors)] for key, val in obj.items()]
+    elif isinstance(obj, (list, set, tuple)):
+        node[TAG] = type(obj).__name__
+        node["items"] = [encode(val, shared, anchors) for val in obj]
+    elif isinstance(obj, (datetime.date, datetime.datetime)):
+        node[TAG] = type(obj).__name__
+        node["value"] = obj.isoformat()
+    elif isinstance(obj, bytes):
+        node[TAG] = "binary"
+        node["value"] = base64.b64encode(obj).decode("ascii")
+    else:
+        raise TypeError("Can not store a " + type(obj).__name__ + " in the manifest")
+    return node
+
+
+def decode(obj, anchors):
+    """ Return the value of an object returned by encode, after it is loaded from JSON """
+    if type(obj) is list:
+        return [decode(val, anchors) for val in obj]
+    if type(obj) is not dict:
+        return obj
+    kind = obj.get(TAG)
+    if kind is None:
+        return {key: decode(val, anchors) for key, val in obj.items()}
+    if kind == "alias":
+        return anchors[obj["anchor"]]
+
+    if kind == "map":
+        value = {}
+    elif kind == "list":
+        value = []
+    elif kind == "set":
+        value = set()
+    elif kind == "tuple":
+        value = tuple(decode(val, anchors) for val in obj["items"])
+    elif kind == "date":
+        value = datetime.date.fromisoformat(obj["value"])
+    elif kind == "datetime":
+        value = datetime.datetime.fromisoformat(obj["value"])
+    elif kind == "binary":
+        value = base64.b64decode(obj["value"])
+    else:
+        raise ValueError("Unknown value in the manifest: " + str(kind))
+    if "anchor" in obj:
+        anchors[obj["anchor"]] = value
+
+    if kind == "map":
+        for key, val in obj["items"]:
+            key = decode(key, anchors)
+            value[key] = decode(val, anchors)
+    elif kind == "list":
+        value.extend(decode(val, anchors) for val in obj["items"])
+    elif kind == "set":
+        value.update(decode(val, anchors) for val in obj["items"])
+    return value
+
+
+def dump_table(table):
+    """ Return the JSON string of a table, as returned by yaml.safe_load """
+    shared, is_plain = find_shared(table)
+    if not is_plain:
+        table = encode(table, shared, {})
+    return json.dumps(table, separators=(",", ":"))
+
+
+def load_table(text):
+    """ Return the table of a JSON string returned by dump_table """
+    table = json.loads(text)
+    if TAG in text:
+        table = decode(table, {})
+    return table
+
+
+class Manifest:
+    """ The manifest of the last combine to an output yaml, and the one of the current combine """
+
+    def __init__(self, output_yaml, table_name, files):
+        """
+        Args:
+            output_yaml (str): Path to the output yaml
+            table_name (str): The table that is combined (diag_table, data_table or field_table)
+            files (list): Paths to the input yamls, in order
+        """
+        self.output_yaml = output_yaml
+        self.manifest_file = output_yaml + MANIFEST_SUFFIX
+        self.table_name = table_name
+        #: The path and the sha256 of each input. The sha256 of the inputs that are parsed is replaced by the
+        #: one of the bytes that were parsed, in case the file is modified in between
+        self.inputs = [[file_name, hash_file(file_name)] for file_name in files]
+        self.previous = self.read()
+        #: The JSON string of the table of each input of the current combine, by sha256
+        self.tables = {}
+
+    def read(self):
+        """ Read the manifest of the last combine, return None if there is none or it can't be used """
+        try:
+            with open(self.manifest_file) as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION or
+                manifest.get("table_name") != self.table_name or manifest.get("tools_version") != __version__ or
+                not isinstance(manifest.get("tables"), dict)):
+            return None
+        return manifest
+
+    def owns_output(self):
+        """ Return True if the output yaml is the one written by the last combine """
+        return self.previous is not None and hash_file(self.output_yaml) == self.previous.get("output")
+
+    def is_up_to_date(self):
+        """ Return True if the inputs did not change since the last combine and the output can be reused """
+        return (self.owns_output() and all(sha for _, sha in self.inputs) and
+                self.inputs == self.previous.get("inputs"))
+
+    def iter_yaml_loaders(self, jobs=1):
+        """ Same as load_yamls.iter_yaml_loaders, but the tables of the inputs that did not change are taken
+        from the manifest and only the others are parsed (in a pool of jobs processes)
+        """
+        previous_tables = self.previous["tables"] if self.previous is not None else {}
+        changed = [file_name for file_name, sha in self.inputs if sha not in previous_tables]
+        parsed = iter_yaml_loaders(changed, jobs, read_hashed_yaml)
+        for ifile, (file_name, sha) in enumerate(self.inputs):
+            if sha in previous_tables:
+                yield file_name, partial(self.load_previous, sha, previous_tables[sha])
+            else:
+                _, load = next(parsed)
+                yield file_name, partial(self.load_parsed, ifile, load)
+
+    def load_previous(self, sha, text):
+        self.tables[sha] = text
+        return load_table(text)
+
+    def load_parsed(self, ifile, load):
+        sha, table = load()
+        self.inputs[ifile][1] = sha
+        # The tables are dumped before they are merged, as the merge modifies them
+        self.tables[sha] = dump_table(table)
+        return table
+
+    def write(self):
+        """ Write the manifest of the current combine, after the output yaml is written """
+        manifest = {"version": MANIFEST_VERSION, "table_name": self.table_name, "tools_version": __version__,
+                    "inputs": self.inputs, "output": hash_file(self.output_yaml), "tables": self.tables}
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as fh:
+            json.dump(manifest, fh, indent=1)
+        os.replace(tmp_file, self.manifest_file)
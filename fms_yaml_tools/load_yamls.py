@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+""" Parse the input yamls of the combiners in a pool of processes.
+
+yaml.safe_load is pure python, so parsing the inputs takes most of the time of a combine. The files are
+parsed in a pool of processes while the tables that are ready are combined, in the order of the files.
+Each file is parsed in the process, up to READ_AHEAD files per process ahead of the file being combined,
+so reading the files overlaps with parsing and combining them without holding every table in memory.
+
+The combiners get a `load` function for each file that returns the parsed yaml or raises the error of
+yaml.safe_load, so the errors are handled in the same order and in the same way as when the files are
+parsed one after another:
+
+    for file_name, load in iter_yaml_loaders(files, jobs):
+        try:
+            table = load()
+        except yaml.YAMLError:
+            ...
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import cpu_count
+import yaml
+
+#: Number of files per process that are parsed ahead of the file being combined
+READ_AHEAD = 2
+
+
+def read_yaml(file_name):
+    """ Read and parse a yaml file """
+    with open(file_name) as fh:
+        return yaml.safe_load(fh)
+
+
+def iter_yaml_loaders(files, jobs=1, read=read_yaml):
+    """ Yield a function that returns the parsed yaml of each file, in the order of the files
+
+    Args:
+        files (list): Paths to the yaml files
+        jobs (int): Number of processes, None for the number of cpus. With one process (or one file), each
+                    file is parsed when its function is called
+        read (function): Function that reads and parses a file, called in the processes with the path of the
+                         file. It needs to be defined at the top level of a module, so it can be pickled
+
+    Yields:
+        tuple: The path of the file and a function without arguments that returns its parsed yaml (what read
+               returns), or raises the error from reading or parsing it
+    """
+    if jobs is None:
+        jobs = cpu_count() or 1
+    jobs = min(jobs, len(files))
+    if jobs <= 1:
+        for file_name in files:
+            yield file_name, partial(read, file_name)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        to_submit = deque(files)
+
+        def submit_next():
+            file_name = to_submit.popleft()
+            pending.append((file_name, executor.submit(read, file_name)))
+
+        try:
+            while to_submit and len(pending) < jobs * READ_AHEAD:
+                submit_next()
+            while pending:
+                file_name, future = pending.popleft()
+                if to_submit:
+                    submit_next()
+                yield file_name, future.result
+        finally:
+            #: Do not wait for the files after an error
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+""" Debug messages shared by the converters and the combiners.
+
+The tools print their steps with a `verboseprint` function that is created from the --debug option.
+Messages are only formatted when debug is enabled, so expensive messages (like the yaml of an entry)
+should be passed as a LazyYaml instead of being built before the call:
+
+    verboseprint = get_verboseprint(debug)
+    verboseprint("---> Working on the entry:")
+    verboseprint(LazyYaml(entry))
+"""
+
+import logging
+import yaml
+
+LOGGER_NAME = "fms_yaml_tools"
+
+
+class _PrintHandler(logging.Handler):
+    """ Print the messages to whatever sys.stdout is when they are emitted """
+
+    def emit(self, record):
+        print(self.format(record))
+
+
+def _get_logger():
+    """ Return the logger used by the tools, adding its handler the first time """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = _PrintHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
+
+
+def no_verboseprint(*args, **kwargs):
+    """ Ignore the message, used when debug is disabled """
+    return None
+
+
+def get_verboseprint(debug):
+    """ Return the function used to print the debug messages
+
+    Args:
+        debug (bool): Whether the debug messages are printed
+
+    Returns:
+        A function with the same arguments as logging.debug (a message and its %-style arguments).
+        When debug is False it does nothing, so the arguments are never formatted.
+    """
+    if not debug:
+        return no_verboseprint
+    logger = _get_logger()
+    logger.setLevel(logging.DEBUG)
+    return logger.debug
+
+
+class LazyYaml:
+    """ An object that is only converted to yaml when the debug message that contains it is printed """
+    __slots__ = ("obj", "kwargs")
+
+    def __init__(self, obj, **kwargs):
+        """
+        Args:
+            obj: The object to dump
+            kwargs: Arguments passed to yaml.dump (i.e sort_keys=False)
+        """
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return yaml.dump(self.obj, **self.kwargs)
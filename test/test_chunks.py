@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import unittest
+
+from fms_yaml_tools.chunks import get_jobs, map_chunks, split_chunks, MIN_CHUNK_LINES
+
+
+def double_chunk(chunk, start, stop_at):
+    """ Double each number, stopping with an error at stop_at """
+    results = []
+    try:
+        for i, line in enumerate(chunk, start=start):
+            if i == stop_at:
+                raise ValueError("bad line " + str(i))
+            results.append(line * 2)
+    except Exception as err:
+        return results, err
+    return results, None
+
+
+class TestChunks(unittest.TestCase):
+    def test_get_jobs(self):
+        self.assertEqual(get_jobs(4, MIN_CHUNK_LINES - 1), 1)
+        self.assertEqual(get_jobs(4, MIN_CHUNK_LINES * 2), 2)
+        self.assertEqual(get_jobs(4, MIN_CHUNK_LINES * 10), 4)
+        self.assertGreaterEqual(get_jobs(None, MIN_CHUNK_LINES * 10), 1)
+
+    def test_split_chunks(self):
+        chunks = list(split_chunks(list(range(10)), 4))
+        self.assertEqual([start for _, start in chunks], [0, 3, 6, 9])
+        self.assertEqual(sum([chunk for chunk, _ in chunks], []), list(range(10)))
+
+    def test_map_chunks(self):
+        lines = list(range(50))
+        self.assertEqual(list(map_chunks(double_chunk, lines, 2, None)), [line * 2 for line in lines])
+
+        #: The results before the error are yielded and then the error of the first bad chunk is raised
+        results = []
+        with self.assertRaises(ValueError) as context:
+            for result in map_chunks(double_chunk, lines, 2, 17):
+                results.append(result)
+        self.assertEqual(str(context.exception), "bad line 17")
+        self.assertEqual(results, [line * 2 for line in range(17)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,17 +24,24 @@ import copy
 import tempfile
 import os
 import pathlib
+import random
 import yaml
 from contextlib import contextmanager
 from click.testing import CliRunner
 
 from fms_yaml_tools.diag_table.combine_diag_table_yamls import (
+    CombineIndex,
     DuplicateFieldError,
     DuplicateKeyError,
     DuplicateOptionalKeyError,
     InconsistentKeys,
+    combine_tables,
     combine_yaml,
     combine_diag_table_yaml,
+    is_field_duplicate,
+    is_file_duplicate,
+    is_module_duplicate,
+    is_outputname_different,
 )
 
 from utils.test_constants import (
@@ -60,6 +67,10 @@ from utils.test_classes import (
 )
 
 
+def no_print(*args):
+    pass
+
+
 @contextmanager
 def test_directory(tmp_path: pathlib.Path):
     """Set the cwd to the path
@@ -462,6 +473,94 @@ class TestCombineDiagTable(unittest.TestCase):
                     msg="Combined YAML output does not match expected structure.",
                 )
 
+    # Combining many tables, each file is merged with the one with the same file_name
+    def test_combine_many_tables(self):
+        def diag_file(file_name, var_names):
+            return {"file_name": file_name, "freq": "1 days", "time_units": "hours", "unlimdim": "time",
+                    "varlist": [{"module": "ocn_mod", "var_name": var_name, "reduction": "average",
+                                 "kind": "r4"} for var_name in var_names]}
+
+        tables = [{"title": "test", "base_date": "2 1 1 0 0 0",
+                   "diag_files": [diag_file("file" + str(ifile), ["var" + str(itable)]) for ifile in range(20)] +
+                                 [diag_file("file0", ["var" + str(itable)])]}
+                  for itable in range(5)]
+        combined = combine_tables(copy.deepcopy(tables), print)
+        self.assertEqual([entry["file_name"] for entry in combined["diag_files"]],
+                         ["file" + str(ifile) for ifile in range(20)])
+        for entry in combined["diag_files"]:
+            self.assertEqual([var["var_name"] for var in entry["varlist"]],
+                             ["var" + str(itable) for itable in range(5)])
+
+        # Without the index, the files are looked up in the list
+        diag_files = copy.deepcopy(combined["diag_files"])
+        self.assertTrue(is_file_duplicate(diag_files, diag_file("file3", ["var9"]), print))
+        self.assertFalse(is_file_duplicate(diag_files, diag_file("file20", ["var9"]), print))
+        self.assertEqual(diag_files[3]["varlist"][-1]["var_name"], "var9")
+
+    # The index finds the same duplicates and conflicts as comparing the variable with every variable
+    def test_field_duplicate_index(self):
+        def check_every_variable(varlist, new_entry):
+            for entry in varlist:
+                if entry == new_entry:
+                    return True
+                if entry['var_name'] != new_entry['var_name'] or entry.get('module') != new_entry.get('module'):
+                    continue
+                if not is_outputname_different(entry, new_entry, no_print):
+                    return "conflict"
+            return False
+
+        def check_with_index(varlist, new_entry, index):
+            try:
+                return is_field_duplicate(varlist, new_entry, "file", no_print, index)
+            except DuplicateFieldError:
+                return "conflict"
+
+        def random_variable():
+            var = {"var_name": rng.choice(["a", "b"]), "reduction": rng.choice(["average", "min"])}
+            module = rng.choice([None, "ocn_mod", "atm_mod"])
+            if module:
+                var["module"] = module
+            output_name = rng.choice([None, var["var_name"], "x", "y"])
+            if output_name:
+                var["output_name"] = output_name
+            return var
+
+        rng = random.Random(0)
+        for _ in range(2000):
+            varlist = [random_variable() for _ in range(rng.randint(0, 6))]
+            index = CombineIndex()
+            for _ in range(3):
+                new_entry = random_variable()
+                expected = check_every_variable(varlist, new_entry)
+                self.assertEqual(check_with_index(varlist, new_entry, index), expected, msg=str(varlist))
+                self.assertEqual(check_with_index(varlist, new_entry, None), expected, msg=str(varlist))
+                if expected is False:
+                    varlist.append(new_entry)
+
+    # All the new variables of a module block are added to the existing one
+    def test_module_new_variables(self):
+        diag_modules = [{"module": "ocn_mod", "varlist": [{"var_name": "var0"}]}]
+        module = {"module": "ocn_mod", "varlist": [{"var_name": "var0"}, {"var_name": "var1"},
+                                                   {"var_name": "var2"}]}
+        self.assertTrue(is_module_duplicate(diag_modules, module, "file", no_print))
+        self.assertEqual(diag_modules, [module])
+        self.assertFalse(is_module_duplicate(diag_modules, {"module": "atm_mod", "varlist": []}, "file", no_print))
+
+    # Parsing the yamls in a pool of processes gives the same table and the same errors
+    def test_combine_jobs(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                yaml_file_names = create_base_input_yaml(output_name1="tdata_average",
+                                                         output_name2="tdata_min").create_input()
+                self.assertEqual(combine_yaml(yaml_file_names, print, jobs=2),
+                                 combine_yaml(yaml_file_names, print, jobs=1))
+
+                with open("bad.yaml", "w") as f:
+                    f.write('title: "this is not going to work')
+                with self.assertRaises(Exception) as context:
+                    combine_yaml(yaml_file_names + ["bad.yaml", "missing.yaml"], print, jobs=2)
+                self.assertIn("Please verify that the previous entry", str(context.exception))
+
     # Test the full combine cli
     def test_combine_yaml_cli(self):
         with tempfile.TemporaryDirectory() as testdir:
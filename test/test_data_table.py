@@ -3,8 +3,10 @@ import tempfile
 import os
 import pathlib
 from contextlib import contextmanager
+from unittest import mock
 
-from fms_yaml_tools.data_table.data_table_to_yaml import DataType
+from fms_yaml_tools import TableParseError, chunks
+from fms_yaml_tools.data_table.data_table_to_yaml import DataType, data_table_to_dict
 
 EXAMPLE_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), 'examples'))
@@ -171,6 +173,73 @@ class TestDataTable(unittest.TestCase):
         self.assertListEqual(test_dt.data_type['data_table'],
                              dt_verify)
 
+    def test_parse_data_table_quotes(self):
+        """Test that commas and pound signs inside quotes are part of the value"""
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with open('data_table', 'w') as f:
+                    f.write('"OCN", "sst", "sst", "INPUT/sst,v2#1.nc", "bilinear", 1.0 # comment, with comma\n'
+                            '"OCN", "sss", "sss", "INPUT/sss.nc", "bilinear", 1.0, "10.0, 20.0, 80.0, 100.0", '
+                            '"inside_region"\n')
+                test_dt = DataType()
+                test_dt.read_and_parse_data_table()
+
+        entries = test_dt.data_type['data_table']
+        self.assertEqual(entries[0]['override_file'][0]['file_name'], "INPUT/sst,v2#1.nc")
+        self.assertEqual(entries[0]['factor'], 1.0)
+        self.assertEqual(entries[1]['subregion'],
+                         [{'lon_start': 10.0, 'lon_end': 20.0, 'lat_start': 80.0, 'lat_end': 100.0,
+                           'type': 'inside_region'}])
+
+    def test_parse_data_table_bad_line(self):
+        """Test that the line number of a bad line is reported"""
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with open('data_table', 'w') as f:
+                    f.write('"OCN", "sst", "sst", "INPUT/sst.nc", "bilinear", 1.0\n'
+                            '"OCN", "sss", "sss", "INPUT/sss.nc, "bilinear", 1.0\n'
+                            '"OCN", "ssh", "ssh", "INPUT/ssh.nc", "bilinear", 1.0\n')
+                test_dt = DataType()
+                with self.assertRaises(TableParseError) as context:
+                    test_dt.read_and_parse_data_table()
+        self.assertEqual(context.exception.lineno, 2)
+
+    def test_stream_data_table(self):
+        """Test that streaming the data_table writes the same yaml as converting it"""
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                DataType(os.path.join(EXAMPLE_DIR, 'data_table'), 'converted.yaml').convert_data_table()
+                DataType(os.path.join(EXAMPLE_DIR, 'data_table'), 'streamed.yaml').stream_data_table()
+                with open('converted.yaml') as f1, open('streamed.yaml') as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+    def test_data_table_to_dict(self):
+        """Test converting a data_table in memory"""
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                data_table = data_table_to_dict(os.path.join(EXAMPLE_DIR, 'data_table'))
+                self.assertEqual(os.listdir(), [])
+
+        test_dt = DataType(os.path.join(EXAMPLE_DIR, 'data_table'))
+        test_dt.read_and_parse_data_table()
+        self.assertEqual(data_table, test_dt.data_type)
+
+    def test_data_table_jobs(self):
+        """Test that parsing the data_table in chunks gives the same entries and errors as the serial parse"""
+        with open(os.path.join(EXAMPLE_DIR, 'data_table')) as fh:
+            content = fh.read()
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir), mock.patch.object(chunks, 'MIN_CHUNK_LINES', 2):
+                with open('data_table', 'w') as fh:
+                    fh.write(content * 3)
+                self.assertEqual(data_table_to_dict('data_table', jobs=3), data_table_to_dict('data_table'))
+
+                with open('data_table', 'w') as fh:
+                    fh.write(content * 2 + '"ATM", "x"\n' + content)
+                with self.assertRaises(TableParseError) as context:
+                    data_table_to_dict('data_table', jobs=3)
+                self.assertEqual(context.exception.lineno, content.count('\n') * 2 + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
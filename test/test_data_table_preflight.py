@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import os
+import struct
+import tempfile
+import unittest
+
+from fms_yaml_tools.data_table.data_table_preflight import check_override_files
+from fms_yaml_tools.data_table.netcdf_header import (NetCDFHeaderError, get_header, parse_header,
+                                                     read_header)
+
+
+def write_classic_header(path, version, dimensions, variables, attribute=True):
+    """ Write the header of a NetCDF classic file, as in the format specification
+
+    Args:
+        version (int): 1, 2 or 5
+        dimensions (list): The (name, length) of the dimensions
+        variables (list): The (name, dimids) of the variables, all of them are NC_FLOAT
+        attribute (bool): Add a text attribute to the file and the variables
+    """
+    count = ">Q" if version == 5 else ">I"
+    offset = ">I" if version == 1 else ">Q"
+
+    def name(value):
+        value = value.encode()
+        return struct.pack(count, len(value)) + value + b"\0" * (-len(value) % 4)
+
+    def attributes():
+        if not attribute:
+            return struct.pack(">I", 0) + struct.pack(count, 0)
+        return (struct.pack(">I", 12) + struct.pack(count, 1) + name("units") + struct.pack(">I", 2) +
+                struct.pack(count, 1) + b"K\0\0\0")
+
+    header = b"CDF" + bytes([version]) + struct.pack(count, 0)
+    header += struct.pack(">I", 10) + struct.pack(count, len(dimensions))
+    header += b"".join(name(dim) + struct.pack(count, length) for dim, length in dimensions)
+    header += attributes()
+    header += struct.pack(">I", 11) + struct.pack(count, len(variables))
+    for var, dimids in variables:
+        header += name(var) + struct.pack(count, len(dimids)) + b"".join(struct.pack(count, i) for i in dimids)
+        header += attributes() + struct.pack(">I", 5) + struct.pack(count, 4) + struct.pack(offset, 0)
+    with open(path, "wb") as fh:
+        fh.write(header)
+
+
+DIMENSIONS = [("time", 0), ("lat", 180), ("lon", 360)]
+VARIABLES = [("time", [0]), ("sst", [0, 1, 2]), ("ice", [0, 1, 2])]
+
+
+class TestNetCDFHeader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_classic_versions(self):
+        for version in (1, 2, 5):
+            for attribute in (True, False):
+                path = os.path.join(self.dir, "sst.nc")
+                write_classic_header(path, version, DIMENSIONS, VARIABLES, attribute)
+                header = read_header(path)
+                self.assertEqual(header.format, "CDF-" + str(version))
+                self.assertEqual(header.dimensions, {"time": None, "lat": 180, "lon": 360})
+                self.assertEqual(header.variables, {"time": ("time",), "sst": ("time", "lat", "lon"),
+                                                    "ice": ("time", "lat", "lon")})
+
+    def test_netcdf4(self):
+        header = parse_header(b"\x89HDF\r\n\x1a\n" + b"\0" * 100)
+        self.assertEqual(header.format, "NetCDF-4")
+        self.assertIsNone(header.variables)
+
+    def test_invalid(self):
+        path = os.path.join(self.dir, "sst.nc")
+        write_classic_header(path, 2, DIMENSIONS, VARIABLES)
+        with open(path, "rb") as fh:
+            contents = fh.read()
+        for bad in (b"", b"not a netcdf file", b"CDF\x03" + contents[4:], contents[:-10]):
+            with open(path, "wb") as fh:
+                fh.write(bad)
+            with self.assertRaises(NetCDFHeaderError):
+                read_header(path)
+
+    def test_cache(self):
+        path = os.path.join(self.dir, "sst.nc")
+        write_classic_header(path, 1, DIMENSIONS, VARIABLES)
+        header = get_header(path)
+        self.assertIs(get_header(path), header)
+
+        write_classic_header(path, 1, DIMENSIONS, VARIABLES[:2])
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(list(get_header(path).variables), ["time", "sst"])
+
+
+class TestDataTablePreflight(unittest.TestCase):
+    def test_check_override_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for file_name in ("sst_1999.nc", "sst_2000.nc"):
+                write_classic_header(os.path.join(tmpdir, file_name), 2, DIMENSIONS, VARIABLES)
+            with open(os.path.join(tmpdir, "chl.nc"), "wb") as fh:
+                fh.write(b"\x89HDF\r\n\x1a\n" + b"\0" * 100)
+
+            data_table = {'data_table': [
+                {'grid_name': 'OCN', 'fieldname_in_model': 'sst', 'factor': 1.0,
+                 'override_file': [{'file_name': 'sst_2000.nc', 'fieldname_in_file': 'sst',
+                                    'interp_method': 'bilinear',
+                                    'multi_file': [{'prev_file_name': 'sst_1999.nc',
+                                                    'next_file_name': 'sst_2001.nc'}]}]},
+                {'grid_name': 'ICE', 'fieldname_in_model': 'sic', 'factor': 0.01,
+                 'override_file': [{'file_name': 'sst_2000.nc', 'fieldname_in_file': 'sic',
+                                    'interp_method': 'bilinear'}]},
+                {'grid_name': 'OCN', 'fieldname_in_model': 'chl', 'factor': 1.0,
+                 'override_file': [{'file_name': 'chl.nc', 'fieldname_in_file': 'chl', 'interp_method': 'none'}]},
+                {'grid_name': 'ATM', 'fieldname_in_model': 'co2', 'factor': 280.0}]}
+
+            problems, notes = check_override_files(data_table, tmpdir, jobs=4)
+            self.assertEqual(problems, ["sst: sst_2001.nc does not exist",
+                                        "sic: sic is not a variable in sst_2000.nc"])
+            self.assertEqual(notes, ["chl.nc is a NetCDF-4 file, its variables were not checked"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import os
+import tempfile
+import unittest
+from click.testing import CliRunner
+
+from fms_yaml_tools.data_table.data_table_preflight import data_table_preflight
+from fms_yaml_tools.data_table.data_table_report import data_table_report, get_file_stats, format_report
+
+DATA_TABLE = {'data_table': [
+    {'grid_name': 'OCN', 'fieldname_in_model': 'sst', 'factor': 1.0,
+     'override_file': [{'file_name': 'sst_2000.nc', 'fieldname_in_file': 'sst', 'interp_method': 'bilinear',
+                        'multi_file': [{'prev_file_name': 'sst_1999.nc', 'next_file_name': 'sst_2001.nc'}]}]},
+    {'grid_name': 'ICE', 'fieldname_in_model': 'sic', 'factor': 0.01,
+     'override_file': [{'file_name': 'sst_2000.nc', 'fieldname_in_file': 'ice', 'interp_method': 'bilinear'}]},
+    {'grid_name': 'OCN', 'fieldname_in_model': 'chl', 'factor': 1.0,
+     'subregion': [{'lon_start': 0.0, 'lon_end': 10.0, 'lat_start': 0.0, 'lat_end': 10.0,
+                    'type': 'inside_region'}],
+     'override_file': [{'file_name': 'chl.nc', 'fieldname_in_file': 'chl', 'interp_method': 'none'}]},
+    {'grid_name': 'ATM', 'fieldname_in_model': 'co2', 'factor': 280.0}]}
+
+
+class TestDataTableReport(unittest.TestCase):
+    def test_file_stats(self):
+        nentries, nconstant, files = get_file_stats(DATA_TABLE)
+        self.assertEqual((nentries, nconstant), (4, 1))
+        self.assertEqual(list(files), ['sst_2000.nc', 'sst_1999.nc', 'sst_2001.nc', 'chl.nc'])
+        self.assertEqual(files['sst_2000.nc']['grids'], {'OCN': ['sst'], 'ICE': ['sic']})
+        self.assertEqual(files['sst_2000.nc']['interp_methods'], {'bilinear': 2})
+        self.assertEqual(files['sst_1999.nc']['multi_file'], {'prev_file_name': 1, 'next_file_name': 0})
+        self.assertEqual(files['chl.nc']['subregions'], {'inside_region': 1})
+
+    def test_report(self):
+        lines = list(format_report(get_file_stats(DATA_TABLE)))
+        self.assertEqual(lines[:4], ["data_table entries: 4 (1 without a file)",
+                                     "files opened: 4",
+                                     "interp_methods: bilinear: 2, none: 1",
+                                     "subregions: inside_region: 1"])
+        self.assertIn("sst_2000.nc: 2 fields", lines)
+        self.assertIn("  ICE: sic", lines)
+        self.assertIn("  next_file_name of 1 fields", lines)
+
+    def test_bad_data_table(self):
+        """Test that a data_table that is missing or does not parse is an error message, not a traceback"""
+        with tempfile.TemporaryDirectory() as testdir:
+            bad_yaml = os.path.join(testdir, "data_table.yaml")
+            with open(bad_yaml, "w") as fh:
+                fh.write("data_table: [\n")
+            for cli in (data_table_report, data_table_preflight):
+                for data_table in (os.path.join(testdir, "data_table"), bad_yaml):
+                    result = CliRunner().invoke(cli, [data_table])
+                    self.assertEqual(result.exit_code, 1)
+                    self.assertIsInstance(result.exception, SystemExit)
+                    self.assertNotIn("Traceback", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+import unittest
+import tempfile
+import os
+import pathlib
+import yaml
+from contextlib import contextmanager
+
+from fms_yaml_tools.diag_table.diag_table_to_yaml import diag_table_to_dict
+from fms_yaml_tools.diag_table.diag_table_template import DiagTableTemplate, write_members
+
+DIAG_TABLE_TEMPLATE = ('"Very_Important_Title"\n'
+                       '$baseDate\n'
+                       '"${prefix}atmos_daily", 24, "hours", 1, "days", "time"\n'
+                       '"dynamics", "tdata", "tdata", "${prefix}atmos_daily", "all", .true., "none", 2\n')
+
+
+@contextmanager
+def test_directory(tmp_path: pathlib.Path):
+    """Set the cwd to the path
+
+    Args:
+        tmp_path (Path): The path to use
+
+    Yields:
+        None
+    """
+    origin = pathlib.Path().absolute()
+    try:
+        os.chdir(tmp_path)
+        yield
+    finally:
+        os.chdir(origin)
+
+
+class TestDiagTableTemplate(unittest.TestCase):
+    def test_write_members(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with open('diag_table', 'w') as fh:
+                    fh.write(DIAG_TABLE_TEMPLATE)
+                with open('members.csv', 'w') as fh:
+                    fh.write("prefix,baseDate,title,${prefix}atmos_daily:freq\n"
+                             "ens01_,1979 1 1 0 0 0,member1,6 hours\n"
+                             "ens02_,1980 1 1 0 0 0,member2,12 hours\n")
+                yaml_doc = diag_table_to_dict('diag_table')
+                output_names = write_members(yaml_doc, 'members.csv', 'diag_table_$member.yaml')
+                self.assertEqual(output_names, ['diag_table_1.yaml', 'diag_table_2.yaml'])
+                with open('diag_table_2.yaml') as fh:
+                    member2 = yaml.safe_load(fh)
+
+        self.assertEqual(member2['title'], 'member2')
+        self.assertEqual(member2['base_date'], '1980 1 1 0 0 0')
+        self.assertEqual(member2['diag_files'][0]['file_name'], 'ens02_atmos_daily')
+        self.assertEqual(member2['diag_files'][0]['freq'], '12 hours')
+        self.assertEqual(member2['diag_files'][0]['varlist'][0]['var_name'], 'tdata')
+
+        #: The template is not changed by the members
+        self.assertEqual(yaml_doc['base_date'], '$baseDate')
+        self.assertEqual(yaml_doc['diag_files'][0]['file_name'], '${prefix}atmos_daily')
+        self.assertEqual(yaml_doc['diag_files'][0]['freq'], '24 hours')
+
+    def test_same_output_name(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with open('members.yaml', 'w') as fh:
+                    yaml.dump([{'prefix': 'ens01_'}, {'prefix': 'ens02_'}], fh)
+                with self.assertRaises(ValueError) as context:
+                    write_members({'diag_files': []}, 'members.yaml', 'diag_table.yaml')
+        self.assertIn("would write to the same output yaml", str(context.exception))
+
+    def test_unknown_file(self):
+        template = DiagTableTemplate({'title': 'a', 'base_date': '1 1 1 0 0 0',
+                                      'diag_files': [{'file_name': 'atmos_daily', 'freq': '1 days'}]})
+        with self.assertRaises(ValueError) as context:
+            template.dump({'atmos_month:freq': '6 hours'}, 1)
+        self.assertIn("atmos_month is not a file in the diag_table", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import unittest
+import tempfile
+import os
+import pathlib
+import yaml
+from contextlib import contextmanager
+from unittest import mock
+
+from fms_yaml_tools import chunks
+from fms_yaml_tools.diag_table.diag_table_to_yaml import (DiagTable, combine_diag_tables, diag_table_to_libdiagtable,
+                                                          diag_table_to_dict)
+from fms_yaml_tools.diag_table.combine_diag_table_yamls import combine_yaml
+
+DIAG_TABLE_HEADER = ('"Very_Important_Title"\n'
+                     '1 1 1 0 0 0\n')
+
+
+@contextmanager
+def test_directory(tmp_path: pathlib.Path):
+    """Set the cwd to the path
+
+    Args:
+        tmp_path (Path): The path to use
+
+    Yields:
+        None
+    """
+    origin = pathlib.Path().absolute()
+    try:
+        os.chdir(tmp_path)
+        yield
+    finally:
+        os.chdir(origin)
+
+
+def convert_diag_table(content, is_segment=False):
+    """Write `content` to a diag_table, convert it and return the parsed output yaml"""
+    with open('diag_table', 'w') as fh:
+        fh.write(content)
+    diag_table = DiagTable(diag_table_file='diag_table', is_segment=is_segment)
+    diag_table.read_and_parse_diag_table()
+    diag_table.construct_yaml(yaml_table_file='diag_table.yaml')
+    with open('diag_table.yaml') as fh:
+        return yaml.safe_load(fh)
+
+
+def stream_diag_table(content, is_segment=False):
+    """Write `content` to a diag_table, convert it with --stream and return the output yaml as text"""
+    with open('diag_table', 'w') as fh:
+        fh.write(content)
+    diag_table = DiagTable(diag_table_file='diag_table', is_segment=is_segment)
+    diag_table.stream_yaml(yaml_table_file='diag_table_stream.yaml')
+    with open('diag_table_stream.yaml') as fh:
+        return fh.read()
+
+
+class TestDiagTableToYaml(unittest.TestCase):
+    def test_fields_grouped_by_file(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(
+                    DIAG_TABLE_HEADER +
+                    '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                    '"atmos_month", 1, "months", 1, "days", "time"\n'
+                    '"dynamics", "ps", "ps", "atmos_month", "all", .true., "none", 2\n'
+                    '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n'
+                    '"dynamics", "udata", "udata", "atmos_month", "all", "max", "none", 1\n')
+
+        self.assertEqual(out['title'], "Very_Important_Title")
+        self.assertEqual(out['base_date'], "1 1 1 0 0 0")
+        self.assertEqual([f['file_name'] for f in out['diag_files']], ["atmos_daily", "atmos_month"])
+        self.assertEqual(out['diag_files'][0]['varlist'],
+                         [{'module': 'dynamics', 'var_name': 'tdata', 'reduction': 'average', 'kind': 'r4'}])
+        self.assertEqual(out['diag_files'][1]['varlist'],
+                         [{'module': 'dynamics', 'var_name': 'ps', 'reduction': 'average', 'kind': 'r4'},
+                          {'module': 'dynamics', 'var_name': 'udata', 'output_name': 'udata_max',
+                           'reduction': 'max', 'kind': 'r8'}])
+
+    def test_duplicate_file(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(
+                    DIAG_TABLE_HEADER +
+                    '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                    '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                    '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n')
+        self.assertEqual(len(out['diag_files']), 1)
+
+    def test_duplicate_file_different_keys(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                        '"atmos_daily", 6, "hours", 1, "days", "time"\n')
+        self.assertIn("defines atmos_daily more than once", str(context.exception))
+
+    def test_field_without_file(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                        '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n'
+                        '"dynamics", "udata", "udata", "atmos_month", "all", .true., "none", 2\n')
+        self.assertIn("The variable udata is expected to be in the file atmos_month", str(context.exception))
+
+    def test_sub_region(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(
+                    DIAG_TABLE_HEADER +
+                    '"atmos_reg", 24, "hours", 1, "days", "time"\n'
+                    '"atmos_zonly", 24, "hours", 1, "days", "time"\n'
+                    '"dynamics", "tdata", "tdata", "atmos_reg", "all", .true., "0 10 20 30 -1 -1", 2\n'
+                    '"dynamics", "udata", "udata", "atmos_reg", "all", .true., "0 10 20 30 -1 -1", 2\n'
+                    '"dynamics", "tdata", "tdata", "atmos_zonly", "all", .true., "-1 -1 -1 -1 1 5", 2\n')
+        reg, zonly = out['diag_files']
+        self.assertEqual(reg['sub_region'],
+                         [{'grid_type': 'latlon', 'corner1': '0 20', 'corner2': '0 20',
+                           'corner3': '10 30', 'corner4': '10 30'}])
+        self.assertNotIn('sub_region', zonly)
+        self.assertEqual(zonly['varlist'][0]['zbounds'], '1 5')
+
+    def test_to_libdiagtable(self):
+        content = (DIAG_TABLE_HEADER +
+                   '"atmos_reg", 1, "days", 1, "days", "time", 1, "months", "2000 1 1 0 0 0", 5, "years"\n'
+                   '"dynamics", "tdata", "tdata", "atmos_reg", "all", .true., "0 10 20 30 -1 -1", 2\n')
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(content)
+                diag_table = diag_table_to_libdiagtable('diag_table')
+        self.assertEqual(diag_table.render(), out)
+        self.assertEqual(diag_table.diag_files[0].start_time, "2000 1 1 0 0 0")
+        self.assertEqual(diag_table.diag_files[0].sub_region.corner3, "10 30")
+
+    def test_conflicting_sub_regions(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_reg", 24, "hours", 1, "days", "time"\n'
+                        '"dynamics", "tdata", "tdata", "atmos_reg", "all", .true., "0 10 20 30 -1 -1", 2\n'
+                        '"dynamics", "udata", "udata", "atmos_reg", "all", .true., "0 10 20 40 -1 -1", 2\n')
+        self.assertIn("atmos_reg has multiple sub_regions defined", str(context.exception))
+
+    def test_bad_kind(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                        '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 7\n')
+        self.assertIn("ERROR with line # 4", str(context.exception))
+        self.assertIn("Ensure that kind is either 1 or 2", str(context.exception))
+
+    def test_bad_file_line(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_daily", 24, "hours", 1, "days", "time", "1", "days", "x", "five", "years"\n')
+        self.assertIn("ERROR with line # 3", str(context.exception))
+        self.assertIn("Ensure that the line defines a file", str(context.exception))
+
+    def test_short_file_lines(self):
+        # file_name, output_freq and output_freq_units are enough to define a file
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(
+                    DIAG_TABLE_HEADER +
+                    '"atmos_daily", 24, "hours"\n'
+                    '"atmos_month", 1, "months", 1, "days"\n'
+                    '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n'
+                    '"dynamics", "udata", "udata", "atmos_month", "all", .true., "none", 2\n')
+                self.assertEqual([{k: v for k, v in f.items() if k != 'varlist'} for f in out['diag_files']],
+                                 [{'file_name': 'atmos_daily', 'freq': '24 hours'},
+                                  {'file_name': 'atmos_month', 'time_units': 'days', 'freq': '1 months'}])
+
+                with self.assertRaises(Exception) as context:
+                    convert_diag_table(DIAG_TABLE_HEADER + '"atmos_daily", 24\n')
+        self.assertIn("ERROR with line # 3", str(context.exception))
+        self.assertIn("Ensure that the line defines a field", str(context.exception))
+
+    def test_segment(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = convert_diag_table(
+                    '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                    '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n',
+                    is_segment=True)
+        self.assertNotIn('title', out)
+        self.assertNotIn('base_date', out)
+        self.assertEqual(out['diag_files'][0]['file_name'], "atmos_daily")
+
+    def test_stream_same_as_batch(self):
+        content = (DIAG_TABLE_HEADER +
+                   '"atmos_empty", 24, "hours", 1, "days", "time"\n'
+                   '"atmos_reg", 24, "hours", 1, "days", "time"\n'
+                   '"dynamics", "tdata", "tdata", "atmos_reg", "all", .true., "0 10 20 30 -1 -1", 2\n'
+                   '"dynamics", "udata", "udata", "atmos_reg", "all", "max", "0 10 20 30 -1 -1", 1\n'
+                   '"atmos_static", -1, "hours", 1, "days", "time"\n'
+                   '"atmos_reg", 24, "hours", 1, "days", "time"\n'
+                   '"dynamics", "zsurf", "zsurf", "atmos_static", "all", .false., "none", 2\n')
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                out = stream_diag_table(content)
+                convert_diag_table(content)
+                with open('diag_table.yaml') as fh:
+                    self.assertEqual(out, fh.read())
+
+    def test_stream_ungrouped_fields(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with self.assertRaises(Exception) as context:
+                    stream_diag_table(
+                        DIAG_TABLE_HEADER +
+                        '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                        '"atmos_month", 1, "months", 1, "days", "time"\n'
+                        '"dynamics", "tdata", "tdata", "atmos_month", "all", .true., "none", 2\n'
+                        '"dynamics", "udata", "udata", "atmos_daily", "all", .true., "none", 2\n')
+                self.assertFalse(os.path.exists('diag_table_stream.yaml'))
+        self.assertIn("Convert the table without --stream", str(context.exception))
+
+    def test_combine_segments(self):
+        tables = [DIAG_TABLE_HEADER +
+                  '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                  '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n',
+                  '"atmos_daily", 24, "hours", 1, "days", "time"\n'
+                  '"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 2\n'
+                  '"dynamics", "udata", "udata", "atmos_daily", "all", .true., "none", 2\n',
+                  '"ocean_daily", 24, "hours", 1, "days", "time"\n'
+                  '"ocean_mod", "sst", "sst", "ocean_daily", "all", .true., "none", 2\n']
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                names = []
+                for i, content in enumerate(tables):
+                    names.append('diag_table' + str(i))
+                    with open(names[-1], 'w') as fh:
+                        fh.write(content)
+                    diag_table = DiagTable(diag_table_file=names[-1], is_segment=i > 0)
+                    diag_table.read_and_parse_diag_table()
+                    diag_table.construct_yaml(yaml_table_file=names[-1] + '.yaml')
+
+                expected = combine_yaml([name + '.yaml' for name in names], print)
+                self.assertEqual(combine_diag_tables(names, jobs=1), expected)
+                self.assertEqual(combine_diag_tables(names, jobs=2), expected)
+
+        self.assertEqual([f['file_name'] for f in expected['diag_files']], ["atmos_daily", "ocean_daily"])
+        self.assertEqual(len(expected['diag_files'][0]['varlist']), 2)
+
+    def test_combine_segments_error(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir):
+                with open('diag_table', 'w') as fh:
+                    fh.write('"atmos_daily", 24, "hours", 1, "days", "time"\n')
+                with open('bad_segment', 'w') as fh:
+                    fh.write('"dynamics", "tdata", "tdata", "atmos_daily", "all", .true., "none", 7\n')
+                with self.assertRaises(Exception) as context:
+                    combine_diag_tables(['diag_table', 'bad_segment'], is_segment=True, jobs=2)
+        self.assertIn("ERROR converting the diag_table bad_segment", str(context.exception))
+
+    def test_jobs_same_as_serial(self):
+        content = (DIAG_TABLE_HEADER +
+                   '"atmos_reg", 24, "hours", 1, "days", "time"\n'
+                   '"atmos_daily", 24, "hours", 1, "days", "time"\n' +
+                   '"dynamics", "tdata", "tdata", "atmos_reg", "all", .true., "0 10 20 30 1 5", 2\n' * 3 +
+                   '# comment\n\n' +
+                   '"dynamics", "udata", "udata", "atmos_daily", "all", .true., "none", 2\n' * 5)
+        bad_line = '"dynamics", "vdata", "vdata", "atmos_reg", "all", .true., "0 10 20 40 -1 -1", 2\n'
+        with tempfile.TemporaryDirectory() as testdir:
+            with test_directory(testdir), mock.patch.object(chunks, 'MIN_CHUNK_LINES', 1):
+                with open('diag_table', 'w') as fh:
+                    fh.write(content)
+                self.assertEqual(diag_table_to_dict('diag_table', jobs=3), diag_table_to_dict('diag_table'))
+
+                #: The first error in the table is raised, after the lines before it
+                with open('diag_table', 'w') as fh:
+                    fh.write(content + bad_line + content.replace(", 2\n", ", 7\n"))
+                errors = []
+                for jobs in (1, 3):
+                    with self.assertRaises(Exception) as context:
+                        diag_table_to_dict('diag_table', jobs=jobs)
+                    errors.append(str(context.exception))
+        self.assertIn("atmos_reg has multiple sub_regions defined", errors[0])
+        self.assertEqual(errors[0], errors[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import yaml
+
+from fms_yaml_tools import chunks
+from fms_yaml_tools.field_table.field_table_to_yaml import (iter_field_entries, dont_convert_yaml_val,
+                                                            field_table_to_dict, write_field_table)
+
+EXAMPLE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), 'examples'))
+
+
+class TestFieldTable(unittest.TestCase):
+    def test_iter_field_entries(self):
+        """Test splitting an ascii field table into its entries"""
+        field_table = ['# specific humidity\n',
+                       ' "TRACER", "atmos_mod", "sphum" \n',
+                       '\t"longname", "specific # humidity" # comment, with "quotes"\n',
+                       '    "profile_type", "fixed", "surface_value=3.e-6, alpha=1" , \n',
+                       '\n',
+                       '/\n',
+                       '"TRACER", "land_mod", "co2"\n',
+                       '"units", "kg/kg" / # end of the entry\n',
+                       '"TRACER", "ocean_mod", "dic"/\n']
+        self.assertEqual(list(iter_field_entries(field_table)),
+                         [('TRACER,atmos_mod,sphum',
+                           ['longname,specific # humidity',
+                            'profile_type,fixed,surface_value=3.e-6,alpha=1']),
+                          ('TRACER,land_mod,co2', ['units,kg/kg']),
+                          ('TRACER,ocean_mod,dic', [])])
+
+    def test_iter_field_entries_slash_value(self):
+        """Test that a value ending in "/" keeps it when the entry ends with a "/" on the next line"""
+        field_table = ['"TRACER", "atmos_mod", "sphum"\n',
+                       '"src", "file", "name=INPUT/"\n',
+                       '/\n',
+                       '"TRACER", "ocean_mod", "dic"\n',
+                       '"src", "file", "name=INPUT/"\n',
+                       '\n',
+                       '/\n',
+                       '"TRACER", "land_mod", "co2"\n',
+                       '"src", "file", "name=INPUT/" /\n']
+        self.assertEqual(list(iter_field_entries(field_table)),
+                         [('TRACER,atmos_mod,sphum', ['src,file,name=INPUT/']),
+                          ('TRACER,ocean_mod,dic', ['src,file,name=INPUT']),
+                          ('TRACER,land_mod,co2', ['src,file,name=INPUT'])])
+
+        #: The slashes at the end of the file are all removed, but not when blank or comment lines follow them
+        #: (the conversion before the single pass scanner removed the value's slash in both cases)
+        end_of_file = ['"src", "file", "name=INPUT/"\n', '/\n']
+        self.assertEqual(list(iter_field_entries(field_table[:1] + end_of_file)),
+                         [('TRACER,atmos_mod,sphum', ['src,file,name=INPUT'])])
+        self.assertEqual(list(iter_field_entries(field_table[:1] + end_of_file + ['\n', '# comment\n'])),
+                         [('TRACER,atmos_mod,sphum', ['src,file,name=INPUT/'])])
+
+    def test_dont_convert_yaml_val(self):
+        """Test that the values are typed as yaml.safe_load does, except for yes/no/on/off"""
+        for inval in ["1", "-1", "0x1F", "1_000", "1:30", "1.0e-30", "1.e-32", "1e-6", ".5", "-.inf", "True",
+                      "FALSE", "OFF", "null", "~", "none", "", "2000-01-01", "kg/kg", "a b", "-", "---", "[1, 2]",
+                      "a: b", "=="]:
+            expected = yaml.safe_load(inval)
+            val = dont_convert_yaml_val(inval)
+            self.assertEqual((type(val), val), (type(expected), expected), inval)
+
+        for inval in ["yes", "Yes", "no", "No", "on", "On", "off", "Off"]:
+            self.assertEqual(dont_convert_yaml_val(inval), inval)
+
+        #: The lists are not shared between calls
+        self.assertIsNot(dont_convert_yaml_val("[1, 2]"), dont_convert_yaml_val("[1, 2]"))
+        #: Neither are the dates, yaml.dump would write them as aliases
+        self.assertIsNot(dont_convert_yaml_val("2000-01-01"), dont_convert_yaml_val("2000-01-01"))
+
+    def test_repeated_date(self):
+        """Test that a date used by many fields is dumped as a plain value each time"""
+        field_table = '"TRACER", "atmos_mod", "sphum"\n"d1", "2000-01-01"\n"d2", "2000-01-01" /\n'
+        with tempfile.TemporaryDirectory() as testdir:
+            field_table_name = os.path.join(testdir, "field_table")
+            with open(field_table_name, "w") as fh:
+                fh.write(field_table)
+            out = yaml.dump(field_table_to_dict(field_table_name), default_flow_style=False, sort_keys=False)
+        self.assertNotIn("&id", out)
+        self.assertEqual(out.count("2000-01-01"), 2)
+
+    def test_field_table_to_dict(self):
+        """Test that the fields are grouped by field_type and model_type in plain dictionaries"""
+        field_table = ('"TRACER", "atmos_mod", "sphum"\n"units", "kg/kg" /\n'
+                       '"TRACER", "ocean_mod", "dic" /\n'
+                       '"TRACER", "atmos_mod", "o3"\n"profile_type", "fixed", "surface_value=1.e-9" /\n'
+                       '"TRACER", "atmos_mod", "SPHUM"\n"units", "g/kg" /\n')
+        with tempfile.TemporaryDirectory() as testdir:
+            field_table_name = os.path.join(testdir, "field_table")
+            with open(field_table_name, "w") as fh:
+                fh.write(field_table)
+            out = field_table_to_dict(field_table_name)
+
+        #: The duplicated sphum keeps its position and gets the attributes of the last entry
+        self.assertEqual(out, {'field_table': [
+            {'field_type': 'tracer', 'modlist': [
+                {'model_type': 'atmos_mod', 'varlist': [
+                    {'variable': 'sphum', 'units': 'g/kg'},
+                    {'variable': 'o3', 'profile_type': [{'value': 'fixed', 'surface_value': 1.e-9}]}]},
+                {'model_type': 'ocean_mod', 'varlist': [{'variable': 'dic'}]}]}]})
+        #: Plain dictionaries, so the output can be dumped with yaml.safe_dump
+        self.assertEqual(yaml.safe_load(yaml.safe_dump(out, sort_keys=False)), out)
+
+    def test_write_field_table(self):
+        """Test that the field_table is written in the same format as yaml.dump of the whole table"""
+        field_table = field_table_to_dict(os.path.join(EXAMPLE_DIR, 'field_table'))["field_table"]
+        for table in (field_table, []):
+            myfile = io.StringIO()
+            write_field_table(table, myfile)
+            self.assertEqual(myfile.getvalue(), yaml.dump({"field_table": table}, default_flow_style=False,
+                                                          sort_keys=False))
+
+    def test_field_table_jobs(self):
+        """Test that making the fields in chunks gives the same field_table as the serial conversion"""
+        with mock.patch.object(chunks, 'MIN_CHUNK_LINES', 2):
+            self.assertEqual(field_table_to_dict(os.path.join(EXAMPLE_DIR, 'field_table'), jobs=3),
+                             field_table_to_dict(os.path.join(EXAMPLE_DIR, 'field_table')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import os
+import tempfile
+import unittest
+import yaml
+
+from fms_yaml_tools.field_table.field_table_stats import (load_field_table, get_tracer_stats, get_points_per_rank,
+                                                          format_stats)
+
+FIELD_TABLE = ('"TRACER", "atmos_mod", "sphum"\n"longname", "specific humidity"\n"units", "kg/kg" /\n'
+               '"TRACER", "atmos_mod", "dust1"\n"sedimentation", "on"\n"diff_horiz", "none" /\n'
+               '"TRACER", "ocean_mod", "dic"\n"diff_vert", "kpp", "coeff=1.e-5"\n"convection", "all" /\n'
+               '"namelists", "ocean_mod", "ocean_mixing"\n"diff_type=laplacian" /\n')
+
+
+class TestFieldTableStats(unittest.TestCase):
+    def test_tracer_stats(self):
+        with tempfile.TemporaryDirectory() as testdir:
+            field_table = os.path.join(testdir, "field_table")
+            with open(field_table, "w") as fh:
+                fh.write(FIELD_TABLE)
+            stats = get_tracer_stats(load_field_table(field_table))
+
+            #: The yaml gives the same stats as the ascii table
+            with open(field_table + ".yaml", "w") as fh:
+                yaml.dump(load_field_table(field_table), fh)
+            self.assertEqual(get_tracer_stats(load_field_table(field_table + ".yaml")), stats)
+
+        #: Only the tracers are counted, and methods that are turned off do not need work arrays
+        self.assertEqual(stats, {'atmos_mod': {'tracers': ['sphum', 'dust1'],
+                                               'work_arrays': {'dust1': ['sedimentation']}},
+                                 'ocean_mod': {'tracers': ['dic'], 'work_arrays': {'dic': ['diff_vert']}}})
+
+    def test_memory_estimate(self):
+        points = get_points_per_rank((360, 180, 10), (7, 4), halo=2)
+        self.assertEqual(points, (52 + 4) * (45 + 4) * 10)
+
+        stats = {'atmos_mod': {'tracers': ['sphum', 'dust1'], 'work_arrays': {'dust1': ['sedimentation']}}}
+        lines = list(format_stats(stats, points=1024 * 1024, bytes_per_value=4, time_levels=3))
+        self.assertEqual(lines[0], "atmos_mod: 2 tracers")
+        self.assertIn("= 24.00 MiB per rank", lines[1])
+        self.assertIn("= 4.00 MiB per rank", lines[2])
+        self.assertEqual(lines[3], "  total:       28.00 MiB per rank")
+        self.assertEqual(lines[-1], "    dust1: sedimentation")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import datetime
+import unittest
+
+from fms_yaml_tools.fingerprint import Fingerprints
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_equal_objects(self):
+        fingerprints = Fingerprints()
+        equal = [
+            ({"a": 1, "b": [1, 2, {"c": "d"}]}, {"b": [1, 2, {"c": "d"}], "a": 1}),
+            ({"factor": 1}, {"factor": 1.0}),
+            ({"factor": True}, {"factor": 1}),
+            ([None, datetime.date(2000, 1, 1)], [None, datetime.date(2000, 1, 1)]),
+        ]
+        for obj1, obj2 in equal:
+            self.assertEqual(obj1, obj2)
+            self.assertEqual(fingerprints.get(obj1), fingerprints.get(obj2))
+            self.assertTrue(fingerprints.same(obj1, obj2))
+
+    def test_different_objects(self):
+        fingerprints = Fingerprints()
+        different = [
+            ({"a": 1, "b": 2}, {"a": 2, "b": 1}),
+            ([1, 2], [2, 1]),
+            ({"a": "1"}, {"a": 1}),
+            ({"a": None}, {"a": "None"}),
+            ({"a": [1]}, {"a": [[1]]}),
+            ({"factor": 1.5}, {"factor": 1}),
+        ]
+        for obj1, obj2 in different:
+            self.assertNotEqual(fingerprints.get(obj1), fingerprints.get(obj2))
+            self.assertFalse(fingerprints.same(obj1, obj2))
+
+    def test_forget(self):
+        fingerprints = Fingerprints()
+        varlist = [{"var_name": "a"}]
+        entry = {"file_name": "atmos_daily", "varlist": varlist}
+        fingerprint = fingerprints.get(entry)
+
+        # The fingerprints are cached, so they are out of date until the modified objects are forgotten
+        varlist.append({"var_name": "b"})
+        self.assertEqual(fingerprints.get(entry), fingerprint)
+        fingerprints.forget(entry, varlist)
+        self.assertNotEqual(fingerprints.get(entry), fingerprint)
+        self.assertEqual(fingerprints.get(entry), Fingerprints().get(entry))
+
+    def test_append(self):
+        fingerprints = Fingerprints()
+        varlist = [{"var_name": "a"}]
+        entry = {"file_name": "atmos_daily", "varlist": varlist}
+        fingerprints.get(entry)
+
+        fingerprints.append(varlist, {"var_name": "b", "attributes": {"units": "K"}})
+        fingerprints.forget(entry)
+        self.assertEqual(fingerprints.get(varlist), Fingerprints().get(varlist))
+        self.assertEqual(fingerprints.get(entry), Fingerprints().get(entry))
+        self.assertEqual(len(varlist), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
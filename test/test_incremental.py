@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import yaml
+from click.testing import CliRunner
+
+from fms_yaml_tools import incremental
+from fms_yaml_tools.incremental import Manifest, MANIFEST_SUFFIX, dump_table, load_table
+from fms_yaml_tools.data_table.combine_data_table_yamls import combine_data_table_yaml
+from fms_yaml_tools.diag_table.combine_diag_table_yamls import combine_diag_table_yaml
+from fms_yaml_tools.field_table.combine_field_table_yamls import combine_field_table_yaml
+
+
+def diag_table(i):
+    table = {"diag_files": [{"file_name": "file" + str(i), "freq": "1 days", "time_units": "hours",
+                             "unlimdim": "time",
+                             "varlist": [{"module": "atmos", "var_name": "var" + str(j), "reduction": "average",
+                                          "kind": "r4"} for j in range(3)]}]}
+    if i == 0:
+        table.update({"title": "test", "base_date": "2 1 1 0 0 0"})
+    return table
+
+
+def data_table(i):
+    return {"data_table": [{"grid_name": "OCN", "fieldname_in_model": "field" + str(i), "factor": 1.0}]}
+
+
+def field_table(i):
+    return {"field_table": [{"field_type": "tracer",
+                             "modlist": [{"model_type": "atmos_mod",
+                                          "varlist": [{"variable": "tracer" + str(i), "longname": "tracer"}]}]}]}
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_yaml = os.path.join(self.tmpdir.name, "combined.yaml")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_inputs(self, get_table, count=4):
+        files = []
+        for i in range(count):
+            files.append(os.path.join(self.tmpdir.name, "table" + str(i) + ".yaml"))
+            with open(files[-1], "w") as fh:
+                yaml.dump(get_table(i), fh)
+        return files
+
+    def combine(self, cli, files, *args):
+        """ Run the combine cli and return the output yaml and the files that were parsed """
+        with mock.patch.object(incremental, "read_hashed_yaml", wraps=incremental.read_hashed_yaml) as read_yaml:
+            result = CliRunner().invoke(cli, files + ["--output-yaml", self.output_yaml, "--jobs", "1"] + list(args))
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        with open(self.output_yaml) as fh:
+            return fh.read(), [call.args[0] for call in read_yaml.call_args_list]
+
+    def check_incremental(self, cli, get_table):
+        files = self.write_inputs(get_table)
+        combined, parsed = self.combine(cli, files, "--incremental")
+        self.assertEqual(parsed, files)
+        self.assertTrue(os.path.exists(self.output_yaml + MANIFEST_SUFFIX))
+
+        # Nothing changed, the output is reused without parsing the inputs
+        self.assertEqual(self.combine(cli, files, "--incremental"), (combined, []))
+
+        # Only the input that changed is parsed, the output is the same as combining from scratch
+        table = get_table(1)
+        table[next(iter(table))].append(get_table(len(files))[next(iter(table))][0])
+        with open(files[1], "w") as fh:
+            yaml.dump(table, fh)
+        combined, parsed = self.combine(cli, files, "--incremental")
+        self.assertEqual(parsed, [files[1]])
+        self.assertEqual(combined, self.combine(cli, files, "--force-write")[0])
+
+        # The order of the inputs matters, but they don't need to be parsed again
+        files.reverse()
+        combined, parsed = self.combine(cli, files, "--incremental")
+        self.assertEqual(parsed, [])
+        self.assertEqual(combined, self.combine(cli, files, "--force-write")[0])
+
+    def test_diag_table(self):
+        self.check_incremental(combine_diag_table_yaml, diag_table)
+
+    def test_data_table(self):
+        self.check_incremental(combine_data_table_yaml, data_table)
+
+    def test_field_table(self):
+        self.check_incremental(combine_field_table_yaml, field_table)
+
+    def test_modified_output(self):
+        files = self.write_inputs(data_table)
+        combined, _ = self.combine(combine_data_table_yaml, files, "--incremental")
+
+        # The output is combined again if it was modified
+        with open(self.output_yaml, "a") as fh:
+            fh.write("# modified\n")
+        self.assertFalse(Manifest(self.output_yaml, "data_table", files).is_up_to_date())
+        result = CliRunner().invoke(combine_data_table_yaml,
+                                    files + ["--output-yaml", self.output_yaml, "--incremental"])
+        # It is not overwritten without --force-write, as it is not the output of the last combine anymore
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(self.combine(combine_data_table_yaml, files, "--incremental", "--force-write"),
+                         (combined, []))
+        self.assertTrue(Manifest(self.output_yaml, "data_table", files).is_up_to_date())
+
+    def test_bad_manifest(self):
+        files = self.write_inputs(field_table)
+        combined, _ = self.combine(combine_field_table_yaml, files, "--incremental")
+        with open(self.output_yaml + MANIFEST_SUFFIX, "wb") as fh:
+            fh.write(b"not a manifest")
+        # Without a manifest the output is not known to be the last combine
+        self.assertFalse(Manifest(self.output_yaml, "field_table", files).owns_output())
+        self.assertEqual(self.combine(combine_field_table_yaml, files, "--incremental", "--force-write"),
+                         (combined, files))
+
+        # A manifest is for one table only
+        self.assertFalse(Manifest(self.output_yaml, "data_table", files).is_up_to_date())
+        self.assertTrue(Manifest(self.output_yaml, "field_table", files).is_up_to_date())
+
+    def test_input_modified_while_parsed(self):
+        files = self.write_inputs(data_table)
+        read_hashed_yaml = incremental.read_hashed_yaml
+
+        def modify_and_read(file_name):
+            # The input is modified after its sha256 is taken for the manifest, but before it is parsed
+            if file_name == files[1]:
+                with open(file_name, "w") as fh:
+                    yaml.dump(data_table(len(files)), fh)
+            return read_hashed_yaml(file_name)
+
+        with mock.patch.object(incremental, "read_hashed_yaml", side_effect=modify_and_read):
+            combined, _ = self.combine(combine_data_table_yaml, files, "--incremental")
+        self.assertIn("field" + str(len(files)), combined)
+        # The manifest has the sha256 of what was parsed, so the output is still up to date
+        self.assertEqual(self.combine(combine_data_table_yaml, files, "--incremental"), (combined, []))
+
+    def test_dump_table(self):
+        table = yaml.safe_load("""
+            shared: &shared {units: K}
+            alias: *shared
+            recursive: &recursive [*recursive]
+            date: 2000-01-01
+            datetime: 2001-12-14t21:59:43.10-05:00
+            set: !!set {a, b}
+            binary: !!binary aGVsbG8=
+            pairs: !!pairs [{a: 1}, {a: 2}]
+            1: not a string key
+            nan: .nan
+            plain: [1, 2.5, on, ~, "!fms_yaml_tools"]
+        """)
+        table[incremental.TAG] = "a key like the tag"
+        text = dump_table(table)
+        self.assertIsInstance(json.loads(text), dict)
+        loaded = load_table(text)
+        # Same values, types and aliases
+        self.assertEqual(yaml.dump(loaded), yaml.dump(table))
+        self.assertIs(loaded["shared"], loaded["alias"])
+        self.assertIsNot(load_table(text)["shared"], loaded["shared"])
+
+        plain = {"data_table": [{"fieldname_in_model": "sst", "factor": 1.e-30, "lon_start": None}]}
+        self.assertEqual(json.loads(dump_table(plain)), plain)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import os
+import tempfile
+import unittest
+import yaml
+
+from fms_yaml_tools import load_yamls
+from fms_yaml_tools.load_yamls import iter_yaml_loaders
+
+
+class TestLoadYamls(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i in range(7):
+            file_name = os.path.join(self.tmpdir.name, "table" + str(i) + ".yaml")
+            with open(file_name, "w") as fh:
+                yaml.dump({"table": i, "entries": [{"name": "var" + str(j)} for j in range(i)]}, fh)
+            self.files.append(file_name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_order(self):
+        expected = [load_yamls.read_yaml(file_name) for file_name in self.files]
+        for jobs in (1, 2, None):
+            loaded = [(file_name, load()) for file_name, load in iter_yaml_loaders(self.files, jobs)]
+            self.assertEqual(loaded, list(zip(self.files, expected)))
+
+    def test_read_ahead(self):
+        # Fewer files are parsed ahead than there are files
+        self.assertLess(2 * load_yamls.READ_AHEAD, len(self.files))
+        loaded = [load()["table"] for _, load in iter_yaml_loaders(self.files, 2)]
+        self.assertEqual(loaded, list(range(len(self.files))))
+
+    def test_errors(self):
+        with open(self.files[3], "w") as fh:
+            fh.write('title: "this is not going to work')
+        files = self.files + [os.path.join(self.tmpdir.name, "missing.yaml")]
+        for jobs in (1, 2):
+            loaded = []
+            with self.assertRaises(yaml.YAMLError):
+                for _, load in iter_yaml_loaders(files, jobs):
+                    loaded.append(load()["table"])
+            # The error is raised when its file is loaded, after the files before it
+            self.assertEqual(loaded, [0, 1, 2])
+
+            loaders = list(iter_yaml_loaders(files, jobs))
+            with self.assertRaises(FileNotFoundError):
+                loaders[-1][1]()
+
+
+if __name__ == '__main__':
+    unittest.main()
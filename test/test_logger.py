@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from fms_yaml_tools.logger import get_verboseprint, LazyYaml
+
+
+class TestLogger(unittest.TestCase):
+    def test_debug_off_does_not_dump(self):
+        verboseprint = get_verboseprint(False)
+        with mock.patch("yaml.dump") as dump, redirect_stdout(io.StringIO()) as out:
+            verboseprint("---> Working on the entry:")
+            verboseprint(LazyYaml({'grid_name': 'OCN'}))
+        dump.assert_not_called()
+        self.assertEqual(out.getvalue(), "")
+
+    def test_debug_on_prints(self):
+        verboseprint = get_verboseprint(True)
+        with redirect_stdout(io.StringIO()) as out:
+            verboseprint("---> Working on the entry:")
+            verboseprint(LazyYaml({'grid_name': 'OCN', 'factor': 1.0}, sort_keys=False))
+        self.assertEqual(out.getvalue(), "---> Working on the entry:\ngrid_name: OCN\nfactor: 1.0\n\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# ***********************************************************************
+# *                   GNU Lesser General Public License
+# *
+# * This file is part of the GFDL Flexible Modeling System (FMS) YAML
+# * tools.
+# *
+# * FMS_yaml_tools is free software: you can redistribute it and/or
+# * modify it under the terms of the GNU Lesser General Public License
+# * as published by the Free Software Foundation, either version 3 of the
+# * License, or (at your option) any later version.
+# *
+# * FMS_yaml_tools is distributed in the hope that it will be useful, but
+# * WITHOUT ANY WARRANTY; without even the implied warranty of
+# * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# * General Public License for more details.
+# *
+# * You should have received a copy of the GNU Lesser General Public
+# * License along with FMS.  If not, see <http://www.gnu.org/licenses/>.
+# ***********************************************************************
+
+import unittest
+
+from fms_yaml_tools.data_table.subregion_index import check_subregions, CoverTree
+
+
+def entry(lon_start, lon_end, lat_start, lat_end, region_type="inside_region", fieldname="sst", grid_name="OCN"):
+    return {'grid_name': grid_name, 'fieldname_in_model': fieldname, 'factor': 1.0,
+            'subregion': [{'lon_start': lon_start, 'lon_end': lon_end, 'lat_start': lat_start, 'lat_end': lat_end,
+                           'type': region_type}]}
+
+
+class TestSubregionIndex(unittest.TestCase):
+    def test_tiles(self):
+        """Boxes that tile an area, or that are for other fields or grids, are fine"""
+        entries = [entry(lon, lon + 10, lat, lat + 10) for lon in range(0, 40, 10) for lat in range(-20, 20, 10)]
+        entries += [entry(0, 50, 0, 50, grid_name="ICE"), entry(0, 50, 0, 50, fieldname="sic")]
+        self.assertEqual(check_subregions(entries), [])
+
+    def test_overlaps_and_gaps(self):
+        entries = [entry(0, 10, 0, 10), entry(5, 20, 0, 10), entry(0, 20, 12, 20),
+                   entry(30, 40, 0, 10, grid_name="ICE")]
+        self.assertEqual(check_subregions(entries),
+                         ["sst (OCN): entry 1 (lon [0, 10], lat [0, 10]) overlaps entry 2 (lon [5, 20], lat [0, 10])",
+                          "sst (OCN): gap at lon [0, 20], lat [10, 12]"])
+
+    def test_outside_region(self):
+        """The inside_region boxes should fill the box of the outside_region"""
+        self.assertEqual(check_subregions([entry(0, 10, 0, 10, "outside_region"), entry(0, 10, 0, 10)]), [])
+        self.assertEqual(check_subregions([entry(0, 10, 0, 10, "outside_region"), entry(0, 10, 0, 5)]),
+                         ["sst (OCN): gap at lon [0, 10], lat [5, 10]"])
+        self.assertEqual(check_subregions([entry(0, 10, 0, 10, "outside_region"), entry(5, 15, 0, 10),
+                                           entry(0, 5, 0, 10)]),
+                         ["sst (OCN): entry 2 (lon [5, 15], lat [0, 10]) is not inside entry 1 "
+                          "(lon [0, 10], lat [0, 10]), so they overlap"])
+
+    def test_whole_grid(self):
+        whole = {'grid_name': 'OCN', 'fieldname_in_model': 'sst', 'factor': 1.0}
+        self.assertEqual(check_subregions([entry(0, 10, 0, 10), whole]),
+                         ["sst (OCN): entry 2 does not have a subregion, so it overlaps entry 1"])
+
+    def test_cover_tree(self):
+        tree = CoverTree(5)
+        tree.add(0, 3, 1)
+        tree.add(2, 5, 1)
+        self.assertEqual(tree.find(0, 5), (1, 0))
+        self.assertEqual(tree.find(0, 5, lowest=False), (2, 2))
+        tree.add(0, 2, -1)
+        self.assertEqual(tree.find(1, 5), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()